@@ -2,33 +2,91 @@
 # Adventure Game con Sistema de Memoria Perfecta, MCP, Vector Search y Web Interface v2.0.0
 import asyncio
 import json
-import aiohttp
+import time
 import logging
-from typing import Dict, Any, Optional, List
-from memory_system import PerfectMemorySystem
+from typing import Awaitable, Callable, Dict, Any, Optional, List, Tuple
+from memory_system import GameObject, PerfectMemorySystem
 from mcp_integration import MCPContextProvider
 from enhanced_mcp import EnhancedMCPProvider
 from vector_search import VectorSearchEngine
+from context_budget import (
+    ContextAssembler, PRIORITY_CAPABILITIES, PRIORITY_REQUIRED, context_budget_for_model
+)
+from llm_client import (
+    DEFAULT_OLLAMA_HOST, LLMError, LLMHTTPError, TokenCallback, get_llm_client
+)
+from llm_scheduler import PRIORITY_AMBIENT, PRIORITY_INTERACTIVE, LLMQueueFull
+from game_mechanics import (
+    ACTION_DROP, ACTION_INVENTORY, ACTION_MOVE, ACTION_TAKE, DROP_VERBS, TAKE_VERBS,
+    MechanicalCommand, find_direction, matches_object_name, parse_mechanical_command,
+    resolve_object, words_after_verb
+)
+
+# listener(player_id, command, narration) para narraciones entregadas en segundo plano
+NarrationListener = Callable[[str, str, str], Awaitable[None]]
+
+
+# Bloques fijos del prompt del narrador (ver ContextAssembler)
+NARRATOR_RULES = """Eres el narrador de un juego de aventura con MEMORIA PERFECTA y BÚSQUEDA SEMÁNTICA AVANZADA.
+
+REGLAS IMPORTANTES:
+1. Usa SOLO la información del contexto del mundo proporcionado
+2. Todos los objetos mencionados EXISTEN realmente en el juego
+3. Las ubicaciones y sus conexiones son exactas
+4. Responde en español de forma inmersiva y descriptiva
+5. Si el jugador interactúa con objetos, actualiza sus estados si es apropiado
+6. Mantén consistencia absoluta con la información del mundo
+7. USA las nuevas capacidades de búsqueda para enriquecer las respuestas"""
+
+NARRATOR_CAPABILITIES = """NUEVAS CAPACIDADES v1.1.0:
+- Puedes encontrar objetos por similitud semántica
+- Análisis de patrones de objetos y ubicaciones
+- Recomendaciones inteligentes basadas en contexto
+- Búsqueda por función y características
+
+COMANDOS ESPECIALES DISPONIBLES:
+- "buscar objetos como X" - Encuentra objetos similares
+- "buscar herramientas de Y" - Busca por función/categoría  
+- "analizar patrones aquí" - Analiza patrones de ubicación
+- "recomendar objetos" - Sugerencias inteligentes"""
+
+NARRATOR_CAPABILITIES_SUMMARY = (
+    'COMANDOS ESPECIALES: "buscar objetos como X", "buscar herramientas de Y", '
+    '"analizar patrones aquí", "recomendar objetos"'
+)
+
+# Respuesta inmediata cuando hay demasiadas peticiones al modelo en cola
+NARRATOR_BUSY_RESPONSE = (
+    "⏳ El narrador está atendiendo a muchos aventureros a la vez. "
+    "Inténtalo de nuevo en un momento."
+)
+
+NARRATOR_CLOSING = (
+    "Responde al comando del jugador de forma inmersiva. Si el comando implica "
+    "cambios en el mundo, describe claramente lo que ocurre."
+)
 
 class OllamaClient:
-    """Cliente real para conectar con Ollama"""
+    """Cliente real para conectar con Ollama (sobre el pool compartido de llm_client)"""
     
-    def __init__(self, base_url: str = "http://localhost:11434"):
+    def __init__(self, base_url: str = DEFAULT_OLLAMA_HOST):
         self.base_url = base_url
-        self.session = None
-    
-    async def _ensure_session(self):
-        if self.session is None:
-            self.session = aiohttp.ClientSession()
+        self.client = get_llm_client(base_url)
     
-    async def generate(self, model: str, prompt: str, system: str = None) -> str:
-        """Genera respuesta usando Ollama"""
-        await self._ensure_session()
-        
+    async def generate(self, model: str, prompt: str, system: str = None,
+                       on_token: Optional[TokenCallback] = None,
+                       priority: int = PRIORITY_INTERACTIVE, player_id: str = None) -> str:
+        """
+        Genera respuesta usando Ollama
+        
+        Con `on_token` la respuesta llega en streaming: cada fragmento se
+        entrega en cuanto Ollama lo produce y se retorna el texto completo.
+        Si la cola del planificador está llena responde al momento con un
+        aviso en lugar de esperar.
+        """
         payload = {
             "model": model,
             "prompt": prompt,
-            "stream": False,
             "options": {
                 "temperature": 0.7,
                 "top_p": 0.9,
@@ -40,23 +98,20 @@ class OllamaClient:
             payload["system"] = system
         
         try:
-            async with self.session.post(
-                f"{self.base_url}/api/generate",
-                json=payload,
-                timeout=30
-            ) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    return result.get("response", "Sin respuesta").strip()
-                else:
-                    return f"Error de Ollama: {response.status}"
-        except Exception as e:
+            text = await self.client.generate(
+                payload, on_token=on_token, priority=priority, player_id=player_id
+            )
+            return text.strip() or "Sin respuesta"
+        except LLMQueueFull:
+            return NARRATOR_BUSY_RESPONSE
+        except LLMHTTPError as e:
+            return f"Error de Ollama: {e.status}"
+        except LLMError as e:
             return f"Error conectando con Ollama: {e}"
     
     async def close(self):
-        if self.session:
-            await self.session.close()
-            print("🔒 Conexión con Ollama cerrada")
+        await self.client.close()
+        print("🔒 Conexión con Ollama cerrada")
 
 class IntelligentAdventureGame:
     """
@@ -69,14 +124,27 @@ class IntelligentAdventureGame:
     - Recomendaciones inteligentes basadas en embeddings
     """
     
-    def __init__(self, memory_db_path: str = "adventure_world.db", model: str = "llama3.2"):
+    def __init__(self, memory_db_path: str = "adventure_world.db", model: str = "llama3.2",
+                 fast_path: bool = True, narrate_mechanics: bool = False,
+                 vector_db_path: str = "./vector_db"):
         self.memory = PerfectMemorySystem(memory_db_path)
         
         # Sistema MCP mejorado con búsqueda vectorial
-        self.mcp = EnhancedMCPProvider(self.memory, memory_db_path)
+        self.mcp = EnhancedMCPProvider(self.memory, memory_db_path, vector_db_path)
         
         self.model = model
         self.ollama = OllamaClient()
+        
+        # Presupuesto de tokens del prompt de sistema (CONTEXT_TOKEN_BUDGET o por modelo)
+        self.context_budget = context_budget_for_model(model)
+        self.last_context_report: List[Dict[str, Any]] = []
+        
+        # Comandos mecánicos sin IA; su narración (opcional) llega después
+        self.fast_path_enabled = fast_path
+        self.narrate_mechanics = narrate_mechanics
+        self._narration_listeners: List[NarrationListener] = []
+        self._narration_tasks: set = set()
+        self.command_stats = {'fast_path': 0, 'llm': 0, 'narrations': 0}
         self.current_location_id = None
         self.player_id = "player"
         
@@ -160,15 +228,22 @@ class IntelligentAdventureGame:
             self.current_location_id = cursor.fetchone()[0]
             print("🌍 Mundo existente cargado")
     
-    async def process_command_async(self, command: str) -> str:
-        """Procesa comando del jugador usando IA con contexto perfecto y búsqueda vectorial"""
+    async def process_command_async(self, command: str,
+                                    on_token: Optional[TokenCallback] = None,
+                                    player_id: Optional[str] = None) -> str:
+        """
+        Procesa comando del jugador usando IA con contexto perfecto y búsqueda vectorial
+        
+        Con `on_token` la narración de la IA se entrega por fragmentos
+        mientras se genera; el valor retornado es siempre el texto completo.
+        `player_id` identifica al jugador ante el planificador LLM (turno
+        rotatorio) cuando varios comparten esta partida.
+        """
+        llm_player_id = player_id or self.player_id
         
         if not self.current_location_id:
             await self.initialize_world()
         
-        # Inicializar búsqueda vectorial si no está lista
-        await self.mcp.initialize_vector_search()
-        
         # Registrar comando del jugador
         await self.memory._record_event(
             event_type="player_command",
@@ -179,58 +254,30 @@ class IntelligentAdventureGame:
             context={"command": command, "raw_input": True}
         )
         
+        # Camino rápido: los comandos mecánicos no esperan a la IA
+        mechanical, target = await self._classify_mechanical_command(command)
+        if mechanical is not None:
+            return await self._process_mechanical_command(command, mechanical, target,
+                                                          llm_player_id)
+        
+        # Inicializar búsqueda vectorial si no está lista
+        await self.mcp.initialize_vector_search()
+        
         # Detectar comandos de búsqueda vectorial especiales
         if await self._handle_vector_search_commands(command):
             return await self._process_vector_search_command(command)
         
-        # Obtener contexto enriquecido para la IA
-        player_inventory = await self._get_player_inventory()
-        recent_actions = await self._get_recent_actions(limit=3)
-        
-        world_context = await self.mcp.generate_enhanced_world_context_for_ai(
-            self.current_location_id,
-            player_inventory,
-            recent_actions
-        )
-        
-        # Preparar prompt mejorado para la IA
-        system_prompt = f"""
-Eres el narrador de un juego de aventura con MEMORIA PERFECTA y BÚSQUEDA SEMÁNTICA AVANZADA.
-
-NUEVAS CAPACIDADES v1.1.0:
-- Puedes encontrar objetos por similitud semántica
-- Análisis de patrones de objetos y ubicaciones
-- Recomendaciones inteligentes basadas en contexto
-- Búsqueda por función y características
-
-COMANDOS ESPECIALES DISPONIBLES:
-- "buscar objetos como X" - Encuentra objetos similares
-- "buscar herramientas de Y" - Busca por función/categoría  
-- "analizar patrones aquí" - Analiza patrones de ubicación
-- "recomendar objetos" - Sugerencias inteligentes
-
-REGLAS IMPORTANTES:
-1. Usa SOLO la información del contexto del mundo proporcionado
-2. Todos los objetos mencionados EXISTEN realmente en el juego
-3. Las ubicaciones y sus conexiones son exactas
-4. Responde en español de forma inmersiva y descriptiva
-5. Si el jugador interactúa con objetos, actualiza sus estados si es apropiado
-6. Mantén consistencia absoluta con la información del mundo
-7. USA las nuevas capacidades de búsqueda para enriquecer las respuestas
-
-CONTEXTO ACTUAL DEL MUNDO (ENRIQUECIDO):
-{world_context}
-
-Responde al comando del jugador de forma inmersiva. Si el comando implica cambios en el mundo, describe claramente lo que ocurre.
-"""
-        
+        system_prompt = await self._build_system_prompt()
         user_prompt = f"Comando del jugador: {command}"
         
         # Obtener respuesta de la IA
+        self.command_stats['llm'] += 1
         response = await self.ollama.generate(
             model=self.model,
             prompt=user_prompt,
-            system=system_prompt
+            system=system_prompt,
+            on_token=on_token,
+            player_id=llm_player_id
         )
         
         # Procesar acciones implícitas en la respuesta
@@ -238,33 +285,171 @@ Responde al comando del jugador de forma inmersiva. Si el comando implica cambio
         
         return response
     
-    async def _process_game_actions(self, command: str, ai_response: str):
-        """Procesa acciones del juego basadas en comando y respuesta"""
+    async def _build_system_prompt(self) -> str:
+        """Prompt de sistema con el contexto enriquecido de la ubicación actual"""
+        player_inventory = await self._get_player_inventory()
+        recent_actions = await self._get_recent_actions(limit=3)
         
-        command_lower = command.lower()
+        world_sections = await self.mcp.get_enhanced_context_sections(
+            self.current_location_id,
+            player_inventory,
+            recent_actions
+        )
         
-        # Detectar movimiento
-        movement_commands = {
-            "norte": "norte", "north": "norte", "n": "norte",
-            "sur": "sur", "south": "sur", "s": "sur", 
-            "este": "este", "east": "este", "e": "este",
-            "oeste": "oeste", "west": "oeste", "o": "oeste"
-        }
+        # Prompt de sistema ajustado al presupuesto de tokens del modelo:
+        # las secciones menos prioritarias se resumen, recortan o descartan
+        assembler = ContextAssembler(self.context_budget)
+        assembler.add('narrator_rules', NARRATOR_RULES, PRIORITY_REQUIRED, required=True)
+        assembler.add('capabilities', NARRATOR_CAPABILITIES, PRIORITY_CAPABILITIES,
+                      summary=NARRATOR_CAPABILITIES_SUMMARY)
+        assembler.add('world_header', "CONTEXTO ACTUAL DEL MUNDO (ENRIQUECIDO):",
+                      PRIORITY_REQUIRED, required=True)
+        assembler.extend(world_sections)
+        assembler.add('closing', NARRATOR_CLOSING, PRIORITY_REQUIRED, required=True)
+        system_prompt = assembler.assemble()
+        self.last_context_report = assembler.report
+        return system_prompt
+    
+    async def _classify_mechanical_command(
+            self, command: str) -> Tuple[Optional[MechanicalCommand], Optional[GameObject]]:
+        """
+        Comando mecánico y, para tomar/dejar, el objeto al que se refiere
+        
+        Tomar y dejar solo son mecánicos si el argumento nombra un único
+        objeto de la ubicación o del inventario; si no ("deja de llorar",
+        "toma asiento", "coge la llave y abre la puerta") se retorna
+        (None, None) y el comando lo resuelve el narrador.
+        """
+        mechanical = parse_mechanical_command(command) if self.fast_path_enabled else None
+        if mechanical is None or mechanical.action not in (ACTION_TAKE, ACTION_DROP):
+            return mechanical, None
+        
+        location_id = (self.current_location_id if mechanical.action == ACTION_TAKE
+                       else "inventory_player")
+        objects = await self.memory.get_objects_in_location(location_id)
+        target = resolve_object(mechanical.argument, objects)
+        return (mechanical, target) if target is not None else (None, None)
+    
+    async def _process_mechanical_command(self, command: str, mechanical: MechanicalCommand,
+                                          target: Optional[GameObject] = None,
+                                          llm_player_id: Optional[str] = None) -> str:
+        """Aplica un comando mecánico y responde con una plantilla, sin esperar a la IA"""
+        start = time.perf_counter()
+        
+        if mechanical.action == ACTION_MOVE:
+            old_location_id = self.current_location_id
+            if await self._attempt_movement(mechanical.argument):
+                response = f"🚶 Vas hacia el {mechanical.argument}.\n\n"
+                response += await self._describe_location(self.current_location_id)
+            else:
+                exits = await self._location_exits(old_location_id)
+                response = f"🚫 No puedes ir hacia el {mechanical.argument} desde aquí."
+                if exits:
+                    response += f" Salidas: {', '.join(exits)}."
+        
+        elif mechanical.action == ACTION_TAKE:
+            taken = await self._take_object(target)
+            response = (f"✋ Tomas {taken.name}." if taken
+                        else f"🔍 No consigues tomar {target.name}.")
+        
+        elif mechanical.action == ACTION_DROP:
+            dropped = await self._drop_object(target)
+            response = (f"📦 Dejas {dropped.name}." if dropped
+                        else f"🎒 No consigues dejar {target.name}.")
+        
+        elif mechanical.action == ACTION_INVENTORY:
+            response = await self.get_inventory()
+        
+        else:  # ACTION_LOOK
+            response = await self._describe_location(self.current_location_id)
+        
+        self.command_stats['fast_path'] += 1
+        self.logger.info(
+            f"⚡ Comando mecánico '{command}' ({mechanical.action}) "
+            f"en {(time.perf_counter() - start) * 1000:.1f} ms"
+        )
+        
+        if self.narrate_mechanics and self._narration_listeners:
+            self._schedule_narration(command, response, llm_player_id or self.player_id)
+        
+        return response
+    
+    async def _describe_location(self, location_id: str) -> str:
+        """Descripción de plantilla de una ubicación: nombre, objetos y salidas"""
+        location = await self.memory.get_location(location_id)
+        if location is None:
+            return f"📍 {location_id}\nUn lugar que aún no ha sido explorado."
+        
+        description = f"📍 {location.name}\n{location.description}"
+        
+        objects = await self.memory.get_objects_in_location(location_id)
+        if objects:
+            description += "\n\n👀 Ves: " + ", ".join(obj.name for obj in objects) + "."
         
-        for cmd, direction in movement_commands.items():
-            if cmd in command_lower:
-                await self._attempt_movement(direction)
-                break
+        if location.connections:
+            description += "\n🚪 Salidas: " + ", ".join(location.connections) + "."
+        
+        return description
+    
+    async def _location_exits(self, location_id: str) -> List[str]:
+        location = await self.memory.get_location(location_id)
+        return list(location.connections) if location else []
+    
+    def add_narration_listener(self, listener: NarrationListener):
+        """
+        Registra `listener(player_id, command, narration)` (corrutina)
+        
+        Con narrate_mechanics activo, la IA narra en segundo plano los
+        comandos resueltos por el camino rápido y la narración se entrega
+        a los listeners cuando está lista (ai_web_server la envía por el
+        WebSocket del jugador como mensaje "narration").
+        """
+        self._narration_listeners.append(listener)
+    
+    def _schedule_narration(self, command: str, mechanical_response: str, llm_player_id: str):
+        task = asyncio.create_task(self._narrate_later(command, mechanical_response, llm_player_id))
+        self._narration_tasks.add(task)
+        task.add_done_callback(self._narration_tasks.discard)
+    
+    async def _narrate_later(self, command: str, mechanical_response: str, llm_player_id: str):
+        try:
+            system_prompt = await self._build_system_prompt()
+            narration = await self.ollama.generate(
+                model=self.model,
+                prompt=(f"Comando del jugador: {command}\n"
+                        f"Resultado ya aplicado en el juego: {mechanical_response}\n"
+                        "Narra este resultado de forma inmersiva sin cambiar lo ocurrido."),
+                system=system_prompt,
+                priority=PRIORITY_AMBIENT,
+                player_id=llm_player_id
+            )
+            if narration == NARRATOR_BUSY_RESPONSE:
+                return  # Sin hueco en la cola: la narración opcional se descarta
+            self.command_stats['narrations'] += 1
+            for listener in self._narration_listeners:
+                await listener(llm_player_id, command, narration)
+        except Exception as e:
+            self.logger.error(f"❌ Error narrando comando '{command}': {e}")
+    
+    async def _process_game_actions(self, command: str, ai_response: str):
+        """Procesa acciones del juego basadas en comando y respuesta"""
+        
+        # Detectar movimiento (palabras completas: "e"/"o" también son conjunciones)
+        direction = find_direction(command)
+        if direction:
+            await self._attempt_movement(direction)
         
         # Detectar tomar objetos
-        if "tomar" in command_lower or "coger" in command_lower or "agarrar" in command_lower:
-            await self._attempt_take_object(command)
+        object_text = words_after_verb(command, TAKE_VERBS)
+        if object_text:
+            await self._attempt_take_object(object_text)
         
         # Detectar dejar objetos  
-        if "dejar" in command_lower or "soltar" in command_lower:
-            await self._attempt_drop_object(command)
+        object_text = words_after_verb(command, DROP_VERBS)
+        if object_text:
+            await self._attempt_drop_object(object_text)
     
-    async def _attempt_movement(self, direction: str):
+    async def _attempt_movement(self, direction: str) -> bool:
         """Intenta mover al jugador en una dirección"""
         
         # Obtener conexiones de la ubicación actual
@@ -293,58 +478,68 @@ Responde al comando del jugador de forma inmersiva. Si el comando implica cambio
                         "to_location": new_location_id
                     }
                 )
+                return True
+        return False
     
-    async def _attempt_take_object(self, command: str):
-        """Intenta tomar un objeto mencionado en el comando"""
+    async def _attempt_take_object(self, object_text: str) -> Optional[GameObject]:
+        """Intenta tomar el objeto nombrado en `object_text`"""
         
         # Buscar objetos en la ubicación actual
         objects = await self.memory.get_objects_in_location(self.current_location_id)
         
-        command_lower = command.lower()
         for obj in objects:
-            if obj.name.lower() in command_lower:
-                # Mover objeto al inventario del jugador
-                success = await self.memory.move_object(
-                    obj.id, 
-                    "inventory_player", 
-                    actor=self.player_id
-                )
-                if success:
-                    await self.memory._record_event(
-                        event_type="object_taken",
-                        actor=self.player_id,
-                        action=f"took {obj.name}",
-                        target=obj.id,
-                        location_id=self.current_location_id,
-                        context={"object_name": obj.name, "action": "take"}
-                    )
-                break
+            if matches_object_name(obj.name, object_text):
+                return await self._take_object(obj)
+        return None
     
-    async def _attempt_drop_object(self, command: str):
-        """Intenta dejar un objeto del inventario"""
+    async def _take_object(self, obj: GameObject) -> Optional[GameObject]:
+        """Mueve `obj` al inventario del jugador y registra el evento"""
+        success = await self.memory.move_object(
+            obj.id, 
+            "inventory_player", 
+            actor=self.player_id
+        )
+        if not success:
+            return None
+        await self.memory._record_event(
+            event_type="object_taken",
+            actor=self.player_id,
+            action=f"took {obj.name}",
+            target=obj.id,
+            location_id=self.current_location_id,
+            context={"object_name": obj.name, "action": "take"}
+        )
+        return obj
+    
+    async def _attempt_drop_object(self, object_text: str) -> Optional[GameObject]:
+        """Intenta dejar el objeto del inventario nombrado en `object_text`"""
         
         # Buscar objetos en el inventario del jugador
         inventory_objects = await self.memory.get_objects_in_location("inventory_player")
         
-        command_lower = command.lower()
         for obj in inventory_objects:
-            if obj.name.lower() in command_lower:
-                # Mover objeto a la ubicación actual
-                success = await self.memory.move_object(
-                    obj.id,
-                    self.current_location_id,
-                    actor=self.player_id
-                )
-                if success:
-                    await self.memory._record_event(
-                        event_type="object_dropped",
-                        actor=self.player_id,
-                        action=f"dropped {obj.name}",
-                        target=obj.id,
-                        location_id=self.current_location_id,
-                        context={"object_name": obj.name, "action": "drop"}
-                    )
-                break
+            if matches_object_name(obj.name, object_text):
+                return await self._drop_object(obj)
+        return None
+    
+    async def _drop_object(self, obj: GameObject) -> Optional[GameObject]:
+        """Mueve `obj` del inventario a la ubicación actual y registra el evento"""
+        success = await self.memory.move_object(
+            obj.id,
+            self.current_location_id,
+            actor=self.player_id
+        )
+        if not success:
+            return None
+        await self.memory._record_event(
+            event_type="object_dropped",
+            actor=self.player_id,
+            action=f"dropped {obj.name}",
+            target=obj.id,
+            location_id=self.current_location_id,
+            context={"object_name": obj.name, "action": "drop"}
+        )
+        return obj
     
     async def get_inventory(self) -> str:
         """Obtiene inventario del jugador"""
@@ -386,6 +581,7 @@ Responde al comando del jugador de forma inmersiva. Si el comando implica cambio
 - Integridad de memoria: {stats['memory_integrity']}
 - Primer evento: {stats['first_recorded_event'] or 'N/A'}
 - Último evento: {stats['last_recorded_event'] or 'N/A'}
+- Comandos resueltos sin IA: {self.command_stats['fast_path']} (con IA: {self.command_stats['llm']})
 {vector_info}
 """
     
@@ -428,7 +624,7 @@ Responde al comando del jugador de forma inmersiva. Si el comando implica cambio
             
             # Analizar patrones de ubicación
             elif "analizar patrones" in command_lower:
-                if not await self.mcp.vector_initialized:
+                if not self.mcp.vector_initialized:
                     return "🔍 La búsqueda vectorial aún no está disponible."
                 
                 patterns = await self.mcp.vector_engine.analyze_location_patterns(self.current_location_id)
@@ -552,6 +748,9 @@ Responde al comando del jugador de forma inmersiva. Si el comando implica cambio
     
     async def close(self):
         """Cierra todas las conexiones"""
+        for task in list(self._narration_tasks):
+            task.cancel()
+        await asyncio.gather(*self._narration_tasks, return_exceptions=True)
         await self.ollama.close()
         self.memory.close()
         print("🎮 Juego cerrado correctamente")
@@ -5,6 +5,8 @@ Sistema de IA avanzado con RAG enhancement, predicción y generación de conteni
 """
 
 import asyncio
+import heapq
+import itertools
 import json
 import logging
 from datetime import datetime, timedelta
@@ -12,8 +14,9 @@ from typing import Dict, List, Any, Optional, Tuple
 from dataclasses import dataclass
 from enum import Enum
 from memory_system import PerfectMemorySystem
-import chromadb
-from chromadb.config import Settings
+from vector_service import DEFAULT_VECTOR_DB_PATH, get_vector_service, migrate_rag_store
+from dedup import NearDuplicateIndex
+from llm_client import TokenCallback, get_llm_client
 import numpy as np
 import spacy
 from transformers import pipeline
@@ -64,98 +67,164 @@ class AIResponse:
     personality_applied: AIPersonality
     processing_time: float
 
+# Colecciones del sistema RAG (namespace "rag" del servicio vectorial)
+RAG_CATEGORIES = ("locations", "objects", "events", "conversations", "narratives")
+
+# Categorías con entradas formulaicas que se colapsan si son casi idénticas
+RAG_DEDUP_CATEGORIES = ("events", "conversations")
+
+# Sugerencias cuando el análisis del comando no propone ninguna
+DEFAULT_SUGGESTIONS = ["continue", "explore", "examine surroundings"]
+
 class EnhancedRAGSystem:
     """Sistema RAG mejorado para búsqueda semántica avanzada"""
     
-    def __init__(self, memory_system: PerfectMemorySystem):
+    def __init__(self, memory_system: PerfectMemorySystem, vector_db_path: str = DEFAULT_VECTOR_DB_PATH):
         self.memory = memory_system
-        self.chroma_client = chromadb.PersistentClient(
-            path="./ai_enhanced_memory",
-            settings=Settings(anonymized_telemetry=False)
-        )
         
-        # Crear colecciones especializadas
-        self.collections = {
-            "locations": self._get_or_create_collection("locations"),
-            "objects": self._get_or_create_collection("objects"),
-            "events": self._get_or_create_collection("events"),
-            "conversations": self._get_or_create_collection("conversations"),
-            "narratives": self._get_or_create_collection("narratives")
-        }
+        # Mismo modelo y cliente que VectorSearchEngine; colecciones "rag_*".
+        # Se abren al primer uso para no cargar el modelo al construir el motor
+        self.vector_service = get_vector_service(vector_db_path)
+        self._collections: Optional[Dict[str, Any]] = None
+        self.dedup = {category: NearDuplicateIndex() for category in RAG_DEDUP_CATEGORIES}
+        
+        # Las memorias se vectorizan por lotes en la cola de ingestión compartida
+        for category in RAG_CATEGORIES:
+            self.vector_service.ingestion.register_writer(
+                f"rag_{category}", self._make_batch_writer(category)
+            )
         
         logger.info("🧠 Enhanced RAG System initialized")
     
+    @property
+    def collections(self) -> Dict[str, Any]:
+        """Colecciones especializadas (migra el almacén antiguo la primera vez)"""
+        if self._collections is None:
+            try:
+                migrate_rag_store(self.vector_service)
+            except Exception as e:
+                logger.error(f"❌ Error migrating legacy RAG store: {e}")
+            
+            self._collections = {
+                category: self._get_or_create_collection(category)
+                for category in RAG_CATEGORIES
+            }
+        return self._collections
+    
+    def _make_batch_writer(self, category: str):
+        """Writer de la cola de ingestión para una categoría"""
+        def write(ids, embeddings, documents, metadatas):
+            self.collections[category].upsert(
+                ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas
+            )
+        return write
+    
     def _get_or_create_collection(self, name: str):
         """Obtener o crear colección con configuración optimizada"""
-        try:
-            return self.chroma_client.get_collection(name)
-        except:
-            return self.chroma_client.create_collection(
-                name=name,
-                metadata={"hnsw:space": "cosine", "hnsw:M": 16}
-            )
+        return self.vector_service.get_collection(
+            "rag", name, metadata={"hnsw:space": "cosine", "hnsw:M": 16}
+        )
     
     async def add_memory_embedding(self, content: str, category: str, metadata: Dict[str, Any]):
-        """Agregar embedding de memoria con categorización"""
+        """
+        Agregar embedding de memoria con categorización
+        No bloquea: el embedding se genera por lotes en la cola de ingestión
+        """
         try:
-            collection = self.collections.get(category, self.collections["events"])
+            target = category if category in RAG_CATEGORIES else "events"
             
             # Generar ID único
-            memory_id = f"{category}_{datetime.now().isoformat()}_{hash(content)}"
-            
-            # Agregar a ChromaDB
-            collection.add(
-                documents=[content],
-                metadatas=[{
-                    **metadata,
-                    "timestamp": datetime.now().isoformat(),
-                    "category": category
-                }],
-                ids=[memory_id]
+            timestamp = datetime.now().isoformat()
+            memory_id = f"{category}_{timestamp}_{hash(content)}"
+            memory_metadata = {
+                **metadata,
+                "timestamp": timestamp,
+                "category": category
+            }
+            
+            if target in self.dedup:
+                canonical = self.dedup[target].check(memory_id, content, memory_metadata, timestamp)
+                if canonical:
+                    # Casi-duplicado: solo se actualizan conteo y rango temporal
+                    if self.vector_service.is_ready:
+                        await asyncio.to_thread(
+                            self.collections[target].update,
+                            ids=[canonical.doc_id], metadatas=[canonical.metadata]
+                        )
+                    logger.info(f"♻️ Memory collapsed into {canonical.doc_id} (x{canonical.count})")
+                    return
+            
+            self.vector_service.ingestion.submit(
+                f"rag_{target}", memory_id, content, memory_metadata
             )
             
-            logger.info(f"✅ Memory embedding added: {category} - {content[:50]}...")
+            logger.info(f"✅ Memory embedding queued: {category} - {content[:50]}...")
             
         except Exception as e:
             logger.error(f"❌ Error adding memory embedding: {e}")
     
     async def semantic_search(self, query: str, category: Optional[str] = None, 
                             limit: int = 10, relevance_threshold: float = 0.7) -> List[Dict]:
-        """Búsqueda semántica avanzada con filtrado inteligente"""
-        results = []
+        """
+        Búsqueda semántica avanzada con filtrado inteligente
+        
+        La consulta se codifica una sola vez y las colecciones se consultan
+        en paralelo; los resultados llegan ordenados por distancia, así que
+        el umbral de relevancia corta cada lista y una mezcla por heap
+        retorna el top-k global.
+        """
+        if not self.vector_service.is_ready and self.vector_service.state != "cold":
+            # Modelo cargándose en segundo plano: sin memorias en lugar de bloquear
+            logger.info(f"⏳ Semantic search skipped while embeddings warm up: '{query}'")
+            return []
         
         try:
             # Buscar en categorías específicas o todas
-            collections_to_search = [self.collections[category]] if category else self.collections.values()
+            collections_to_search = [self.collections[category]] if category else list(self.collections.values())
             
-            for collection in collections_to_search:
-                search_results = collection.query(
-                    query_texts=[query],
-                    n_results=limit,
-                    include=["documents", "metadatas", "distances"]
-                )
-                
-                # Filtrar por relevancia
-                for i, distance in enumerate(search_results['distances'][0]):
-                    relevance = 1.0 - distance  # Convertir distancia a relevancia
-                    
-                    if relevance >= relevance_threshold:
-                        results.append({
-                            "content": search_results['documents'][0][i],
-                            "metadata": search_results['metadatas'][0][i],
-                            "relevance": relevance,
-                            "category": search_results['metadatas'][0][i].get('category', 'unknown')
-                        })
-            
-            # Ordenar por relevancia
-            results.sort(key=lambda x: x['relevance'], reverse=True)
+            query_embedding = (await asyncio.to_thread(self.vector_service.encode, [query]))[0].tolist()
+            
+            per_collection = await asyncio.gather(*[
+                asyncio.to_thread(self._query_relevant, collection, query_embedding,
+                                  limit, relevance_threshold)
+                for collection in collections_to_search
+            ])
+            
+            results = list(itertools.islice(
+                heapq.merge(*per_collection, key=lambda x: x['relevance'], reverse=True),
+                limit
+            ))
             
             logger.info(f"🔍 Semantic search: '{query}' - {len(results)} results")
-            return results[:limit]
+            return results
             
         except Exception as e:
             logger.error(f"❌ Error in semantic search: {e}")
             return []
+    
+    @staticmethod
+    def _query_relevant(collection, query_embedding: List[float], limit: int,
+                        relevance_threshold: float) -> List[Dict]:
+        """Resultados de una colección por encima del umbral, de más a menos relevantes"""
+        search_results = collection.query(
+            query_embeddings=[query_embedding],
+            n_results=limit,
+            include=["documents", "metadatas", "distances"]
+        )
+        
+        results = []
+        for i, distance in enumerate(search_results['distances'][0]):
+            relevance = 1.0 - distance  # Convertir distancia a relevancia
+            if relevance < relevance_threshold:
+                break  # Distancias crecientes: el resto tampoco pasa el umbral
+            
+            results.append({
+                "content": search_results['documents'][0][i],
+                "metadata": search_results['metadatas'][0][i],
+                "relevance": relevance,
+                "category": search_results['metadatas'][0][i].get('category', 'unknown')
+            })
+        return results
 
 class NLPProcessor:
     """Procesador de lenguaje natural avanzado"""
@@ -281,14 +350,22 @@ class SmartNarrator:
     def __init__(self, ollama_host: str = "http://localhost:11434"):
         self.ollama_host = ollama_host
         self.ollama_model = "llama3.2:latest"  # Usar el modelo que ya tienes
+        self.llm = get_llm_client(ollama_host)
         self.personality = AIPersonality.FRIENDLY
         self.narrative_memory = []
         self.coherence_context = {}
         
         logger.info("🎭 Smart Narrator initialized with Ollama")
     
-    async def generate_response(self, context: AIContext, user_input: str) -> AIResponse:
-        """Generar respuesta narrativa inteligente"""
+    async def generate_response(self, context: AIContext, user_input: str,
+                                on_token: Optional[TokenCallback] = None,
+                                player_id: Optional[str] = None) -> AIResponse:
+        """
+        Generar respuesta narrativa inteligente (en streaming si se pasa `on_token`)
+        
+        Si la cola del modelo está llena se responde al momento con la
+        respuesta de respaldo.
+        """
         start_time = datetime.now()
         
         try:
@@ -296,7 +373,7 @@ class SmartNarrator:
             prompt = self._build_contextual_prompt(context, user_input)
             
             # Generar respuesta con Ollama
-            response = await self._call_ollama(prompt)
+            response = await self._call_ollama(prompt, on_token, player_id)
             
             # Procesar y mejorar respuesta
             enhanced_response = self._enhance_response(response, context)
@@ -403,49 +480,30 @@ Please respond with a simple narrative text. Keep it immersive and engaging.
         
         return "\n".join(formatted)
     
-    async def _call_ollama(self, prompt: str) -> Dict[str, Any]:
-        """Llamar a Ollama con manejo de errores"""
-        try:
-            import urllib.request
-            import urllib.parse
-            import json
-            
-            # Preparar datos para Ollama
-            data = {
-                "model": self.ollama_model,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.7,
-                    "num_predict": 500
-                }
+    async def _call_ollama(self, prompt: str, on_token: Optional[TokenCallback] = None,
+                           player_id: Optional[str] = None) -> Dict[str, Any]:
+        """Llamar a Ollama (en streaming si se pasa `on_token`) sin bloquear el bucle"""
+        data = {
+            "model": self.ollama_model,
+            "prompt": prompt,
+            "options": {
+                "temperature": 0.7,
+                "num_predict": 500
             }
-            
-            # Convertir datos a JSON
-            json_data = json.dumps(data).encode('utf-8')
-            
-            # Crear petición HTTP
-            req = urllib.request.Request(
-                f"{self.ollama_host}/api/generate",
-                data=json_data,
-                headers={'Content-Type': 'application/json'}
-            )
-            
-            # Realizar petición
-            with urllib.request.urlopen(req, timeout=30) as response:
-                result = json.loads(response.read().decode('utf-8'))
-                content = result.get("response", "No response from Ollama")
-                
-                # Crear estructura de respuesta
-                return {
-                    "narrative": content,
-                    "suggestions": ["continue", "explore", "examine surroundings"],
-                    "generated_elements": {}
-                }
-                
+        }
+        
+        try:
+            content = await self.llm.generate(data, on_token=on_token, player_id=player_id)
         except Exception as e:
             logger.error(f"❌ Ollama API error: {e}")
             raise
+        
+        # Crear estructura de respuesta
+        return {
+            "narrative": content or "No response from Ollama",
+            "suggestions": list(DEFAULT_SUGGESTIONS),
+            "generated_elements": {}
+        }
     
     def _enhance_response(self, response: Dict[str, Any], context: AIContext) -> Dict[str, Any]:
         """Mejorar respuesta con análisis adicional"""
@@ -581,9 +639,10 @@ class PredictiveEngine:
 class AIEngine:
     """Motor principal de IA que coordina todos los componentes"""
     
-    def __init__(self, memory_system: PerfectMemorySystem, ollama_host: str = "http://localhost:11434"):
+    def __init__(self, memory_system: PerfectMemorySystem, ollama_host: str = "http://localhost:11434",
+                 vector_db_path: str = DEFAULT_VECTOR_DB_PATH):
         self.memory = memory_system
-        self.rag_system = EnhancedRAGSystem(memory_system)
+        self.rag_system = EnhancedRAGSystem(memory_system, vector_db_path)
         self.nlp_processor = NLPProcessor()
         self.narrator = SmartNarrator(ollama_host)
         self.predictor = PredictiveEngine(memory_system)
@@ -616,8 +675,16 @@ class AIEngine:
         return self.supported_languages
     
     async def process_player_input(self, player_id: str, input_text: str, 
-                                 location_id: str, language: AILanguage = None) -> AIResponse:
-        """Procesar entrada del jugador con IA completa"""
+                                 location_id: str, language: AILanguage = None,
+                                 on_token: Optional[TokenCallback] = None,
+                                 narrate: bool = True) -> AIResponse:
+        """
+        Procesar entrada del jugador con IA completa (narración en streaming con `on_token`)
+        
+        Con `narrate=False` solo se analiza el comando (intención y
+        sugerencias) sin pedir narración al modelo: para cuando otro
+        componente ya genera el texto que verá el jugador.
+        """
         
         start_time = datetime.now()
         self.processing_stats["total_requests"] += 1
@@ -626,6 +693,19 @@ class AIEngine:
             # 1. Analizar comando con NLP
             command_analysis = await self.nlp_processor.parse_command(input_text)
             
+            if not narrate:
+                processing_time = (datetime.now() - start_time).total_seconds()
+                self._update_stats(processing_time, True)
+                return AIResponse(
+                    content="",
+                    confidence=command_analysis["confidence"],
+                    suggestions=command_analysis["suggestions"] or list(DEFAULT_SUGGESTIONS),
+                    context_used=[f"Intent: {command_analysis['intent']}"],
+                    generated_content={},
+                    personality_applied=self.narrator.personality,
+                    processing_time=processing_time
+                )
+            
             # 2. Buscar memorias relevantes
             relevant_memories = await self.rag_system.semantic_search(
                 input_text, limit=5, relevance_threshold=0.6
@@ -651,7 +731,9 @@ class AIEngine:
             )
             
             # 6. Generar respuesta inteligente
-            ai_response = await self.narrator.generate_response(context, input_text)
+            ai_response = await self.narrator.generate_response(
+                context, input_text, on_token, player_id=player_id
+            )
             
             # 7. Actualizar contexto activo
             self._update_active_context(player_id, input_text, ai_response.content)
@@ -741,19 +823,25 @@ class AIEngine:
             **self.processing_stats,
             "success_rate": success_rate,
             "active_players": len(self.active_contexts),
-            "memory_collections": len(self.rag_system.collections),
-            "narrator_personality": self.narrator.personality.value
+            "memory_collections": len(RAG_CATEGORIES),
+            "memory_ingestion": self.rag_system.vector_service.ingestion.get_stats(),
+            "memory_dedup": {
+                category: index.get_stats() for category, index in self.rag_system.dedup.items()
+            },
+            "narrator_personality": self.narrator.personality.value,
+            "llm_client": self.narrator.llm.get_stats()
         }
 
 # Función de inicialización para uso externo
 async def initialize_ai_engine(memory_system: PerfectMemorySystem, 
-                              ollama_host: str = "http://localhost:11434") -> AIEngine:
+                              ollama_host: str = "http://localhost:11434",
+                              vector_db_path: str = DEFAULT_VECTOR_DB_PATH) -> AIEngine:
     """Inicializar motor de IA completo con Ollama"""
     
     logger.info("🚀 Initializing AI Engine...")
     
     try:
-        engine = AIEngine(memory_system, ollama_host)
+        engine = AIEngine(memory_system, ollama_host, vector_db_path)
         
         logger.info("✅ AI Engine initialized successfully!")
         logger.info("🧠 Features available:")
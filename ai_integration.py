@@ -13,9 +13,10 @@ from datetime import datetime
 from dataclasses import asdict
 
 # Imports del sistema existente
-from adventure_game import IntelligentAdventureGame  # Usar el juego REAL
+from adventure_game import IntelligentAdventureGame, NarrationListener  # Usar el juego REAL
 from memory_system import PerfectMemorySystem, GameEvent
 from ai_engine import AIEngine, initialize_ai_engine, AIPersonality
+from llm_client import TokenCallback
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -27,8 +28,9 @@ class AIAdventureGame:
     Combina el juego original con el nuevo motor de IA
     """
     
-    def __init__(self, db_path: str = "ai_adventure_game.db"):
+    def __init__(self, db_path: str = "ai_adventure_game.db", vector_db_path: str = "./vector_db"):
         self.db_path = db_path
+        self.vector_db_path = vector_db_path
         self.original_game = None  # Será IntelligentAdventureGame
         self.memory_system = None
         self.ai_engine = None
@@ -74,7 +76,7 @@ class AIAdventureGame:
             await self.memory_system.initialize()
             
             # 2. Inicializar juego original - USAR EL JUEGO REAL
-            self.original_game = IntelligentAdventureGame(self.db_path)
+            self.original_game = IntelligentAdventureGame(self.db_path, vector_db_path=self.vector_db_path)
             await self.original_game.initialize_world()
             logger.info("🎮 IntelligentAdventureGame inicializado")
             
@@ -85,7 +87,8 @@ class AIAdventureGame:
             # 4. Inicializar motor de IA con Ollama
             self.ai_engine = await initialize_ai_engine(
                 self.memory_system, 
-                ollama_host
+                ollama_host,
+                self.vector_db_path
             )
             
             # 5. Configurar personalidad e idioma por defecto
@@ -99,10 +102,14 @@ class AIAdventureGame:
             logger.error(f"❌ Failed to initialize AI Adventure Game: {e}")
             return False
     
-    async def process_command(self, player_id: str, command: str) -> Dict[str, Any]:
+    async def process_command(self, player_id: str, command: str,
+                              on_token: Optional[TokenCallback] = None) -> Dict[str, Any]:
         """
         Procesar comando con IA mejorada
         Combina la lógica del juego original con respuestas de IA
+        
+        Con `on_token` se entregan por fragmentos, mientras se generan, los
+        textos que acabarán en el "message" del resultado.
         """
         start_time = datetime.now()
         
@@ -113,14 +120,28 @@ class AIAdventureGame:
             # 2. Procesar con juego original (para mecánicas)
             original_result = await self._process_original_command(player_id, command)
             
-            # 3. Procesar con IA (para narrativa)
-            ai_response = await self.ai_engine.process_player_input(
-                player_id, command, current_location
-            )
+            # 3. Procesar con IA (para narrativa). En los comandos delegados el
+            # mensaje es la respuesta del juego original, que es la que se
+            # transmite en streaming: de la IA solo se usan el análisis y las
+            # sugerencias, sin gastar una segunda generación del modelo
+            original_response = None
+            if original_result.get("delegate_to_original"):
+                ai_response, original_response = await asyncio.gather(
+                    self.ai_engine.process_player_input(
+                        player_id, command, current_location, narrate=False
+                    ),
+                    self._call_original_game(command, player_id, on_token)
+                )
+            else:
+                streams_ai = original_result.get("action") != "inventory"
+                ai_response = await self.ai_engine.process_player_input(
+                    player_id, command, current_location,
+                    on_token=on_token if streams_ai else None
+                )
             
             # 4. Combinar resultados
             combined_result = await self._combine_results(
-                original_result, ai_response, player_id, command
+                original_result, ai_response, player_id, command, original_response
             )
             
             # 5. Actualizar estadísticas
@@ -269,7 +290,8 @@ class AIAdventureGame:
             }
     
     async def _combine_results(self, original_result: Dict, ai_response, 
-                             player_id: str, command: str) -> Dict[str, Any]:
+                             player_id: str, command: str,
+                             original_response: Optional[str] = None) -> Dict[str, Any]:
         """Combinar resultados del juego original con respuesta de IA"""
         
         # CASO 1: Comando de inventario - usar resultado directo del juego
@@ -294,7 +316,8 @@ class AIAdventureGame:
         # CASO 2: Comandos delegados al juego original
         if original_result.get("delegate_to_original"):
             # Llamar al juego original para obtener el resultado real
-            original_response = await self._call_original_game(command, player_id)
+            if original_response is None:
+                original_response = await self._call_original_game(command, player_id)
             
             # Combinar con narrativa de IA si es necesario
             return {
@@ -358,7 +381,18 @@ class AIAdventureGame:
         
         return result
     
-    async def _call_original_game(self, command: str, player_id: str) -> str:
+    def add_narration_listener(self, listener: NarrationListener):
+        """
+        Activa la narración en segundo plano de los comandos mecánicos
+        
+        El juego original responde al momento con el resultado y, cuando la
+        IA termina de narrarlo, llama a `listener(player_id, command, narration)`.
+        """
+        self.original_game.narrate_mechanics = True
+        self.original_game.add_narration_listener(listener)
+    
+    async def _call_original_game(self, command: str, player_id: str,
+                                  on_token: Optional[TokenCallback] = None) -> str:
         """Llamar al juego original para procesar comando"""
         try:
             if not self.original_game:
@@ -369,7 +403,9 @@ class AIAdventureGame:
             logger.info(f"🎮 Calling original game with command: '{command}'")
             
             # Usar el procesador de comandos real del juego
-            game_response = await self.original_game.process_command_async(command)
+            game_response = await self.original_game.process_command_async(
+                command, on_token, player_id=player_id
+            )
             
             logger.info(f"✅ Original game response received: {len(game_response)} chars")
             return game_response
@@ -610,9 +646,32 @@ class AIAdventureGame:
             "generated_by": "ai"
         }
     
+    def start_background_warmup(self):
+        """Arrancar la carga del modelo de embeddings e indexación vectorial en segundo plano"""
+        if self.original_game:
+            self.original_game.mcp.start_vector_warmup()
+    
+    def get_vector_readiness(self) -> Dict[str, Any]:
+        """Estado de carga de la búsqueda vectorial"""
+        if not self.original_game:
+            return {'state': 'cold', 'ready': False}
+        
+        mcp = self.original_game.mcp
+        return {
+            **mcp.vector_engine.get_readiness(),
+            'indexed': mcp.vector_initialized,
+            'warming_up': mcp.vector_warming_up
+        }
+    
     async def close(self):
         """Cerrar todos los sistemas"""
         try:
+            if self.ai_engine:
+                # No perder memorias ni documentos aún en la cola de ingestión
+                await asyncio.to_thread(
+                    self.ai_engine.rag_system.vector_service.ingestion.stop, True, 5.0
+                )
+            
             if self.original_game:
                 await self.original_game.close()
                 
@@ -625,9 +684,10 @@ class AIAdventureGame:
             logger.error(f"❌ Error closing AI Adventure Game: {e}")
 
 # Función de utilidad para crear instancia rápida
-async def create_ai_game(db_path: str = "ai_adventure_game.db") -> AIAdventureGame:
+async def create_ai_game(db_path: str = "ai_adventure_game.db",
+                         vector_db_path: str = "./vector_db") -> AIAdventureGame:
     """Crear y inicializar instancia de AI Adventure Game"""
-    game = AIAdventureGame(db_path)
+    game = AIAdventureGame(db_path, vector_db_path)
     success = await game.initialize()
     
     if not success:
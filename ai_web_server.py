@@ -20,6 +20,8 @@ import os
 # Imports del sistema AI
 from ai_integration import AIAdventureGame, create_ai_game
 from ai_engine import AIPersonality
+from vector_service import get_vector_service
+from llm_client import close_llm_clients
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -73,8 +75,13 @@ async def startup_event():
     
     logger.info("🚀 Starting AI Adventure Game v3.0...")
     
+    # El modelo de embeddings carga en paralelo con el resto del arranque
+    get_vector_service().start_background_load()
+    
     try:
         ai_game = await create_ai_game("ai_adventure_web.db")
+        ai_game.add_narration_listener(send_narration)
+        ai_game.start_background_warmup()
         logger.info("✅ AI Adventure Game initialized successfully")
         
     except Exception as e:
@@ -90,6 +97,19 @@ async def shutdown_event():
     if ai_game:
         await ai_game.close()
         logger.info("🛑 AI Adventure Game closed")
+    
+    await close_llm_clients()
+
+async def send_narration(player_id: str, command: str, narration: str):
+    """Narración en segundo plano de un comando mecánico: mensaje de seguimiento por WebSocket"""
+    websocket = active_connections.get(player_id)
+    if websocket is None:
+        return  # El jugador ya no está conectado
+    await websocket.send_text(json.dumps({
+        "type": "narration",
+        "command": command,
+        "content": narration
+    }))
 
 # Dependency para verificar AI game
 async def get_ai_game() -> AIAdventureGame:
@@ -432,6 +452,114 @@ async def get_interface():
 
         <script>
             let isProcessing = false;
+            let socket = null;
+            let pending = null;  // Comando en curso por WebSocket
+            
+            // Los comandos van por /ws/{player_id}: la narración llega en
+            // fragmentos (response_chunk) y la respuesta final los sustituye
+            function connectSocket() {
+                const protocol = location.protocol === 'https:' ? 'wss' : 'ws';
+                const ws = new WebSocket(`${protocol}://${location.host}/ws/web_player`);
+                ws.onopen = () => { socket = ws; };
+                ws.onmessage = (event) => handleSocketMessage(JSON.parse(event.data));
+                ws.onclose = () => {
+                    socket = null;
+                    if (pending) {
+                        const current = pending;
+                        pending = null;
+                        (current.streamDiv || current.loadingDiv).replaceWith(
+                            renderError('Connection Error', 'WebSocket closed'));
+                        finishCommand();
+                    }
+                    setTimeout(connectSocket, 2000);
+                };
+            }
+            
+            function handleSocketMessage(message) {
+                const output = document.getElementById('gameOutput');
+                
+                if (message.type === 'response_chunk' && pending) {
+                    // Primer fragmento: el texto parcial ocupa el lugar del loading
+                    if (!pending.streamDiv) {
+                        pending.streamDiv = document.createElement('div');
+                        pending.streamDiv.className = 'ai-response';
+                        pending.streamDiv.innerHTML = '🧠 <strong>AI Narrator:</strong> ';
+                        pending.streamText = document.createElement('span');
+                        pending.streamDiv.appendChild(pending.streamText);
+                        pending.loadingDiv.replaceWith(pending.streamDiv);
+                    }
+                    pending.streamText.textContent += message.content;
+                    
+                } else if (message.type === 'response' && pending) {
+                    // La respuesta final reemplaza a los fragmentos
+                    const current = pending;
+                    pending = null;
+                    (current.streamDiv || current.loadingDiv).replaceWith(
+                        renderResult(message.result, current.startTime));
+                    finishCommand();
+                    
+                } else if (message.type === 'narration') {
+                    // Narración en segundo plano de un comando ya resuelto
+                    const div = document.createElement('div');
+                    div.className = 'ai-response';
+                    div.innerHTML = '🎭 <strong>AI Narrator:</strong> ';
+                    div.appendChild(document.createTextNode(message.content));
+                    output.appendChild(div);
+                }
+                
+                output.scrollTop = output.scrollHeight;
+            }
+            
+            function renderResult(result, startTime) {
+                const responseTime = ((Date.now() - startTime) / 1000).toFixed(2);
+                
+                if (!result.success) {
+                    return renderError('Error', result.error || 'Unknown error');
+                }
+                
+                // Mostrar respuesta AI
+                const div = document.createElement('div');
+                div.className = 'ai-response';
+                div.innerHTML = `
+                    🧠 <strong>AI Narrator:</strong> ${result.message}
+                    <div class="ai-meta">
+                        AI Confidence: ${(result.ai_confidence * 100).toFixed(1)}% | 
+                        Personality: ${result.ai_personality} | 
+                        Response: ${responseTime}s
+                    </div>
+                `;
+                
+                // Actualizar sugerencias
+                if (result.suggestions && result.suggestions.length > 0) {
+                    const suggestionsDiv = document.getElementById('aiSuggestions');
+                    suggestionsDiv.innerHTML = `
+                        <div class="suggestions">
+                            ${result.suggestions.map(s => `• ${s}`).join('<br>')}
+                        </div>
+                    `;
+                }
+                
+                // Actualizar status
+                document.getElementById('aiConfidence').textContent = 
+                    `${(result.ai_confidence * 100).toFixed(0)}%`;
+                document.getElementById('responseTime').textContent = `${responseTime}s`;
+                
+                return div;
+            }
+            
+            function renderError(title, detail) {
+                const div = document.createElement('div');
+                div.style.cssText = 'background: rgba(255, 0, 0, 0.1); border-left: 3px solid #ff4444; padding: 15px; margin: 10px 0; border-radius: 5px;';
+                div.innerHTML = `❌ <strong>${title}:</strong> ${detail}`;
+                return div;
+            }
+            
+            function finishCommand() {
+                const output = document.getElementById('gameOutput');
+                output.scrollTop = output.scrollHeight;
+                isProcessing = false;
+                document.getElementById('commandInput').focus();
+            }
             
             async function sendCommand(cmd = null) {
                 if (isProcessing) return;
@@ -445,11 +573,11 @@ async def get_interface():
                 isProcessing = true;
                 
                 // Mostrar comando del usuario
-                output.innerHTML += `
+                output.insertAdjacentHTML('beforeend', `
                     <div style="margin: 10px 0; padding: 10px; background: rgba(74, 158, 255, 0.1); border-radius: 5px;">
                         <strong>You:</strong> ${command}
                     </div>
-                `;
+                `);
                 
                 // Mostrar loading
                 const loadingDiv = document.createElement('div');
@@ -460,9 +588,17 @@ async def get_interface():
                 
                 if (!cmd) input.value = '';
                 
+                const startTime = Date.now();
+                
+                if (socket && socket.readyState === WebSocket.OPEN) {
+                    // handleSocketMessage termina el comando al llegar la respuesta
+                    pending = { loadingDiv, startTime, streamDiv: null, streamText: null };
+                    socket.send(JSON.stringify({ type: 'command', command: command }));
+                    return;
+                }
+                
+                // Sin WebSocket: petición HTTP sin streaming
                 try {
-                    const startTime = Date.now();
-                    
                     const response = await fetch('/api/command', {
                         method: 'POST',
                         headers: { 'Content-Type': 'application/json' },
@@ -473,63 +609,13 @@ async def get_interface():
                     });
                     
                     const result = await response.json();
-                    const responseTime = ((Date.now() - startTime) / 1000).toFixed(2);
-                    
-                    // Remover loading
-                    output.removeChild(loadingDiv);
-                    
-                    if (result.success) {
-                        // Mostrar respuesta AI
-                        output.innerHTML += `
-                            <div class="ai-response">
-                                🧠 <strong>AI Narrator:</strong> ${result.message}
-                                <div class="ai-meta">
-                                    AI Confidence: ${(result.ai_confidence * 100).toFixed(1)}% | 
-                                    Personality: ${result.ai_personality} | 
-                                    Response: ${responseTime}s
-                                </div>
-                            </div>
-                        `;
-                        
-                        // Actualizar sugerencias
-                        if (result.suggestions && result.suggestions.length > 0) {
-                            const suggestionsDiv = document.getElementById('aiSuggestions');
-                            suggestionsDiv.innerHTML = `
-                                <div class="suggestions">
-                                    ${result.suggestions.map(s => `• ${s}`).join('<br>')}
-                                </div>
-                            `;
-                        }
-                        
-                        // Actualizar status
-                        document.getElementById('aiConfidence').textContent = 
-                            `${(result.ai_confidence * 100).toFixed(0)}%`;
-                        document.getElementById('responseTime').textContent = `${responseTime}s`;
-                        
-                    } else {
-                        output.innerHTML += `
-                            <div style="background: rgba(255, 0, 0, 0.1); border-left: 3px solid #ff4444; padding: 15px; margin: 10px 0; border-radius: 5px;">
-                                ❌ <strong>Error:</strong> ${result.error || 'Unknown error'}
-                            </div>
-                        `;
-                    }
+                    loadingDiv.replaceWith(renderResult(result, startTime));
                     
                 } catch (error) {
-                    // Remover loading
-                    if (output.contains(loadingDiv)) {
-                        output.removeChild(loadingDiv);
-                    }
-                    
-                    output.innerHTML += `
-                        <div style="background: rgba(255, 0, 0, 0.1); border-left: 3px solid #ff4444; padding: 15px; margin: 10px 0; border-radius: 5px;">
-                            ❌ <strong>Connection Error:</strong> ${error.message}
-                        </div>
-                    `;
+                    loadingDiv.replaceWith(renderError('Connection Error', error.message));
                 }
                 
-                output.scrollTop = output.scrollHeight;
-                isProcessing = false;
-                input.focus();
+                finishCommand();
             }
             
             function quickCommand(cmd) {
@@ -554,11 +640,11 @@ async def get_interface():
                     
                     if (result.success) {
                         const output = document.getElementById('gameOutput');
-                        output.innerHTML += `
+                        output.insertAdjacentHTML('beforeend', `
                             <div style="background: rgba(157, 78, 221, 0.1); border-left: 3px solid #9d4edd; padding: 10px; margin: 10px 0; border-radius: 5px;">
                                 🎭 <strong>AI Personality changed to:</strong> ${personality}
                             </div>
-                        `;
+                        `);
                         output.scrollTop = output.scrollHeight;
                     }
                 } catch (error) {
@@ -572,7 +658,7 @@ async def get_interface():
                     const insights = await response.json();
                     
                     const output = document.getElementById('gameOutput');
-                    output.innerHTML += `
+                    output.insertAdjacentHTML('beforeend', `
                         <div style="background: rgba(0, 255, 0, 0.1); border-left: 3px solid #00ff00; padding: 15px; margin: 10px 0; border-radius: 5px;">
                             📊 <strong>AI Insights:</strong><br>
                             • Play Style: ${insights.player_behavior?.play_style || 'unknown'}<br>
@@ -580,7 +666,7 @@ async def get_interface():
                             • Avg Response Time: ${(insights.system_stats?.avg_response_time || 0).toFixed(2)}s<br>
                             • Player Satisfaction: ${((insights.system_stats?.player_satisfaction || 0) * 100).toFixed(1)}%
                         </div>
-                    `;
+                    `);
                     output.scrollTop = output.scrollHeight;
                     
                 } catch (error) {
@@ -590,6 +676,7 @@ async def get_interface():
             
             // Focus en input al cargar
             document.getElementById('commandInput').focus();
+            connectSocket();
             
             // Auto-completar básico
             document.getElementById('commandInput').addEventListener('input', function(e) {
@@ -684,6 +771,7 @@ async def get_status():
         
         return {
             "ai_game_available": ai_game is not None,
+            "vector_search": ai_game.get_vector_readiness() if ai_game else get_vector_service().get_stats(),
             "connection_stats": connection_stats,
             "ai_stats": ai_stats,
             "timestamp": datetime.now().isoformat()
@@ -799,12 +887,29 @@ async def websocket_endpoint(websocket: WebSocket, player_id: str):
             message = json.loads(data)
             
             if message.get("type") == "command" and ai_game:
-                result = await ai_game.process_command(player_id, message.get("command", ""))
+                command = message.get("command", "")
+                
+                # Fragmentos de la narración según se generan; el mensaje
+                # "response" final lleva el resultado estructurado completo
+                async def send_chunk(chunk: str):
+                    await websocket.send_text(json.dumps({
+                        "type": "response_chunk",
+                        "command": command,
+                        "content": chunk
+                    }))
+                
+                result = await ai_game.process_command(player_id, command, on_token=send_chunk)
                 await websocket.send_text(json.dumps({
                     "type": "response",
                     "result": result
                 }))
             
+            elif message.get("type") == "command":
+                await websocket.send_text(json.dumps({
+                    "type": "response",
+                    "result": {"success": False, "error": "AI Game not available"}
+                }))
+            
     except WebSocketDisconnect:
         if player_id in active_connections:
             del active_connections[player_id]
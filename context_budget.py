@@ -0,0 +1,145 @@
+"""
+Ensamblador de Contexto con Presupuesto de Tokens para Adventure Game
+Ordena las secciones del prompt por prioridad y recorta o resume las
+menos importantes para no superar el presupuesto del modelo
+"""
+
+import math
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+
+# Presupuesto de tokens del prompt de sistema por familia de modelo
+MODEL_CONTEXT_BUDGETS = {
+    'llama3.2': 1536,
+    'llama3.1': 3072,
+    'llama3': 2048,
+    'mistral': 2048,
+}
+DEFAULT_CONTEXT_BUDGET = 1536
+CONTEXT_BUDGET_ENV = "CONTEXT_TOKEN_BUDGET"
+
+# Estimación sin tokenizador: ~4 caracteres por token en español/inglés
+CHARS_PER_TOKEN = 4.0
+
+# Prioridades habituales (menor = más importante)
+PRIORITY_REQUIRED = 0
+PRIORITY_LOCATION = 1
+PRIORITY_OBJECTS = 2
+PRIORITY_QUERY = 3
+PRIORITY_ACTIVITY = 4
+PRIORITY_SEMANTIC = 5
+PRIORITY_CAPABILITIES = 6
+PRIORITY_GUIDANCE = 8
+
+# Estados de una sección en el informe del ensamblador
+SECTION_FULL = "full"
+SECTION_SUMMARY = "summary"
+SECTION_TRIMMED = "trimmed"
+SECTION_DROPPED = "dropped"
+
+
+def estimate_tokens(text: str) -> int:
+    """Tokens aproximados de un texto"""
+    return math.ceil(len(text or '') / CHARS_PER_TOKEN)
+
+
+def context_budget_for_model(model: str) -> int:
+    """Presupuesto configurado (CONTEXT_TOKEN_BUDGET) o el de la familia del modelo"""
+    configured = os.getenv(CONTEXT_BUDGET_ENV)
+    if configured:
+        return int(configured)
+
+    name = (model or '').lower()
+    # El prefijo más largo gana ("llama3.2" antes que "llama3")
+    for family in sorted(MODEL_CONTEXT_BUDGETS, key=len, reverse=True):
+        if name.startswith(family):
+            return MODEL_CONTEXT_BUDGETS[family]
+    return DEFAULT_CONTEXT_BUDGET
+
+
+@dataclass(frozen=True)
+class ContextSection:
+    """Bloque del prompt con su prioridad y, opcionalmente, una versión corta"""
+    name: str
+    text: str
+    priority: int
+    summary: Optional[str] = None
+    required: bool = False
+
+
+class ContextAssembler:
+    """
+    Ensambla secciones dentro de un presupuesto de tokens
+
+    Las secciones se admiten por prioridad: primero las obligatorias,
+    después cada una entera, su resumen o sus primeras líneas según lo
+    que quede. El texto final conserva el orden en que se añadieron.
+    """
+
+    def __init__(self, budget_tokens: int, separator: str = "\n\n"):
+        self.budget_tokens = budget_tokens
+        self.separator = separator
+        self.sections: List[ContextSection] = []
+        self.report: List[Dict[str, Any]] = []
+
+    def add(self, name: str, text: str, priority: int,
+            summary: Optional[str] = None, required: bool = False) -> 'ContextAssembler':
+        if text and text.strip():
+            self.sections.append(ContextSection(name, text.strip(), priority, summary, required))
+        return self
+
+    def extend(self, sections: List[ContextSection]) -> 'ContextAssembler':
+        for section in sections:
+            self.add(section.name, section.text, section.priority,
+                     section.summary, section.required)
+        return self
+
+    def assemble(self) -> str:
+        """Texto final dentro del presupuesto; el detalle queda en `report`"""
+        separator_cost = estimate_tokens(self.separator)
+        remaining = self.budget_tokens
+        chosen: Dict[int, str] = {}
+        report: Dict[int, Dict[str, Any]] = {}
+
+        order = sorted(range(len(self.sections)),
+                       key=lambda i: (not self.sections[i].required, self.sections[i].priority, i))
+
+        for i in order:
+            section = self.sections[i]
+            available = remaining - (separator_cost if chosen else 0)
+            text, status = self._fit(section, available)
+
+            if text is None:
+                report[i] = {'section': section.name, 'status': SECTION_DROPPED, 'tokens': 0}
+                continue
+
+            cost = estimate_tokens(text) + (separator_cost if chosen else 0)
+            remaining -= cost
+            chosen[i] = text
+            report[i] = {'section': section.name, 'status': status, 'tokens': estimate_tokens(text)}
+
+        self.report = [report[i] for i in range(len(self.sections))]
+        return self.separator.join(chosen[i] for i in sorted(chosen))
+
+    def _fit(self, section: ContextSection, available: int):
+        """(texto, estado) que cabe en `available` tokens, o (None, ...) si nada cabe"""
+        if section.required or estimate_tokens(section.text) <= available:
+            return section.text, SECTION_FULL
+
+        if section.summary and estimate_tokens(section.summary) <= available:
+            return section.summary, SECTION_SUMMARY
+
+        # Primeras líneas (la cabecera más al menos una entrada)
+        lines = section.text.split("\n")
+        for keep in range(len(lines) - 1, 1, -1):
+            trimmed = "\n".join(lines[:keep] + [f"  … ({len(lines) - keep} líneas omitidas)"])
+            if estimate_tokens(trimmed) <= available:
+                return trimmed, SECTION_TRIMMED
+
+        return None, SECTION_DROPPED
+
+    @property
+    def used_tokens(self) -> int:
+        return sum(entry['tokens'] for entry in self.report)
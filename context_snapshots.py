@@ -0,0 +1,162 @@
+"""
+Instantáneas de Contexto por Ubicación para Adventure Game
+Mantiene el contexto renderizado de cada ubicación activa y lo regenera
+en segundo plano solo cuando cambia, para que el camino de petición sea
+una simple consulta
+"""
+
+import asyncio
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+# build(location_id) -> secciones estáticas renderizadas (o None si no existe)
+StaticBuilder = Callable[[str], Awaitable[Optional[Tuple[Any, ...]]]]
+# load_activity(location_id) -> actividad reciente, más reciente primero
+ActivityLoader = Callable[[str], Awaitable[List[Dict[str, Any]]]]
+
+
+@dataclass
+class LocationSnapshot:
+    """Contexto renderizado de una ubicación"""
+    version: Hashable
+    static: Tuple[Any, ...]
+    activity: List[Dict[str, Any]]
+
+
+class LocationSnapshotStore:
+    """
+    Almacén de instantáneas por ubicación
+
+    - La parte estática (ubicación, objetos, guías) se renderiza una vez
+      por versión del mundo de la ubicación y se regenera en segundo
+      plano, con un pequeño retardo para agrupar ráfagas de cambios
+    - La actividad reciente se mantiene de forma incremental con cada
+      evento, sin volver a consultar la base de datos
+    - Solo se siguen las ubicaciones consultadas (LRU de `max_locations`)
+
+    `on_change(location_id, event)` debe recibir los cambios del sistema
+    de memoria (ver PerfectMemorySystem.add_change_listener).
+    """
+
+    def __init__(self, build: StaticBuilder, load_activity: ActivityLoader,
+                 version: Callable[[str], Hashable], activity_size: int = 5,
+                 rebuild_delay: float = 0.05, max_locations: int = 256):
+        self.build = build
+        self.load_activity = load_activity
+        self.version = version
+        self.activity_size = activity_size
+        self.rebuild_delay = rebuild_delay
+        self.max_locations = max_locations
+
+        self._snapshots: "OrderedDict[str, LocationSnapshot]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Task] = {}
+
+        # Métricas
+        self.hits = 0
+        self.misses = 0
+        self.background_rebuilds = 0
+        self.activity_updates = 0
+
+        self.logger = logging.getLogger(__name__)
+
+    async def get(self, location_id: str) -> Optional[LocationSnapshot]:
+        """Instantánea vigente (la construye en el acto si falta o está obsoleta)"""
+        snapshot = self._snapshots.get(location_id)
+        if snapshot is not None and snapshot.version == self.version(location_id):
+            self._snapshots.move_to_end(location_id)
+            self.hits += 1
+            return snapshot
+
+        self.misses += 1
+        return await self._rebuild(location_id, keep_activity=snapshot is not None)
+
+    async def _rebuild(self, location_id: str, keep_activity: bool) -> Optional[LocationSnapshot]:
+        version = self.version(location_id)
+        static = await self.build(location_id)
+        if static is None:
+            return None
+
+        previous = self._snapshots.get(location_id)
+        if keep_activity and previous is not None:
+            activity = previous.activity
+        else:
+            activity = (await self.load_activity(location_id))[:self.activity_size]
+
+        snapshot = LocationSnapshot(version, static, activity)
+        # Si hubo cambios durante la construcción no se guarda: nace obsoleta
+        if version == self.version(location_id):
+            self._snapshots[location_id] = snapshot
+            self._snapshots.move_to_end(location_id)
+            while len(self._snapshots) > self.max_locations:
+                self._snapshots.popitem(last=False)
+        return snapshot
+
+    def on_change(self, location_id: str, event: Optional[Any] = None):
+        """
+        Cambio en una ubicación: un evento (`event`) se añade a la
+        actividad; un cambio del mundo (event=None) programa la regeneración
+        """
+        snapshot = self._snapshots.get(location_id)
+        if snapshot is None:
+            return  # Ubicación no seguida: se construirá al consultarla
+
+        if event is not None:
+            self._add_activity(snapshot, event)
+            return
+
+        self._schedule_rebuild(location_id)
+
+    def _add_activity(self, snapshot: LocationSnapshot, event: Any):
+        entry = {
+            'timestamp': event.timestamp.isoformat(),
+            'actor': event.actor,
+            'action': event.action,
+            'context': event.context
+        }
+        activity = sorted(snapshot.activity + [entry],
+                          key=lambda item: item['timestamp'], reverse=True)
+        snapshot.activity = activity[:self.activity_size]
+        self.activity_updates += 1
+
+    def _schedule_rebuild(self, location_id: str):
+        if location_id in self._pending:
+            return  # Ya hay una regeneración en cola: agrupa la ráfaga
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # Sin bucle: se regenerará al consultarla
+        self._pending[location_id] = loop.create_task(self._rebuild_later(location_id))
+
+    async def _rebuild_later(self, location_id: str):
+        try:
+            await asyncio.sleep(self.rebuild_delay)
+            snapshot = self._snapshots.get(location_id)
+            if snapshot is not None and snapshot.version != self.version(location_id):
+                await self._rebuild(location_id, keep_activity=True)
+                self.background_rebuilds += 1
+        except Exception as e:
+            self.logger.error(f"❌ Error regenerando contexto de {location_id}: {e}")
+        finally:
+            self._pending.pop(location_id, None)
+
+    async def close(self):
+        """Cancela las regeneraciones pendientes"""
+        pending = list(self._pending.values())
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'locations': len(self._snapshots),
+            'max_locations': self.max_locations,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'background_rebuilds': self.background_rebuilds,
+            'activity_updates': self.activity_updates,
+            'pending_rebuilds': len(self._pending)
+        }
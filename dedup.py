@@ -0,0 +1,234 @@
+"""
+Supresión de Casi-Duplicados para Adventure Game
+Colapsa documentos casi idénticos antes de indexarlos
+Hash exacto del texto normalizado + MinHash de shingles con bandas LSH
+"""
+
+import hashlib
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16  # 16 bandas de 4 filas: candidatos a partir de Jaccard ~0.5
+SHINGLE_SIZE = 3
+
+# Memoria acotada: canónicos recordados (los inactivos más antiguos se
+# olvidan), ids de duplicados conservados como muestra y variantes
+# exactas (hash) por canónico
+DEFAULT_MAX_CANONICAL = 50000
+DUPLICATE_ID_SAMPLE = 16
+MAX_HASHES_PER_GROUP = 8
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_PERMUTATIONS = [
+    (int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), 'big') % _MERSENNE_PRIME | 1,
+     int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), 'big') % _MERSENNE_PRIME)
+    for i in range(MINHASH_PERMUTATIONS)
+]
+
+_TIMESTAMP_FIELD = re.compile(r"timestamp:\s*[^|]*", re.IGNORECASE)
+_ISO_DATETIME = re.compile(r"\d{4}-\d{2}-\d{2}(?:[t ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?(?:z|[+-]\d{2}:?\d{2})?")
+# Números sueltos; los que forman parte de ids (uuid, obj_12) se conservan
+_NUMBER = re.compile(r"(?<![\w-])\d+(?:[.,]\d+)?(?![\w-])")
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize_for_dedup(text: str) -> str:
+    """
+    Normaliza un documento para detectar repeticiones
+
+    Minúsculas, sin acentos, sin timestamps ni números sueltos. Los ids
+    de entidades se mantienen: "mover martillo" y "mover sierra" no son
+    duplicados aunque el resto del texto coincida.
+    """
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+    text = _TIMESTAMP_FIELD.sub('', text)
+    text = _ISO_DATETIME.sub(' ', text)
+    text = _NUMBER.sub('#', text)
+    return ' '.join(text.split())
+
+
+def content_hash(normalized: str) -> str:
+    """Hash exacto del texto normalizado"""
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def shingles(normalized: str, shingle_size: int = SHINGLE_SIZE) -> set:
+    """Conjunto de shingles de palabras"""
+    tokens = _TOKEN.findall(normalized)
+    if len(tokens) < shingle_size:
+        return {' '.join(tokens) or normalized}
+    return {' '.join(tokens[i:i + shingle_size]) for i in range(len(tokens) - shingle_size + 1)}
+
+
+def minhash(normalized: str) -> Tuple[int, ...]:
+    """Firma MinHash de los shingles del texto"""
+    hashes = [
+        int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+        for shingle in shingles(normalized)
+    ]
+    return tuple(
+        min(((a * value + b) % _MERSENNE_PRIME) & _MAX_HASH for value in hashes)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def estimated_jaccard(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    """Similitud de Jaccard estimada a partir de dos firmas"""
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+
+@dataclass
+class DuplicateGroup:
+    """Documento canónico que representa varias apariciones"""
+    doc_id: str
+    signature: Tuple[int, ...]
+    content: str
+    metadata: Dict[str, Any]
+    count: int = 1
+    first_seen: str = ''
+    last_seen: str = ''
+    # Últimos DUPLICATE_ID_SAMPLE ids colapsados; el total está en `count`
+    duplicate_ids: List[str] = field(default_factory=list)
+    hashes: List[str] = field(default_factory=list)
+
+
+class NearDuplicateIndex:
+    """
+    Índice en memoria de documentos canónicos
+
+    - Duplicado exacto: mismo hash del texto normalizado
+    - Casi-duplicado: Jaccard estimada (MinHash) >= `threshold`,
+      comparando solo con candidatos que comparten una banda LSH
+
+    Al colapsar se actualiza la metadata del canónico con
+    occurrence_count, first_seen y last_seen (rango temporal).
+
+    Se recuerdan como mucho `max_canonical` canónicos: al superarlo se
+    olvida el que lleva más tiempo sin repetirse y su siguiente
+    aparición pasa a ser un canónico nuevo.
+    """
+
+    def __init__(self, threshold: float = 0.8, max_canonical: int = DEFAULT_MAX_CANONICAL):
+        self.threshold = threshold
+        self.max_canonical = max_canonical
+        self._lock = threading.Lock()
+        self._by_hash: Dict[str, DuplicateGroup] = {}
+        self._bands: List[Dict[Tuple[int, ...], List[DuplicateGroup]]] = [{} for _ in range(LSH_BANDS)]
+        # Canónicos por doc_id, del menos al más recientemente visto
+        self._groups: "OrderedDict[str, DuplicateGroup]" = OrderedDict()
+
+        self.documents_seen = 0
+        self.duplicates_collapsed = 0
+        self.canonical_evicted = 0
+
+    @staticmethod
+    def _band_keys(signature: Tuple[int, ...]) -> List[Tuple[int, ...]]:
+        rows = MINHASH_PERMUTATIONS // LSH_BANDS
+        return [signature[band * rows:(band + 1) * rows] for band in range(LSH_BANDS)]
+
+    def _find_near(self, signature: Tuple[int, ...]) -> Optional[DuplicateGroup]:
+        best: Optional[Tuple[float, DuplicateGroup]] = None
+        for band, key in enumerate(self._band_keys(signature)):
+            for group in self._bands[band].get(key, ()):
+                similarity = estimated_jaccard(signature, group.signature)
+                if similarity >= self.threshold and (best is None or similarity > best[0]):
+                    best = (similarity, group)
+        return best[1] if best else None
+
+    def check(self, doc_id: str, content: str, metadata: Dict[str, Any],
+              seen_at: str) -> Optional[DuplicateGroup]:
+        """
+        Registra un documento
+
+        Si es (casi) duplicado de un canónico existente, actualiza el
+        grupo y lo retorna; el llamador no debe indexar el documento.
+        Si es nuevo, lo registra como canónico (añadiendo los campos de
+        ocurrencia a `metadata`) y retorna None.
+        """
+        normalized = normalize_for_dedup(content)
+        digest = content_hash(normalized)
+
+        with self._lock:
+            self.documents_seen += 1
+
+            group = self._by_hash.get(digest)
+            if group is None:
+                signature = minhash(normalized)
+                group = self._find_near(signature)
+            if group is not None and group.doc_id != doc_id:
+                if digest not in self._by_hash and len(group.hashes) < MAX_HASHES_PER_GROUP:
+                    self._by_hash[digest] = group
+                    group.hashes.append(digest)
+                group.count += 1
+                group.duplicate_ids.append(doc_id)
+                if len(group.duplicate_ids) > DUPLICATE_ID_SAMPLE:
+                    del group.duplicate_ids[0]
+                self._groups.move_to_end(group.doc_id)
+                if seen_at:
+                    group.first_seen = min(group.first_seen or seen_at, seen_at)
+                    group.last_seen = max(group.last_seen or seen_at, seen_at)
+                # Se muta el mismo dict: si el canónico sigue en cola, se escribe ya actualizado
+                group.metadata.update(self._occurrence_fields(group))
+                self.duplicates_collapsed += 1
+                return group
+
+            if group is None:
+                group = DuplicateGroup(doc_id, signature, content, metadata,
+                                       first_seen=seen_at, last_seen=seen_at, hashes=[digest])
+                self._by_hash[digest] = group
+                for band, key in enumerate(self._band_keys(signature)):
+                    self._bands[band].setdefault(key, []).append(group)
+                self._groups[doc_id] = group
+                while len(self._groups) > self.max_canonical:
+                    self._evict(self._groups.popitem(last=False)[1])
+            else:
+                # Reindexación del propio canónico: su nueva metadata pasa a ser la de referencia
+                group.content = content
+                group.metadata = metadata
+                self._groups.move_to_end(doc_id)
+
+            metadata.update(self._occurrence_fields(group))
+            return None
+
+    def _evict(self, group: DuplicateGroup):
+        """Olvida un canónico (hashes y bandas LSH)"""
+        for digest in group.hashes:
+            if self._by_hash.get(digest) is group:
+                del self._by_hash[digest]
+        for band, key in enumerate(self._band_keys(group.signature)):
+            members = self._bands[band].get(key)
+            if members is None:
+                continue
+            members[:] = [member for member in members if member is not group]
+            if not members:
+                del self._bands[band][key]
+        self.canonical_evicted += 1
+
+    @staticmethod
+    def _occurrence_fields(group: DuplicateGroup) -> Dict[str, Any]:
+        return {
+            'occurrence_count': group.count,
+            'first_seen': group.first_seen or '',
+            'last_seen': group.last_seen or ''
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Métricas de supresión"""
+        with self._lock:
+            return {
+                'canonical_documents': len(self._groups),
+                'canonical_evicted': self.canonical_evicted,
+                'documents_seen': self.documents_seen,
+                'duplicates_collapsed': self.duplicates_collapsed,
+                'suppression_rate': (
+                    self.duplicates_collapsed / self.documents_seen if self.documents_seen else 0.0
+                )
+            }
@@ -0,0 +1,218 @@
+"""
+Registro de Modelos de Embeddings para Adventure Game
+Anota qué modelo y qué dimensión tiene cada colección vectorial y
+evita que una colección mezcle vectores de modelos distintos
+"""
+
+import json
+import os
+import re
+import threading
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+
+REGISTRY_FILENAME = "embedding_registry.json"
+
+
+class EmbeddingDimensionMismatch(ValueError):
+    """Vectores con una dimensión distinta de la registrada para la colección"""
+
+
+@dataclass
+class CollectionEmbedding:
+    """Modelo con el que están calculados los vectores de una colección"""
+    collection: str       # Nombre lógico ("game_events", "rag_memories"...)
+    physical_name: str    # Colección ChromaDB que guarda los vectores
+    model: str
+    dimension: int
+    updated_at: str = ''
+
+
+def physical_collection_name(collection: str, model: str) -> str:
+    """Nombre de la colección ChromaDB de `collection` para otro modelo"""
+    slug = re.sub(r'[^a-z0-9]+', '-', model.lower()).strip('-')
+    # ChromaDB admite hasta 63 caracteres y exige terminar en alfanumérico
+    return f"{collection}__{slug}"[:63].rstrip('-_.')
+
+
+class EmbeddingRegistry:
+    """
+    Registro persistente (JSON) del modelo activo y de cada colección
+
+    Las escrituras son atómicas (fichero temporal + os.replace): un corte
+    de modelo actualiza todas las colecciones de una vez o ninguna.
+    """
+
+    def __init__(self, directory: Path):
+        self.path = Path(directory) / REGISTRY_FILENAME
+        self._lock = threading.Lock()
+        self._data: Dict[str, Any] = {'active_model': None, 'collections': {}, 'retired': []}
+        if self.path.exists():
+            self._data.update(json.loads(self.path.read_text(encoding='utf-8')))
+
+    @property
+    def active_model(self) -> Optional[str]:
+        """Modelo con el que se sirven las consultas (None si aún no hay colecciones)"""
+        return self._data.get('active_model')
+
+    def get(self, collection: str) -> Optional[CollectionEmbedding]:
+        entry = self._data['collections'].get(collection)
+        return CollectionEmbedding(**entry) if entry else None
+
+    def collections(self) -> List[CollectionEmbedding]:
+        return [CollectionEmbedding(**entry) for entry in self._data['collections'].values()]
+
+    def register(self, entry: CollectionEmbedding):
+        """Registra una colección nueva con el modelo activo"""
+        with self._lock:
+            entry.updated_at = entry.updated_at or datetime.now().isoformat()
+            self._data['collections'][entry.collection] = asdict(entry)
+            self._data['active_model'] = self._data.get('active_model') or entry.model
+            self._save()
+
+    def cutover(self, model: str, entries: List[CollectionEmbedding], retired: List[str]):
+        """Cambia de una vez el modelo activo y la colección física de cada entrada"""
+        with self._lock:
+            now = datetime.now().isoformat()
+            for entry in entries:
+                entry.updated_at = now
+                self._data['collections'][entry.collection] = asdict(entry)
+            self._data['active_model'] = model
+            self._data['retired'] = sorted(set(self._data.get('retired', [])) | set(retired))
+            self._save()
+
+    def _save(self):
+        temporary = self.path.with_suffix('.tmp')
+        temporary.write_text(json.dumps(self._data, indent=2, ensure_ascii=False), encoding='utf-8')
+        os.replace(temporary, self.path)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return json.loads(json.dumps(self._data))
+
+
+class GuardedCollection:
+    """
+    Colección ChromaDB con control de dimensión y escritura dual
+
+    - add/upsert/update rechazan vectores de otra dimensión
+      (EmbeddingDimensionMismatch) en lugar de corromper el índice
+    - Durante una migración de modelo cada escritura se replica en la
+      colección sombra, re-codificando los documentos con el modelo nuevo
+    - En el corte la sombra pasa a ser la colección servida; las consultas
+      que aún llegan con vectores del modelo anterior van a la colección
+      retirada mientras su dimensión la distinga
+
+    El resto de métodos (get, count, modify...) se delegan sin cambios.
+    """
+
+    def __init__(self, target, entry: CollectionEmbedding,
+                 creation_metadata: Optional[Dict[str, Any]] = None):
+        self._lock = threading.RLock()
+        self._target = target
+        self.entry = entry
+        self.creation_metadata = creation_metadata
+
+        self._shadow = None
+        self._shadow_encode: Optional[Callable[[List[str]], Any]] = None
+        self._previous = None
+
+    def __getattr__(self, attribute):
+        return getattr(self._target, attribute)
+
+    @property
+    def target(self):
+        """Colección ChromaDB servida actualmente"""
+        return self._target
+
+    @property
+    def shadow(self):
+        """Colección sombra de la migración en curso (o None)"""
+        return self._shadow
+
+    def _check_dimension(self, embeddings: Optional[List[Any]]):
+        if embeddings is None:
+            return
+        for embedding in embeddings:
+            if len(embedding) != self.entry.dimension:
+                raise EmbeddingDimensionMismatch(
+                    f"{self.entry.collection}: vector de {len(embedding)} dimensiones, "
+                    f"la colección usa {self.entry.dimension} ({self.entry.model})"
+                )
+
+    def _write(self, method: str, ids: List[str], embeddings=None, documents=None,
+               metadatas=None):
+        self._check_dimension(embeddings)
+        with self._lock:
+            target, shadow, encode = self._target, self._shadow, self._shadow_encode
+
+        kwargs = {'ids': ids}
+        if embeddings is not None:
+            kwargs['embeddings'] = embeddings
+        if documents is not None:
+            kwargs['documents'] = documents
+        if metadatas is not None:
+            kwargs['metadatas'] = metadatas
+        getattr(target, method)(**kwargs)
+
+        if shadow is not None and documents is not None:
+            shadow.upsert(**{**kwargs, 'embeddings': np.asarray(encode(list(documents))).tolist()})
+
+    def add(self, ids: List[str], embeddings=None, documents=None, metadatas=None):
+        self._write('add', ids, embeddings, documents, metadatas)
+
+    def upsert(self, ids: List[str], embeddings=None, documents=None, metadatas=None):
+        self._write('upsert', ids, embeddings, documents, metadatas)
+
+    def update(self, ids: List[str], embeddings=None, documents=None, metadatas=None):
+        if embeddings is not None or documents is not None:
+            self._write('update', ids, embeddings, documents, metadatas)
+            return
+        with self._lock:
+            targets = [self._target] + ([self._shadow] if self._shadow is not None else [])
+        for target in targets:
+            target.update(ids=ids, metadatas=metadatas)
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        with self._lock:
+            targets = [self._target] + ([self._shadow] if self._shadow is not None else [])
+        kwargs = {key: value for key, value in (('ids', ids), ('where', where)) if value is not None}
+        for target in targets:
+            target.delete(**kwargs)
+
+    def query(self, query_embeddings=None, query_texts=None, **kwargs):
+        with self._lock:
+            target, previous = self._target, self._previous
+        if (query_embeddings is not None and previous is not None
+                and len(query_embeddings[0]) != self.entry.dimension
+                and len(query_embeddings[0]) == previous[1]):
+            target = previous[0]
+        if query_embeddings is not None:
+            kwargs['query_embeddings'] = query_embeddings
+        if query_texts is not None:
+            kwargs['query_texts'] = query_texts
+        return target.query(**kwargs)
+
+    def start_dual_write(self, shadow, encode: Callable[[List[str]], Any]):
+        """Replica las escrituras en `shadow` con vectores del modelo nuevo"""
+        with self._lock:
+            self._shadow = shadow
+            self._shadow_encode = encode
+
+    def abort_dual_write(self):
+        with self._lock:
+            self._shadow = None
+            self._shadow_encode = None
+
+    def cutover(self, entry: CollectionEmbedding):
+        """La sombra pasa a ser la colección servida"""
+        with self._lock:
+            self._previous = (self._target, self.entry.dimension)
+            self._target = self._shadow
+            self.entry = entry
+            self._shadow = None
+            self._shadow_encode = None
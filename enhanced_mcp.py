@@ -7,13 +7,28 @@ Versión 1.1.0 - Vector Search Integration
 import asyncio
 import json
 import logging
+import threading
 from typing import Dict, List, Any, Optional
 from datetime import datetime
 
+from context_budget import ContextSection, PRIORITY_GUIDANCE, PRIORITY_SEMANTIC
 from mcp_integration import MCPContextProvider
 from vector_search import VectorSearchEngine, SearchResult
 
 
+# Techo de latencia del contexto vectorial (segundos): las secciones se
+# calculan en paralelo y la que no termina a tiempo se descarta
+VECTOR_CONTEXT_DEADLINE = 1.5
+
+# Presupuesto de cada sección (acotado por VECTOR_CONTEXT_DEADLINE)
+VECTOR_CONTEXT_SECTION_BUDGETS = {
+    'inventory': 1.0,
+    'location_patterns': 1.5,
+    'actions': 1.0,
+    'suggestions': 1.5,
+}
+
+
 class EnhancedMCPProvider(MCPContextProvider):
     """
     Proveedor MCP mejorado con búsqueda vectorial
@@ -25,21 +40,75 @@ class EnhancedMCPProvider(MCPContextProvider):
     - Recomendaciones inteligentes
     """
     
-    def __init__(self, memory_system, db_path: str = "adventure_game.db"):
+    def __init__(self, memory_system, db_path: str = "adventure_game.db",
+                 vector_db_path: str = "./vector_db"):
         super().__init__(memory_system)
         
         # Inicializar motor de búsqueda vectorial
-        self.vector_engine = VectorSearchEngine(db_path)
+        self.vector_engine = VectorSearchEngine(db_path, vector_db_path)
         self.vector_initialized = False
+        self._warmup_thread: Optional[threading.Thread] = None
+        
+        # Presupuestos del contexto vectorial y secciones descartadas por tiempo
+        self.vector_context_deadline = VECTOR_CONTEXT_DEADLINE
+        self.vector_context_budgets = dict(VECTOR_CONTEXT_SECTION_BUDGETS)
+        self.vector_context_stats = {'builds': 0, 'dropped': {}, 'skipped': {}}
+        
+        # Secciones descartadas cuyo trabajo en hilos aún no ha terminado
+        self._pending_context_sections: Dict[str, asyncio.Task] = {}
         
         self.logger = logging.getLogger(__name__)
     
+    def start_vector_warmup(self):
+        """
+        Carga el modelo e indexa los datos existentes en segundo plano
+        
+        Mientras tanto las peticiones no esperan: las búsquedas usan el
+        índice léxico y la caché hasta que el modelo esté caliente.
+        """
+        if self._warmup_thread is not None or self.vector_initialized:
+            return
+        
+        self.vector_engine.start_warmup()
+        self._warmup_thread = threading.Thread(
+            target=self._run_vector_warmup, name="vector-index-warmup", daemon=True
+        )
+        self._warmup_thread.start()
+    
+    def _run_vector_warmup(self):
+        """Espera al modelo y ejecuta la indexación inicial en un bucle propio"""
+        if not self.vector_engine.vector_service.wait_until_ready():
+            self.logger.error("❌ Calentamiento vectorial fallido: se mantiene el modo léxico")
+            return
+        asyncio.run(self._initialize_vector_index())
+    
+    @property
+    def vector_warming_up(self) -> bool:
+        """Indica si la carga en segundo plano sigue en curso"""
+        return self._warmup_thread is not None and self._warmup_thread.is_alive()
+    
     async def initialize_vector_search(self):
-        """Inicializar sistema de búsqueda vectorial"""
+        """
+        Inicializar sistema de búsqueda vectorial
+        Si el calentamiento en segundo plano está en curso no bloquea
+        """
+        if self.vector_warming_up:
+            return
+        await self._initialize_vector_index()
+    
+    async def _initialize_vector_index(self):
+        """Indexación inicial desde SQLite (una sola vez)"""
         if not self.vector_initialized:
             try:
                 self.logger.info("🔄 Inicializando búsqueda vectorial...")
                 await self.vector_engine.initialize_from_existing_data()
+                await self.vector_engine.compact_object_vectors()
+                # Los eventos nuevos guardan su embedding en SQLite en segundo plano
+                vector_service = self.vector_engine.vector_service
+                self.memory.start_embedding_worker(
+                    vector_service.encode_in_background,
+                    model_name=lambda: vector_service.model_name
+                )
                 self.vector_initialized = True
                 self.logger.info("✅ Búsqueda vectorial inicializada")
             except Exception as e:
@@ -58,102 +127,177 @@ class EnhancedMCPProvider(MCPContextProvider):
         - Patrones de ubicación
         - Sugerencias basadas en similitud
         """
+        sections = await self.get_enhanced_context_sections(
+            current_location, player_inventory, recent_actions
+        )
+        return "\n\n".join(section.text for section in sections)
+    
+    async def get_enhanced_context_sections(self, current_location: str,
+                                            player_inventory: List[str],
+                                            recent_actions: List[str] = None) -> List[ContextSection]:
+        """Secciones del contexto enriquecido (ver ContextAssembler)"""
         
         # Asegurar que vector search esté inicializado
         await self.initialize_vector_search()
         
         # Obtener contexto base original
-        base_context = await self.generate_world_context_for_ai(
-            current_location
-        )
+        sections = await self.get_world_context_sections(current_location)
         
         if not self.vector_initialized:
-            return base_context + "\n\n[Búsqueda vectorial no disponible]"
+            notice = "[Búsqueda vectorial cargando]" if self.vector_warming_up \
+                else "[Búsqueda vectorial no disponible]"
+            return sections + [ContextSection('semantic_status', notice, PRIORITY_GUIDANCE)]
         
         try:
             # Contexto vectorial enriquecido
-            vector_context = await self._generate_vector_context(
+            vector_sections = await self._generate_vector_sections(
                 current_location, player_inventory, recent_actions or []
             )
-            
-            return f"""{base_context}
-
-=== ANÁLISIS SEMÁNTICO AVANZADO ===
-{vector_context}
-
-=== INSTRUCCIONES PARA IA ===
+        except Exception as e:
+            self.logger.error(f"Error generando contexto vectorial: {e}")
+            return sections + [ContextSection(
+                'semantic_status', f"[Error en análisis semántico: {e}]", PRIORITY_GUIDANCE
+            )]
+        
+        return sections + vector_sections + [ContextSection(
+            'semantic_guidance',
+            """=== INSTRUCCIONES PARA IA ===
 Tienes acceso a búsqueda semántica avanzada. Puedes:
 - Encontrar objetos similares: "objetos parecidos al martillo"
 - Buscar por función: "herramientas de carpintería"
 - Analizar patrones: "qué objetos aparecen juntos frecuentemente"
 - Búsqueda contextual: "objetos relacionados con construcción"
 
-Usa esta información para proporcionar respuestas más ricas y contextualmente relevantes."""
-            
-        except Exception as e:
-            self.logger.error(f"Error generando contexto vectorial: {e}")
-            return base_context + f"\n\n[Error en análisis semántico: {e}]"
+Usa esta información para proporcionar respuestas más ricas y contextualmente relevantes.""",
+            PRIORITY_GUIDANCE
+        )]
     
-    async def _generate_vector_context(self, current_location: str,
-                                     player_inventory: List[str],
-                                     recent_actions: List[str]) -> str:
-        """Genera contexto específico basado en búsqueda vectorial"""
-        
-        context_parts = []
-        
-        # 1. Análisis de objetos en inventario
-        if player_inventory:
-            inventory_context = await self._analyze_inventory_context(player_inventory)
-            if inventory_context:
-                context_parts.append(f"🎒 ANÁLISIS DE INVENTARIO:\n{inventory_context}")
-        
-        # 2. Análisis de patrones de ubicación actual
-        location_patterns = await self._analyze_current_location_patterns(current_location)
-        if location_patterns:
-            context_parts.append(f"🏠 PATRONES DE UBICACIÓN:\n{location_patterns}")
-        
-        # 3. Análisis de acciones recientes
-        if recent_actions:
-            action_context = await self._analyze_recent_actions_context(recent_actions)
-            if action_context:
-                context_parts.append(f"⚡ CONTEXTO DE ACCIONES:\n{action_context}")
-        
-        # 4. Sugerencias semánticas
-        suggestions = await self._generate_semantic_suggestions(
-            current_location, player_inventory, recent_actions
-        )
-        if suggestions:
-            context_parts.append(f"💡 SUGERENCIAS SEMÁNTICAS:\n{suggestions}")
+    async def _generate_vector_sections(self, current_location: str,
+                                        player_inventory: List[str],
+                                        recent_actions: List[str]) -> List[ContextSection]:
+        """
+        Secciones del contexto vectorial
         
-        return "\n\n".join(context_parts) if context_parts else "Sin contexto vectorial adicional disponible."
+        Se calculan en paralelo, cada una con su presupuesto de tiempo: la
+        que no termina a tiempo se omite (y se registra) en lugar de
+        retrasar el prompt, así que la latencia queda acotada por
+        vector_context_deadline sea cual sea el tamaño del mundo.
+        """
+        sections = [
+            # (nombre, título, prioridad, corrutina o None si no aplica)
+            ('inventory', "🎒 ANÁLISIS DE INVENTARIO", PRIORITY_SEMANTIC,
+             self._analyze_inventory_context(player_inventory) if player_inventory else None),
+            ('location_patterns', "🏠 PATRONES DE UBICACIÓN", PRIORITY_SEMANTIC + 1,
+             self._analyze_current_location_patterns(current_location)),
+            ('actions', "⚡ CONTEXTO DE ACCIONES", PRIORITY_SEMANTIC,
+             self._analyze_recent_actions_context(recent_actions) if recent_actions else None),
+            ('suggestions', "💡 SUGERENCIAS SEMÁNTICAS", PRIORITY_SEMANTIC + 1,
+             self._generate_semantic_suggestions(current_location, player_inventory, recent_actions)),
+        ]
+        sections = [section for section in sections if section[3] is not None]
+        
+        contents = await asyncio.gather(*[
+            self._run_context_section(name, coroutine) for name, _, _, coroutine in sections
+        ])
+        self.vector_context_stats['builds'] += 1
+        
+        context_sections = [
+            ContextSection(f"semantic_{name}", f"{title}:\n{content}", priority)
+            for (name, title, priority, _), content in zip(sections, contents) if content
+        ]
+        return context_sections or [ContextSection(
+            'semantic_empty', "Sin contexto vectorial adicional disponible.", PRIORITY_GUIDANCE
+        )]
+    
+    async def _run_context_section(self, name: str, coroutine) -> Optional[str]:
+        """
+        Ejecuta una sección del contexto vectorial dentro de su presupuesto
+        
+        Cancelar la sección no detiene el trabajo que ya está en un hilo
+        (asyncio.to_thread), así que la sección descartada sigue hasta
+        terminar en segundo plano y, mientras tanto, no se vuelve a lanzar:
+        como mucho hay una ejecución por sección ocupando el executor.
+        """
+        budget = min(self.vector_context_budgets.get(name, self.vector_context_deadline),
+                     self.vector_context_deadline)
+        
+        if name in self._pending_context_sections:
+            coroutine.close()
+            self._count_context_section(name, 'skipped')
+            self.logger.debug(f"⏭️ Sección de contexto '{name}' omitida: la anterior sigue en curso")
+            return None
+        
+        task = asyncio.ensure_future(coroutine)
+        self._pending_context_sections[name] = task
+        task.add_done_callback(lambda finished: self._context_section_finished(name, finished))
+        
+        done, _ = await asyncio.wait({task}, timeout=budget)
+        if not done:
+            self._count_context_section(name, 'dropped')
+            self.logger.warning(f"⏱️ Sección de contexto '{name}' descartada (> {budget:.2f}s)")
+            return None
+        
+        try:
+            return task.result()
+        except Exception as e:
+            self.logger.debug(f"Error en sección de contexto '{name}': {e}")
+        return None
+    
+    def _context_section_finished(self, name: str, task: asyncio.Task):
+        """Libera la sección y recoge el error de una ejecución ya descartada"""
+        self._pending_context_sections.pop(name, None)
+        if not task.cancelled() and task.exception() is not None:
+            self.logger.debug(f"Error en sección de contexto '{name}': {task.exception()}")
+    
+    def _count_context_section(self, name: str, outcome: str):
+        """Suma una sección descartada u omitida a las estadísticas"""
+        counts = self.vector_context_stats[outcome]
+        counts[name] = counts.get(name, 0) + 1
     
     async def _analyze_inventory_context(self, inventory: List[str]) -> str:
         """Analiza el inventario usando búsqueda vectorial"""
         analysis_parts = []
+        object_ids = inventory[:5]  # Limitar a 5 objetos principales
         
-        for object_id in inventory[:5]:  # Limitar a 5 objetos principales
-            try:
-                # Encontrar objetos similares
-                similar_objects = await self.vector_engine.find_similar_objects(object_id, limit=3)
-                
-                if similar_objects:
-                    object_info = await self.get_object_context(object_id)
-                    object_name = object_info.split(':')[0] if ':' in object_info else object_id
-                    
-                    similar_names = [
-                        result.document.metadata.get('name', 'Sin nombre')
-                        for result in similar_objects
-                    ]
-                    
-                    analysis_parts.append(
-                        f"  • {object_name}: Similar a {', '.join(similar_names[:2])}"
-                    )
-                    
-            except Exception as e:
-                self.logger.debug(f"Error analizando objeto {object_id}: {e}")
+        try:
+            # Una sola consulta por lotes con los embeddings ya almacenados
+            document_ids = await asyncio.to_thread(self.vector_engine.object_document_ids, object_ids)
+            similar_by_document = await self.vector_engine.similar_to_many(
+                list(document_ids.values()), k=3
+            )
+            object_names = self._get_object_names(object_ids)
+        except Exception as e:
+            self.logger.debug(f"Error analizando inventario: {e}")
+            return "Sin análisis de similitud disponible."
+        
+        for object_id in object_ids:
+            similar_objects = similar_by_document.get(document_ids.get(object_id), [])
+            if not similar_objects:
+                continue
+            
+            similar_names = [
+                result.document.metadata.get('name', 'Sin nombre')
+                for result in similar_objects
+            ]
+            
+            analysis_parts.append(
+                f"  • {object_names.get(object_id, object_id)}: Similar a {', '.join(similar_names[:2])}"
+            )
         
         return "\n".join(analysis_parts) if analysis_parts else "Sin análisis de similitud disponible."
     
+    def _get_object_names(self, object_ids: List[str]) -> Dict[str, str]:
+        """Nombres de varios objetos en una sola consulta"""
+        if not object_ids:
+            return {}
+        
+        placeholders = ", ".join("?" for _ in object_ids)
+        cursor = self.memory.db_connection.execute(
+            f"SELECT id, name FROM game_objects WHERE id IN ({placeholders})",
+            list(object_ids)
+        )
+        return {row[0]: row[1] for row in cursor.fetchall()}
+    
     async def _analyze_current_location_patterns(self, location_id: str) -> str:
         """Analiza patrones de la ubicación actual"""
         try:
@@ -209,13 +353,26 @@ Usa esta información para proporcionar respuestas más ricas y contextualmente
     async def _generate_semantic_suggestions(self, location_id: str,
                                            inventory: List[str],
                                            actions: List[str]) -> str:
-        """Genera sugerencias semánticas inteligentes"""
+        """Genera sugerencias semánticas inteligentes (búsquedas en paralelo)"""
         suggestions = []
         
+        async def no_results():
+            return []
+        
         try:
-            # Sugerencia 1: Objetos relacionados en ubicación actual
-            location_objects = await self.vector_engine.search_objects(
-                f"objetos ubicación {location_id}", limit=3
+            location_objects, similar_tools, related_locations = await asyncio.gather(
+                # Sugerencia 1: Objetos de la ubicación actual, ordenados por
+                # relevancia respecto a la última acción
+                self.vector_engine.search_scoped(
+                    'objects', actions[-1] if actions else None,
+                    limit=3, location_id=location_id
+                ),
+                # Sugerencia 2: Basada en último objeto del inventario
+                self.vector_engine.find_similar_objects(inventory[-1], limit=2)
+                if inventory else no_results(),
+                # Sugerencia 3: Basada en acciones recientes
+                self.vector_engine.search_locations(f"lugares para {actions[-1]}", limit=2)
+                if actions else no_results()
             )
             
             if location_objects:
@@ -225,31 +382,19 @@ Usa esta información para proporcionar respuestas más ricas y contextualmente
                 ]
                 suggestions.append(f"  • Objetos relevantes aquí: {', '.join(object_names)}")
             
-            # Sugerencia 2: Basada en último objeto del inventario
-            if inventory:
-                last_object = inventory[-1]
-                similar_tools = await self.vector_engine.find_similar_objects(last_object, limit=2)
-                
-                if similar_tools:
-                    tool_names = [
-                        result.document.metadata.get('name', 'herramienta')
-                        for result in similar_tools
-                    ]
-                    suggestions.append(f"  • Herramientas complementarias: {', '.join(tool_names)}")
+            if similar_tools:
+                tool_names = [
+                    result.document.metadata.get('name', 'herramienta')
+                    for result in similar_tools
+                ]
+                suggestions.append(f"  • Herramientas complementarias: {', '.join(tool_names)}")
             
-            # Sugerencia 3: Basada en acciones recientes
-            if actions:
-                last_action = actions[-1]
-                related_locations = await self.vector_engine.search_locations(
-                    f"lugares para {last_action}", limit=2
-                )
-                
-                if related_locations:
-                    location_names = [
-                        result.document.metadata.get('name', 'lugar')
-                        for result in related_locations
-                    ]
-                    suggestions.append(f"  • Lugares relevantes: {', '.join(location_names)}")
+            if related_locations:
+                location_names = [
+                    result.document.metadata.get('name', 'lugar')
+                    for result in related_locations
+                ]
+                suggestions.append(f"  • Lugares relevantes: {', '.join(location_names)}")
             
         except Exception as e:
             self.logger.debug(f"Error generando sugerencias: {e}")
@@ -264,14 +409,15 @@ Usa esta información para proporcionar respuestas más ricas y contextualmente
         - "herramientas de metal oxidadas"
         - "objetos para construir"
         - "cosas similares a un martillo"
+        
+        Usa búsqueda híbrida para que los nombres exactos ("martillo",
+        "llave de bronce") aparezcan primero. Mientras el modelo carga
+        responde solo con el índice léxico.
         """
         await self.initialize_vector_search()
         
-        if not self.vector_initialized:
-            return []
-        
         try:
-            results = await self.vector_engine.search_objects(description, limit)
+            results = await self.vector_engine.hybrid_search('objects', description, limit)
             
             formatted_results = []
             for result in results:
@@ -365,6 +511,10 @@ Usa esta información para proporcionar respuestas más ricas y contextualmente
         
         try:
             stats = self.vector_engine.get_stats()
+            stats['runtime']['context_budget'] = {
+                'deadline': self.vector_context_deadline,
+                **self.vector_context_stats
+            }
             stats['status'] = 'active'
             stats['initialized'] = True
             return stats
@@ -0,0 +1,384 @@
+"""
+Niveles Caliente/Frío de Eventos para Adventure Game
+Los eventos recientes viven en un índice en memoria (nivel caliente) y se
+compactan periódicamente a la colección ChromaDB en disco (nivel frío)
+"""
+
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+DEFAULT_HOT_DAYS = 7.0
+DEFAULT_HOT_MAX_DOCUMENTS = 20000
+# Distancia L2 al cuadrado máxima para que un resultado caliente cuente como
+# relevante (con embeddings normalizados equivale a similitud coseno >= 0.5)
+DEFAULT_HOT_MAX_DISTANCE = 1.0
+
+# Niveles que puede consultar una búsqueda de eventos
+TIER_AUTO = "auto"  # Caliente primero; frío solo si faltan resultados relevantes
+TIER_HOT = "hot"    # Solo eventos recientes
+TIER_ALL = "all"    # Ambos niveles siempre
+TIERS = (TIER_AUTO, TIER_HOT, TIER_ALL)
+
+
+_OPERATORS = {
+    '$eq': lambda value, expected: value == expected,
+    '$ne': lambda value, expected: value != expected,
+    '$gt': lambda value, expected: value is not None and value > expected,
+    '$gte': lambda value, expected: value is not None and value >= expected,
+    '$lt': lambda value, expected: value is not None and value < expected,
+    '$lte': lambda value, expected: value is not None and value <= expected,
+    '$in': lambda value, expected: value in expected,
+    '$nin': lambda value, expected: value not in expected,
+}
+
+
+def matches_where(metadata: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """Evalúa una cláusula where de ChromaDB sobre la metadata de un documento"""
+    if not where:
+        return True
+
+    for key, condition in where.items():
+        if key == '$and':
+            if not all(matches_where(metadata, part) for part in condition):
+                return False
+        elif key == '$or':
+            if not any(matches_where(metadata, part) for part in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for operator, expected in condition.items():
+                if operator not in _OPERATORS:
+                    raise ValueError(f"Operador where no soportado: {operator}")
+                if not _OPERATORS[operator](value, expected):
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+
+    return True
+
+
+def activity_epoch(metadata: Dict[str, Any]) -> float:
+    """
+    Última actividad de un evento (epoch)
+
+    Un evento canónico que colapsa repeticiones sigue activo hasta su
+    `last_seen`, no desde su primera aparición (`timestamp_epoch`).
+    """
+    epoch = float(metadata.get('timestamp_epoch') or 0.0)
+    last_seen = metadata.get('last_seen')
+    if last_seen:
+        try:
+            epoch = max(epoch, datetime.fromisoformat(str(last_seen)).timestamp())
+        except ValueError:
+            pass
+    return epoch
+
+
+def merge_query_results(first: Dict[str, List[List[Any]]], second: Dict[str, List[List[Any]]],
+                        n_results: int) -> Dict[str, List[List[Any]]]:
+    """
+    Fusiona dos resultados de query fila a fila por distancia
+
+    Si un id aparece en ambos se conserva el de `first` (el nivel caliente
+    tiene la copia más reciente).
+    """
+    merged = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+
+    for row in range(len(first['ids'])):
+        candidates = {}
+        for source in (second, first):
+            for i, doc_id in enumerate(source['ids'][row]):
+                candidates[doc_id] = (source['distances'][row][i],
+                                      source['documents'][row][i],
+                                      source['metadatas'][row][i])
+
+        best = sorted(candidates.items(), key=lambda item: item[1][0])[:n_results]
+        merged['ids'].append([doc_id for doc_id, _ in best])
+        merged['distances'].append([entry[0] for _, entry in best])
+        merged['documents'].append([entry[1] for _, entry in best])
+        merged['metadatas'].append([entry[2] for _, entry in best])
+
+    return merged
+
+
+class HotEventIndex:
+    """
+    Índice vectorial en memoria para eventos recientes
+
+    - Matriz numpy con crecimiento por duplicación y huecos reutilizables
+    - Búsqueda exacta por fuerza bruta (L2 al cuadrado, igual que ChromaDB)
+    - Filtros con la misma sintaxis where que ChromaDB
+    - Seguro entre hilos: escribe el hilo de ingestión y leen las búsquedas
+
+    No es persistente: tras un reinicio se reconstruye desde SQLite al
+    reindexar los eventos existentes.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._slots: Dict[str, int] = {}
+        self._ids: List[Optional[str]] = []
+        self._documents: List[Optional[str]] = []
+        self._metadatas: List[Optional[Dict[str, Any]]] = []
+        self._embeddings: Optional[np.ndarray] = None
+        self._free: List[int] = []
+
+        # Métricas de enrutado de consultas
+        self.queries = 0
+        self.cold_fallbacks = 0
+
+    def __contains__(self, doc_id: str) -> bool:
+        with self._lock:
+            return doc_id in self._slots
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._slots)
+
+    def _allocate(self, dimension: int) -> int:
+        if self._free:
+            return self._free.pop()
+
+        slot = len(self._ids)
+        if self._embeddings is None:
+            self._embeddings = np.zeros((64, dimension), dtype=np.float32)
+        elif slot >= len(self._embeddings):
+            grown = np.zeros((len(self._embeddings) * 2, dimension), dtype=np.float32)
+            grown[:slot] = self._embeddings[:slot]
+            self._embeddings = grown
+
+        self._ids.append(None)
+        self._documents.append(None)
+        self._metadatas.append(None)
+        return slot
+
+    def upsert(self, ids: List[str], embeddings: List[Any], documents: List[str],
+               metadatas: List[Dict[str, Any]]):
+        """Inserta o reemplaza documentos"""
+        with self._lock:
+            for doc_id, embedding, document, metadata in zip(ids, embeddings, documents, metadatas):
+                vector = np.asarray(embedding, dtype=np.float32)
+                slot = self._slots.get(doc_id)
+                if slot is None:
+                    slot = self._allocate(len(vector))
+                    self._slots[doc_id] = slot
+                self._ids[slot] = doc_id
+                self._documents[slot] = document
+                self._metadatas[slot] = metadata
+                self._embeddings[slot] = vector
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> List[str]:
+        """Actualiza la metadata de los ids presentes; retorna los que no estaban"""
+        missing = []
+        with self._lock:
+            for doc_id, metadata in zip(ids, metadatas):
+                slot = self._slots.get(doc_id)
+                if slot is None:
+                    missing.append(doc_id)
+                else:
+                    self._metadatas[slot] = metadata
+        return missing
+
+    def delete(self, ids: List[str]) -> int:
+        """Elimina documentos; retorna cuántos estaban en el índice"""
+        removed = 0
+        with self._lock:
+            for doc_id in ids:
+                slot = self._slots.pop(doc_id, None)
+                if slot is None:
+                    continue
+                self._ids[slot] = None
+                self._documents[slot] = None
+                self._metadatas[slot] = None
+                self._free.append(slot)
+                removed += 1
+        return removed
+
+    def clear(self):
+        """Vacía el índice (p. ej. para reconstruirlo con otro modelo)"""
+        with self._lock:
+            self._slots.clear()
+            self._ids.clear()
+            self._documents.clear()
+            self._metadatas.clear()
+            self._embeddings = None
+            self._free.clear()
+
+    def _matching_slots(self, where: Optional[Dict[str, Any]]) -> List[int]:
+        return [
+            slot for slot in self._slots.values()
+            if matches_where(self._metadatas[slot], where)
+        ]
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            limit: Optional[int] = None) -> Dict[str, List[Any]]:
+        """Documentos por id o por filtro, con el formato de collection.get"""
+        with self._lock:
+            if ids is not None:
+                slots = [self._slots[doc_id] for doc_id in ids if doc_id in self._slots]
+                slots = [slot for slot in slots if matches_where(self._metadatas[slot], where)]
+            else:
+                slots = self._matching_slots(where)
+            if limit is not None:
+                slots = slots[:limit]
+
+            return {
+                'ids': [self._ids[slot] for slot in slots],
+                'embeddings': [self._embeddings[slot].copy() for slot in slots],
+                'documents': [self._documents[slot] for slot in slots],
+                'metadatas': [self._metadatas[slot] for slot in slots]
+            }
+
+    def query(self, query_embeddings: List[Any], n_results: int,
+              where: Optional[Dict[str, Any]] = None) -> Dict[str, List[List[Any]]]:
+        """K vecinos más cercanos por fila, con el formato de collection.query"""
+        results = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+        if n_results <= 0:
+            for key in results:
+                results[key] = [[] for _ in query_embeddings]
+            return results
+
+        with self._lock:
+            slots = np.asarray(self._matching_slots(where), dtype=np.int64)
+            matrix = self._embeddings[slots] if len(slots) else None
+
+            for query_embedding in query_embeddings:
+                # Consulta codificada con otro modelo (corte de modelo en curso): sin resultados
+                if matrix is None or len(query_embedding) != matrix.shape[1]:
+                    order, distances = [], np.zeros(0)
+                else:
+                    query_vector = np.asarray(query_embedding, dtype=np.float32)
+                    distances = np.sum((matrix - query_vector) ** 2, axis=1)
+                    if len(distances) > n_results:
+                        order = np.argpartition(distances, n_results - 1)[:n_results]
+                        order = order[np.argsort(distances[order], kind='stable')]
+                    else:
+                        order = np.argsort(distances, kind='stable')
+
+                results['ids'].append([self._ids[slots[i]] for i in order])
+                results['documents'].append([self._documents[slots[i]] for i in order])
+                results['metadatas'].append([self._metadatas[slots[i]] for i in order])
+                results['distances'].append([float(distances[i]) for i in order])
+
+        return results
+
+    def compaction_candidates(self, cutoff_epoch: float, max_documents: int) -> List[str]:
+        """
+        Ids que deben pasar al nivel frío
+
+        Los inactivos desde antes de `cutoff_epoch` y, si aun así se supera
+        `max_documents`, los de actividad más antigua hasta volver al límite.
+        """
+        with self._lock:
+            by_age = sorted(
+                (activity_epoch(self._metadatas[slot]), doc_id)
+                for doc_id, slot in self._slots.items()
+            )
+
+        expired = [doc_id for epoch, doc_id in by_age if epoch < cutoff_epoch]
+        overflow = max(0, len(by_age) - len(expired) - max_documents)
+        return expired + [doc_id for _, doc_id in by_age[len(expired):len(expired) + overflow]]
+
+    def record_query(self, used_cold: bool):
+        with self._lock:
+            self.queries += 1
+            if used_cold:
+                self.cold_fallbacks += 1
+
+
+class TieredEventCollection:
+    """
+    Vista de colección sobre ambos niveles de eventos
+
+    Expone get/query/update/count con la interfaz de una colección
+    ChromaDB para que el motor de búsqueda no distinga niveles:
+
+    - "auto": busca en caliente y consulta el nivel frío solo si no hay
+      `n_results` resultados dentro de `max_distance`
+    - "hot": solo nivel caliente
+    - "all": ambos niveles siempre
+    """
+
+    def __init__(self, hot: HotEventIndex, cold, tiers: str = TIER_AUTO,
+                 max_distance: float = DEFAULT_HOT_MAX_DISTANCE):
+        if tiers not in TIERS:
+            raise ValueError(f"Nivel de eventos desconocido: {tiers} (usa {', '.join(TIERS)})")
+        self.hot = hot
+        self.cold = cold
+        self.tiers = tiers
+        self.max_distance = max_distance
+
+    def _hot_is_enough(self, hot_results: Dict[str, List[List[Any]]], n_results: int) -> bool:
+        return all(
+            len(distances) >= n_results and distances[-1] <= self.max_distance
+            for distances in hot_results['distances']
+        )
+
+    def query(self, query_embeddings: List[Any], n_results: int,
+              where: Optional[Dict[str, Any]] = None,
+              include: Optional[List[str]] = None) -> Dict[str, List[List[Any]]]:
+        hot_results = self.hot.query(query_embeddings, n_results, where)
+
+        if self.tiers == TIER_HOT or (
+            self.tiers == TIER_AUTO and self._hot_is_enough(hot_results, n_results)
+        ):
+            self.hot.record_query(used_cold=False)
+            return hot_results
+
+        self.hot.record_query(used_cold=True)
+        cold_results = self.cold.query(
+            query_embeddings=[list(map(float, embedding)) for embedding in query_embeddings],
+            n_results=n_results,
+            where=where,
+            include=['metadatas', 'documents', 'distances']
+        )
+        return merge_query_results(hot_results, cold_results, n_results)
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            limit: Optional[int] = None, include: Optional[List[str]] = None) -> Dict[str, List[Any]]:
+        hot_results = self.hot.get(ids=ids, where=where, limit=limit)
+
+        found = set(hot_results['ids'])
+        remaining = None if ids is None else [doc_id for doc_id in ids if doc_id not in found]
+        remaining_limit = None if limit is None else limit - len(hot_results['ids'])
+
+        # Los calientes son los más recientes: si ya llenan el límite no hace falta disco
+        if self.tiers == TIER_HOT or remaining == [] or (
+            remaining_limit is not None and remaining_limit <= 0
+        ):
+            return hot_results
+
+        cold_kwargs = {'include': ['embeddings', 'documents', 'metadatas']}
+        if remaining is not None:
+            cold_kwargs['ids'] = remaining
+        if where is not None:
+            cold_kwargs['where'] = where
+        if remaining_limit is not None:
+            cold_kwargs['limit'] = remaining_limit
+        cold_results = self.cold.get(**cold_kwargs)
+
+        cold_embeddings = cold_results.get('embeddings')
+        return {
+            'ids': hot_results['ids'] + list(cold_results['ids']),
+            'embeddings': hot_results['embeddings'] + (
+                list(cold_embeddings) if cold_embeddings is not None else []
+            ),
+            'documents': hot_results['documents'] + list(cold_results['documents']),
+            'metadatas': hot_results['metadatas'] + list(cold_results['metadatas'])
+        }
+
+    def update(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        missing = set(self.hot.update_metadata(ids, metadatas))
+        cold_ids = [doc_id for doc_id in ids if doc_id in missing]
+        if cold_ids:
+            self.cold.update(
+                ids=cold_ids,
+                metadatas=[metadata for doc_id, metadata in zip(ids, metadatas) if doc_id in missing]
+            )
+
+    def count(self) -> int:
+        return self.hot.count() + self.cold.count()
@@ -0,0 +1,157 @@
+"""
+Reconocimiento de Comandos Mecánicos para Adventure Game
+Identifica los comandos que no necesitan narración de la IA (moverse,
+tomar, dejar, inventario, mirar) para aplicarlos de inmediato
+"""
+
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+
+# Acciones mecánicas
+ACTION_MOVE = "move"
+ACTION_TAKE = "take"
+ACTION_DROP = "drop"
+ACTION_INVENTORY = "inventory"
+ACTION_LOOK = "look"
+
+# Dirección canónica (la usada en Location.connections) por alias
+DIRECTION_ALIASES = {
+    "norte": "norte", "north": "norte", "n": "norte",
+    "sur": "sur", "south": "sur", "s": "sur",
+    "este": "este", "east": "este", "e": "este",
+    "oeste": "oeste", "west": "oeste", "o": "oeste", "w": "oeste",
+}
+
+# Alias que también son palabras corrientes ("e"/"o" conjunciones, "este"
+# demostrativo): en un comando libre solo cuentan tras un verbo de
+# movimiento o una preposición ("ir al este", "corro hacia el e")
+AMBIGUOUS_DIRECTIONS = {alias for alias in DIRECTION_ALIASES if len(alias) == 1} | {"este"}
+
+MOVE_VERBS = {"ir", "ve", "voy", "vamos", "caminar", "camina", "andar", "anda",
+              "go", "move", "walk"}
+TAKE_VERBS = {"tomar", "toma", "tomo", "coger", "coge", "cojo", "agarrar", "agarra",
+              "recoger", "recoge", "take", "get", "grab"}
+DROP_VERBS = {"dejar", "deja", "dejo", "soltar", "suelta", "suelto", "drop"}
+INVENTORY_WORDS = {"inventario", "inv", "i", "inventory"}
+LOOK_WORDS = {"mirar", "mira", "miro", "observar", "look", "l"}
+
+# Palabras que no cambian el significado de un movimiento ("ir al norte")
+FILLER_WORDS = {"a", "al", "el", "la", "hacia", "por", "the", "to"}
+
+# Determinantes que no forman parte del nombre de un objeto
+DETERMINERS = {"el", "la", "los", "las", "un", "una", "unos", "unas", "este", "esta",
+               "ese", "esa", "mi", "tu", "the", "a", "an", "my"}
+
+
+@dataclass(frozen=True)
+class MechanicalCommand:
+    """Comando reconocido: acción y su argumento (dirección u objeto)"""
+    action: str
+    argument: Optional[str] = None
+
+
+def command_words(command: str) -> List[str]:
+    """Palabras del comando en minúsculas, sin puntuación"""
+    return re.findall(r"\w+", (command or "").lower())
+
+
+def parse_mechanical_command(command: str) -> Optional[MechanicalCommand]:
+    """
+    Reconoce un comando puramente mecánico
+
+    Solo acepta formas cerradas ("norte", "ir al norte", "tomar llave",
+    "inventario", "mirar"); cualquier otra cosa retorna None y la
+    resuelve el narrador. Tomar y dejar solo son mecánicos si además el
+    argumento nombra un único objeto (ver resolve_object).
+    """
+    words = command_words(command)
+    if not words:
+        return None
+
+    verb, rest = words[0], [word for word in words[1:] if word not in FILLER_WORDS]
+
+    if len(words) == 1 and verb in DIRECTION_ALIASES:
+        return MechanicalCommand(ACTION_MOVE, DIRECTION_ALIASES[verb])
+
+    if verb in MOVE_VERBS and len(rest) == 1 and rest[0] in DIRECTION_ALIASES:
+        return MechanicalCommand(ACTION_MOVE, DIRECTION_ALIASES[rest[0]])
+
+    if verb in TAKE_VERBS and len(words) > 1:
+        return MechanicalCommand(ACTION_TAKE, " ".join(words[1:]))
+
+    if verb in DROP_VERBS and len(words) > 1:
+        return MechanicalCommand(ACTION_DROP, " ".join(words[1:]))
+
+    if len(words) == 1 and verb in INVENTORY_WORDS:
+        return MechanicalCommand(ACTION_INVENTORY)
+
+    if len(words) == 1 and verb in LOOK_WORDS:
+        return MechanicalCommand(ACTION_LOOK)
+
+    return None
+
+
+def find_direction(command: str) -> Optional[str]:
+    """Dirección mencionada en un comando libre (solo palabras completas)"""
+    words = command_words(command)
+    if len(words) == 1 and words[0] in DIRECTION_ALIASES:
+        return DIRECTION_ALIASES[words[0]]
+
+    for previous, word in zip([None] + words, words):
+        if word not in DIRECTION_ALIASES:
+            continue
+        if word not in AMBIGUOUS_DIRECTIONS or previous in MOVE_VERBS | FILLER_WORDS:
+            return DIRECTION_ALIASES[word]
+    return None
+
+
+def matches_object_name(name: str, text: str) -> bool:
+    """
+    ¿Se refiere `text` al objeto `name`?
+
+    Acepta el nombre completo dentro del texto ("tomar llave oxidada") o
+    un texto cuyas palabras están todas en el nombre ("tomar la llave").
+    """
+    name_words = command_words(name)
+    text_words = command_words(text)
+    if not name_words:
+        return False
+
+    # Nombre completo como secuencia de palabras del texto
+    size = len(name_words)
+    if any(text_words[i:i + size] == name_words for i in range(len(text_words) - size + 1)):
+        return True
+
+    meaningful = [word for word in text_words if word not in DETERMINERS]
+    return bool(meaningful) and set(meaningful) <= set(name_words)
+
+
+def names_only_object(name: str, text: str) -> bool:
+    """
+    ¿`text` nombra al objeto `name` y nada más?
+
+    Más estricto que matches_object_name: todas las palabras del texto
+    (sin determinantes) deben estar en el nombre, así "la llave" nombra a
+    "llave oxidada" pero "la llave y abre la puerta" no.
+    """
+    name_words = set(command_words(name))
+    meaningful = [word for word in command_words(text) if word not in DETERMINERS]
+    return bool(meaningful) and set(meaningful) <= name_words
+
+
+def resolve_object(text: str, objects: Sequence[T]) -> Optional[T]:
+    """Único objeto (con atributo `name`) nombrado por `text`, o None si no hay o es ambiguo"""
+    matches = [obj for obj in objects if names_only_object(obj.name, text)]
+    return matches[0] if len(matches) == 1 else None
+
+
+def words_after_verb(command: str, verbs: set) -> Optional[str]:
+    """Texto que sigue al primer verbo de `verbs` en un comando libre (o None)"""
+    words = command_words(command)
+    for index, word in enumerate(words):
+        if word in verbs:
+            return " ".join(words[index + 1:])
+    return None
@@ -0,0 +1,226 @@
+"""
+Cola de Ingestión por Lotes para Adventure Game
+Saca la generación de embeddings y la escritura en ChromaDB del camino
+crítico: los documentos se encolan sin bloquear y un hilo los agrupa
+"""
+
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+# writer(ids, embeddings, documents, metadatas)
+BatchWriter = Callable[[List[str], List[List[float]], List[str], List[Dict[str, Any]]], None]
+
+
+@dataclass
+class IngestionItem:
+    """Documento pendiente de vectorizar"""
+    collection: str
+    doc_id: str
+    content: str
+    metadata: Dict[str, Any]
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class IngestionQueue:
+    """
+    Cola de ingestión con agrupación por tamaño y tiempo
+
+    - submit() no bloquea: solo encola el documento
+    - Un hilo agrupa hasta `max_batch_size` documentos o `max_delay` segundos
+    - Todo el lote se codifica con una única llamada al modelo
+    - Cada colección recibe una única escritura (upsert) por lote
+    - Si un mismo id aparece varias veces en el lote, gana el más reciente
+    """
+
+    def __init__(self, encode: Callable[[List[str]], Any],
+                 max_batch_size: int = 64, max_delay: float = 0.25,
+                 max_queue_size: int = 10000, name: str = "vector-ingestion"):
+        self.encode = encode
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.name = name
+
+        self._queue: "queue.Queue[IngestionItem]" = queue.Queue(maxsize=max_queue_size)
+        self._writers: Dict[str, BatchWriter] = {}
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        # Se mantiene mientras se procesa un lote: quien lo adquiere detiene la escritura
+        self.batch_lock = threading.Lock()
+        self._in_flight = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+        # Métricas
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_batch_size = 0
+        self.max_lag = 0.0
+        self._total_lag = 0.0
+
+        self.logger = logging.getLogger(__name__)
+
+    def register_writer(self, collection: str, writer: BatchWriter):
+        """Asocia una colección con la función que escribe sus lotes"""
+        with self._lock:
+            self._writers[collection] = writer
+
+    def submit(self, collection: str, doc_id: str, content: str,
+               metadata: Dict[str, Any]) -> bool:
+        """
+        Encola un documento para vectorizar
+
+        Retorna False si la cola está llena (el documento se descarta y
+        se contabiliza en `dropped`).
+        """
+        if collection not in self._writers:
+            raise KeyError(f"Colección sin writer registrado: {collection}")
+
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(IngestionItem(collection, doc_id, content, metadata))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            self.logger.warning(f"⚠️ Cola de ingestión llena, descartado {doc_id}")
+            return False
+
+        with self._lock:
+            self.submitted += 1
+        return True
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopping:
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            batch = [first]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            with self._lock:
+                self._in_flight = len(batch)
+
+            try:
+                with self.batch_lock:
+                    self._process_batch(batch)
+            finally:
+                with self._lock:
+                    self._in_flight = 0
+                    self._idle.notify_all()
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _process_batch(self, batch: List[IngestionItem]):
+        """Codifica el lote completo y escribe una vez por colección"""
+        latest: Dict[tuple, IngestionItem] = {}
+        for item in batch:
+            latest[(item.collection, item.doc_id)] = item
+        items = list(latest.values())
+
+        try:
+            embeddings = self.encode([item.content for item in items])
+        except Exception as e:
+            with self._lock:
+                self.failed += len(items)
+            self.logger.error(f"❌ Error codificando lote de ingestión ({len(items)} docs): {e}")
+            return
+
+        by_collection: Dict[str, List[int]] = {}
+        for index, item in enumerate(items):
+            by_collection.setdefault(item.collection, []).append(index)
+
+        for collection, indexes in by_collection.items():
+            try:
+                self._writers[collection](
+                    [items[i].doc_id for i in indexes],
+                    [list(map(float, embeddings[i])) for i in indexes],
+                    [items[i].content for i in indexes],
+                    [items[i].metadata for i in indexes]
+                )
+            except Exception as e:
+                with self._lock:
+                    self.failed += len(indexes)
+                self.logger.error(f"❌ Error escribiendo lote en {collection}: {e}")
+                continue
+
+            now = time.monotonic()
+            with self._lock:
+                self.written += len(indexes)
+                for i in indexes:
+                    lag = now - items[i].enqueued_at
+                    self._total_lag += lag
+                    self.max_lag = max(self.max_lag, lag)
+
+        with self._lock:
+            self.batches += 1
+            self.last_batch_size = len(batch)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que se escriba todo lo encolado; True si la cola quedó vacía"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while self._queue.unfinished_tasks or self._in_flight:
+                if self._thread is None or not self._thread.is_alive():
+                    return False
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(0.05 if remaining is None else min(0.05, remaining))
+        return True
+
+    def stop(self, flush: bool = True, timeout: Optional[float] = 5.0):
+        """Detiene el hilo (vaciando antes la cola si se pide)"""
+        if flush:
+            self.flush(timeout)
+        self._stopping = True
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+
+    def oldest_pending_age(self) -> float:
+        """Segundos que lleva esperando el documento más antiguo de la cola"""
+        with self._queue.mutex:
+            if not self._queue.queue:
+                return 0.0
+            return time.monotonic() - self._queue.queue[0].enqueued_at
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Profundidad de la cola, retraso y contadores"""
+        lag = self.oldest_pending_age()
+        with self._lock:
+            return {
+                'depth': self._queue.qsize(),
+                'in_flight': self._in_flight,
+                'submitted': self.submitted,
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'batches': self.batches,
+                'last_batch_size': self.last_batch_size,
+                'avg_batch_size': self.written / self.batches if self.batches else 0.0,
+                'current_lag_seconds': lag,
+                'avg_lag_seconds': self._total_lag / self.written if self.written else 0.0,
+                'max_lag_seconds': self.max_lag
+            }
@@ -0,0 +1,235 @@
+"""
+Índice Léxico para Adventure Game
+Búsqueda exacta por palabras con SQLite FTS5 y ranking BM25
+Complementa la búsqueda vectorial en el modo híbrido
+"""
+
+import json
+import logging
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+
+
+# Columnas de metadata que se guardan indexadas para filtrar sin leer el JSON
+FILTERABLE_COLUMNS = ('object_id', 'location_id', 'event_id')
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+class LexicalIndex:
+    """
+    Índice léxico persistente sobre SQLite FTS5
+
+    Cada documento vectorial se refleja aquí con el mismo id, de modo que
+    los resultados léxicos y semánticos se pueden fusionar por id.
+    El tokenizer elimina acentos: "ubicacion" encuentra "ubicación".
+    """
+
+    def __init__(self, index_path: str = "./vector_db/lexical_index.db"):
+        self.index_path = Path(index_path)
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            str(self.index_path),
+            check_same_thread=False,
+            isolation_level=None  # Autocommit mode
+        )
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+
+        self.logger = logging.getLogger(__name__)
+        self._create_tables()
+
+    def _create_tables(self):
+        """Crea la tabla de documentos y el índice FTS5 sincronizado por triggers"""
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS lexical_documents (
+                rowid INTEGER PRIMARY KEY,
+                doc_id TEXT NOT NULL UNIQUE,
+                collection TEXT NOT NULL,
+                name TEXT,
+                content TEXT NOT NULL,
+                object_id TEXT,
+                location_id TEXT,
+                event_id TEXT,
+                metadata TEXT -- JSON
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_lexical_collection
+            ON lexical_documents(collection);
+
+            CREATE VIRTUAL TABLE IF NOT EXISTS lexical_fts USING fts5(
+                name, content,
+                content='lexical_documents',
+                content_rowid='rowid',
+                tokenize='unicode61 remove_diacritics 2'
+            );
+
+            CREATE TRIGGER IF NOT EXISTS lexical_documents_ai
+            AFTER INSERT ON lexical_documents BEGIN
+                INSERT INTO lexical_fts(rowid, name, content)
+                VALUES (new.rowid, new.name, new.content);
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS lexical_documents_ad
+            AFTER DELETE ON lexical_documents BEGIN
+                INSERT INTO lexical_fts(lexical_fts, rowid, name, content)
+                VALUES ('delete', old.rowid, old.name, old.content);
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS lexical_documents_au
+            AFTER UPDATE ON lexical_documents BEGIN
+                INSERT INTO lexical_fts(lexical_fts, rowid, name, content)
+                VALUES ('delete', old.rowid, old.name, old.content);
+                INSERT INTO lexical_fts(rowid, name, content)
+                VALUES (new.rowid, new.name, new.content);
+            END;
+        """)
+
+    def upsert(self, collection: str, ids: List[str], documents: List[str],
+               metadatas: List[Dict[str, Any]]):
+        """Inserta o reemplaza documentos del índice léxico"""
+        rows = []
+        for doc_id, content, metadata in zip(ids, documents, metadatas):
+            rows.append((
+                doc_id,
+                collection,
+                metadata.get('name') or '',
+                content,
+                *(metadata.get(column) or None for column in FILTERABLE_COLUMNS),
+                json.dumps(metadata)
+            ))
+
+        if not rows:
+            return
+
+        with self._lock:
+            self.connection.execute("BEGIN")
+            try:
+                self.connection.executemany("""
+                    INSERT INTO lexical_documents
+                    (doc_id, collection, name, content, object_id, location_id, event_id, metadata)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(doc_id) DO UPDATE SET
+                        collection = excluded.collection,
+                        name = excluded.name,
+                        content = excluded.content,
+                        object_id = excluded.object_id,
+                        location_id = excluded.location_id,
+                        event_id = excluded.event_id,
+                        metadata = excluded.metadata
+                """, rows)
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def delete(self, ids: List[str]):
+        """Elimina documentos del índice léxico"""
+        if not ids:
+            return
+
+        with self._lock:
+            self.connection.executemany(
+                "DELETE FROM lexical_documents WHERE doc_id = ?",
+                [(doc_id,) for doc_id in ids]
+            )
+
+    def search(self, collection: str, query: str, limit: int = 10,
+               filters: Optional[Dict[str, Any]] = None) -> List[Tuple[str, str, Dict[str, Any], float]]:
+        """
+        Busca documentos por palabras ordenados por BM25
+
+        Retorna tuplas (doc_id, content, metadata, bm25) donde un bm25
+        más bajo indica mayor relevancia (convención de FTS5).
+        """
+        match_expression = self.build_match_expression(query)
+        if not match_expression:
+            return []
+
+        sql = """
+            SELECT d.doc_id, d.content, d.metadata, bm25(lexical_fts, 10.0, 1.0) AS rank
+            FROM lexical_fts
+            JOIN lexical_documents d ON d.rowid = lexical_fts.rowid
+            WHERE lexical_fts MATCH ? AND d.collection = ?
+        """
+        params: List[Any] = [match_expression, collection]
+
+        # Solo las igualdades simples sobre columnas conocidas se resuelven en SQL
+        post_filters = {}
+        for key, value in (filters or {}).items():
+            if key in FILTERABLE_COLUMNS and not isinstance(value, dict):
+                sql += f" AND d.{key} = ?"
+                params.append(value)
+            else:
+                post_filters[key] = value
+
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit if not post_filters else limit * 4)
+
+        with self._lock:
+            rows = self.connection.execute(sql, params).fetchall()
+
+        results = []
+        for row in rows:
+            metadata = json.loads(row['metadata'] or '{}')
+            if any(metadata.get(key) != value for key, value in post_filters.items()):
+                continue
+            results.append((row['doc_id'], row['content'], metadata, row['rank']))
+
+        return results[:limit]
+
+    def count(self, collection: Optional[str] = None) -> int:
+        """Número de documentos indexados, opcionalmente por colección"""
+        with self._lock:
+            if collection:
+                cursor = self.connection.execute(
+                    "SELECT COUNT(*) FROM lexical_documents WHERE collection = ?",
+                    (collection,)
+                )
+            else:
+                cursor = self.connection.execute("SELECT COUNT(*) FROM lexical_documents")
+            return cursor.fetchone()[0]
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        """Extrae tokens alfanuméricos en minúsculas"""
+        return [token.lower() for token in _TOKEN_PATTERN.findall(text or '')]
+
+    @classmethod
+    def build_match_expression(cls, query: str) -> str:
+        """
+        Construye una expresión MATCH segura para FTS5
+
+        Cada token se cita para evitar errores de sintaxis con la entrada
+        del jugador; los tokens se combinan con OR y BM25 premia los
+        documentos que contienen más de ellos.
+        """
+        tokens = cls.tokenize(query)
+        return " OR ".join(f'"{token}"' for token in tokens)
+
+    def close(self):
+        """Cierra la conexión del índice"""
+        with self._lock:
+            self.connection.close()
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fusiona varias listas ordenadas de ids con Reciprocal Rank Fusion
+
+    score(d) = Σ 1 / (k + rank_i(d)), con rank empezando en 1.
+    Retorna (id, score) ordenados de mayor a menor score.
+    """
+    scores: Dict[str, float] = {}
+
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
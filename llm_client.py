@@ -0,0 +1,331 @@
+"""
+Cliente LLM Compartido para Adventure Game
+Un pool de conexiones HTTP asíncrono por servidor Ollama, con timeouts
+por llamada, reintentos acotados y un circuit breaker, para que ninguna
+generación bloquee el bucle de eventos
+"""
+
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import aiohttp
+
+from llm_scheduler import PRIORITY_INTERACTIVE, LLMScheduler, configured_scheduler
+
+
+DEFAULT_OLLAMA_HOST = "http://localhost:11434"
+
+# Pool de conexiones (keep-alive) por servidor
+DEFAULT_POOL_SIZE = 8
+DEFAULT_KEEPALIVE_SECONDS = 30.0
+
+# Timeouts por llamada: conexión y tiempo total de la generación
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_REQUEST_TIMEOUT = 30.0
+
+# Reintentos: espera base * 2^intento, con jitter aleatorio
+DEFAULT_MAX_RETRIES = 2
+DEFAULT_RETRY_BACKOFF = 0.25
+
+# Circuit breaker: tras N fallos seguidos se rechaza durante `reset` segundos
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30.0
+
+# Estados del circuit breaker
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+# on_token(fragmento) para respuestas en streaming
+TokenCallback = Callable[[str], Awaitable[None]]
+
+
+class LLMError(RuntimeError):
+    """La generación falló (tras los reintentos)"""
+
+
+class LLMHTTPError(LLMError):
+    """El servidor respondió con un estado de error"""
+
+    def __init__(self, status: int, message: str = ""):
+        super().__init__(f"HTTP {status}{': ' + message if message else ''}")
+        self.status = status
+
+
+class LLMCircuitOpen(LLMError):
+    """El servidor falla de forma continuada: se rechaza sin llamarle"""
+
+
+class _TokenCallbackError(Exception):
+    """on_token falló (p. ej. cliente desconectado): no es culpa del servidor"""
+
+    def __init__(self, error: Exception):
+        super().__init__(repr(error))
+        self.error = error
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker de tres estados
+
+    closed: las llamadas pasan. open: se rechazan hasta `reset_timeout`.
+    half_open: pasa una sola llamada de prueba; si va bien se cierra y si
+    falla vuelve a abrirse.
+    """
+
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout: float = DEFAULT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CIRCUIT_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        """Rechazando llamadas (abierto y aún sin cumplir `reset_timeout`)"""
+        return self.state == CIRCUIT_OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def allow(self) -> bool:
+        if self.state == CIRCUIT_OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = CIRCUIT_HALF_OPEN
+            self._probe_in_flight = False
+
+        if self.state == CIRCUIT_HALF_OPEN:
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record_success(self):
+        self.state = CIRCUIT_CLOSED
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == CIRCUIT_HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != CIRCUIT_OPEN:
+                self.times_opened += 1
+            self.state = CIRCUIT_OPEN
+            self.opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    def release_probe(self):
+        """
+        Libera la sonda sin veredicto (llamada cancelada o sin resultado
+        del servidor): la siguiente llamada en half_open vuelve a probar
+        """
+        self._probe_in_flight = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'state': self.state,
+            'consecutive_failures': self.consecutive_failures,
+            'times_opened': self.times_opened
+        }
+
+
+class LLMClient:
+    """
+    Cliente asíncrono de /api/generate de Ollama
+
+    - Una ClientSession con pool de conexiones keep-alive, creada en el
+      bucle que la usa (se recrea si el bucle cambia o se cerró)
+    - Timeout de conexión y total por llamada
+    - Reintentos con backoff exponencial y jitter ante errores de red,
+      timeouts y 5xx; nunca después de haber entregado fragmentos
+    - Circuit breaker para no acumular esperas contra un servidor caído
+    - Todas las generaciones pasan por un LLMScheduler (límite de
+      peticiones simultáneas, prioridades y turno por jugador)
+    """
+
+    def __init__(self, base_url: str = DEFAULT_OLLAMA_HOST,
+                 pool_size: int = DEFAULT_POOL_SIZE,
+                 keepalive_timeout: float = DEFAULT_KEEPALIVE_SECONDS,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 request_timeout: float = DEFAULT_REQUEST_TIMEOUT,
+                 max_retries: int = DEFAULT_MAX_RETRIES,
+                 retry_backoff: float = DEFAULT_RETRY_BACKOFF,
+                 breaker: Optional[CircuitBreaker] = None,
+                 scheduler: Optional[LLMScheduler] = None):
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+        self.connect_timeout = connect_timeout
+        self.request_timeout = request_timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.scheduler = scheduler or configured_scheduler()
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # Métricas
+        self.requests = 0
+        self.failures = 0
+        self.retries = 0
+        self.rejected = 0
+        self.callback_errors = 0
+
+        self.logger = logging.getLogger(__name__)
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size, keepalive_timeout=self.keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._session_loop = loop
+        return self._session
+
+    async def generate(self, payload: Dict[str, Any], on_token: Optional[TokenCallback] = None,
+                       timeout: Optional[float] = None, priority: int = PRIORITY_INTERACTIVE,
+                       player_id: Any = None) -> str:
+        """
+        Texto generado para `payload` (cuerpo de /api/generate)
+
+        Con `on_token` se pide streaming y cada fragmento se entrega en
+        cuanto llega; si `on_token` lanza, esa misma excepción se propaga
+        sin contar como fallo del servidor. `priority` y `player_id`
+        ordenan la petición en el planificador. Lanza LLMCircuitOpen si el
+        circuito está abierto, LLMQueueFull si la cola está llena y
+        LLMError si la llamada falla tras los reintentos.
+        """
+        if self.breaker.is_open:
+            self.rejected += 1
+            raise LLMCircuitOpen(f"{self.base_url}: circuito abierto tras fallos continuados")
+
+        async with self.scheduler.slot(priority, player_id):
+            if not self.breaker.allow():
+                self.rejected += 1
+                raise LLMCircuitOpen(f"{self.base_url}: circuito abierto tras fallos continuados")
+            try:
+                return await self._generate_with_retries(payload, on_token, timeout)
+            finally:
+                # CancelledError no pasa por record_success/record_failure
+                self.breaker.release_probe()
+
+    async def _generate_with_retries(self, payload: Dict[str, Any],
+                                     on_token: Optional[TokenCallback],
+                                     timeout: Optional[float]) -> str:
+        payload = {**payload, 'stream': on_token is not None}
+        client_timeout = aiohttp.ClientTimeout(
+            total=timeout or self.request_timeout, connect=self.connect_timeout
+        )
+        self.requests += 1
+
+        attempt = 0
+        while True:
+            delivered = []
+            try:
+                text = await self._post(payload, client_timeout, on_token, delivered)
+                self.breaker.record_success()
+                return text
+            except _TokenCallbackError as e:
+                # El servidor respondió: el fallo es del consumidor de fragmentos
+                self.callback_errors += 1
+                self.breaker.record_success()
+                raise e.error
+            except Exception as e:
+                retryable = self._is_retryable(e) and not delivered
+                if not retryable or attempt >= self.max_retries:
+                    self.failures += 1
+                    self.breaker.record_failure()
+                    if isinstance(e, LLMError):
+                        raise
+                    raise LLMError(f"{self.base_url}: {e!r}") from e
+
+                delay = self.retry_backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+                attempt += 1
+                self.retries += 1
+                self.logger.warning(
+                    f"⚠️ LLM {self.base_url} falló ({e!r}), reintento {attempt} en {delay:.2f}s"
+                )
+                await asyncio.sleep(delay)
+
+    async def _post(self, payload: Dict[str, Any], client_timeout: aiohttp.ClientTimeout,
+                    on_token: Optional[TokenCallback], delivered: list) -> str:
+        session = await self._get_session()
+        async with session.post(f"{self.base_url}/api/generate", json=payload,
+                                timeout=client_timeout) as response:
+            if response.status != 200:
+                raise LLMHTTPError(response.status, (await response.text())[:200])
+
+            if on_token is None:
+                result = json.loads(await response.text())
+                return result.get("response", "")
+
+            # NDJSON: un objeto por línea con el siguiente fragmento
+            async for line in response.content:
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                token = chunk.get("response", "")
+                if token:
+                    delivered.append(token)
+                    try:
+                        await on_token(token)
+                    except Exception as e:
+                        raise _TokenCallbackError(e) from e
+                if chunk.get("done"):
+                    break
+            return "".join(delivered)
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        if isinstance(error, LLMHTTPError):
+            return error.status >= 500
+        return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError))
+
+    async def close(self):
+        """Cierra las conexiones del pool (se reabren en la siguiente llamada)"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'base_url': self.base_url,
+            'pool_size': self.pool_size,
+            'requests': self.requests,
+            'failures': self.failures,
+            'retries': self.retries,
+            'rejected': self.rejected,
+            'callback_errors': self.callback_errors,
+            'circuit': self.breaker.get_stats(),
+            'scheduler': self.scheduler.get_stats()
+        }
+
+
+_clients: Dict[str, LLMClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_llm_client(base_url: str = DEFAULT_OLLAMA_HOST) -> LLMClient:
+    """Cliente compartido (un pool de conexiones) por servidor"""
+    key = base_url.rstrip('/')
+
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = LLMClient(key)
+            _clients[key] = client
+        return client
+
+
+async def close_llm_clients():
+    """Cierra los pools de todos los clientes compartidos"""
+    for client in list(_clients.values()):
+        await client.close()
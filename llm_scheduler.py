@@ -0,0 +1,195 @@
+"""
+Planificador de Peticiones LLM para Adventure Game
+Limita las generaciones simultáneas contra el servidor del modelo,
+atiende primero los comandos interactivos, reparte el turno entre
+jugadores y rechaza pronto cuando la cola es demasiado profunda
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Hashable, Optional
+
+
+# Clases de prioridad (menor = antes)
+PRIORITY_INTERACTIVE = 0  # Comando de un jugador esperando respuesta
+PRIORITY_AMBIENT = 1      # Narración en segundo plano, generación de contenido
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_AMBIENT: "ambient",
+}
+
+DEFAULT_MAX_IN_FLIGHT = 2
+MAX_IN_FLIGHT_ENV = "LLM_MAX_IN_FLIGHT"
+
+# Profundidad de cola a partir de la cual se rechaza cada clase
+DEFAULT_QUEUE_LIMITS = {
+    PRIORITY_INTERACTIVE: 32,
+    PRIORITY_AMBIENT: 8,
+}
+MAX_QUEUE_ENV = "LLM_MAX_QUEUE"
+
+# Muestras de espera conservadas para los percentiles
+QUEUE_TIME_SAMPLES = 512
+
+
+class LLMQueueFull(RuntimeError):
+    """Cola demasiado profunda: el llamador debe usar su respuesta de respaldo"""
+
+
+@dataclass
+class _Waiter:
+    priority: int
+    player_id: Hashable
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class LLMScheduler:
+    """
+    Cola de peticiones al servidor del modelo
+
+    - Como mucho `max_in_flight` generaciones a la vez
+    - Las clases de prioridad se atienden en orden estricto
+    - Dentro de una clase, turno rotatorio entre jugadores: quien lanza
+      muchas peticiones no retrasa a los demás
+    - Si la cola de una clase llega a su límite, `slot()` lanza
+      LLMQueueFull de inmediato en lugar de esperar
+    """
+
+    def __init__(self, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                 queue_limits: Optional[Dict[int, int]] = None):
+        self.max_in_flight = max_in_flight
+        self.queue_limits = {**DEFAULT_QUEUE_LIMITS, **(queue_limits or {})}
+
+        self._in_flight = 0
+        # Por prioridad: jugador -> peticiones en espera (orden = turno)
+        self._queues: Dict[int, "OrderedDict[Hashable, Deque[_Waiter]]"] = {}
+        self._queued: Dict[int, int] = {}
+
+        # Métricas
+        self.completed = 0
+        self.rejected: Dict[int, int] = {}
+        self._queue_times: Dict[int, Deque[float]] = {}
+        self._max_queue_time: Dict[int, float] = {}
+
+        self.logger = logging.getLogger(__name__)
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_INTERACTIVE, player_id: Hashable = None):
+        """Espera turno para una generación y lo libera al terminar"""
+        await self._acquire(priority, player_id)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, priority: int, player_id: Hashable):
+        if self._in_flight < self.max_in_flight and not any(self._queued.values()):
+            self._in_flight += 1
+            self._record_queue_time(priority, 0.0)
+            return
+
+        limit = self.queue_limits.get(priority, max(self.queue_limits.values()))
+        if self._queued.get(priority, 0) >= limit:
+            self.rejected[priority] = self.rejected.get(priority, 0) + 1
+            self.logger.warning(
+                f"⚠️ Cola LLM llena ({PRIORITY_NAMES.get(priority, priority)}: {limit}), petición rechazada"
+            )
+            raise LLMQueueFull(f"cola LLM llena ({limit} peticiones en espera)")
+
+        waiter = _Waiter(priority, player_id, asyncio.get_running_loop().create_future())
+        players = self._queues.setdefault(priority, OrderedDict())
+        players.setdefault(player_id, deque()).append(waiter)
+        self._queued[priority] = self._queued.get(priority, 0) + 1
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release()  # Ya tenía turno: se cede al siguiente
+            else:
+                self._remove(waiter)
+            raise
+
+    def _release(self):
+        self._in_flight -= 1
+        self.completed += 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._in_flight < self.max_in_flight:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            self._in_flight += 1
+            self._record_queue_time(waiter.priority, time.monotonic() - waiter.enqueued_at)
+            waiter.future.set_result(None)
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        for priority in sorted(self._queues):
+            players = self._queues[priority]
+            while players:
+                player_id, waiters = next(iter(players.items()))
+                waiter = waiters.popleft()
+                # Turno rotatorio: el jugador pasa al final si le quedan peticiones
+                if waiters:
+                    players.move_to_end(player_id)
+                else:
+                    del players[player_id]
+                self._queued[priority] -= 1
+                if not waiter.future.done():
+                    return waiter
+        return None
+
+    def _remove(self, waiter: _Waiter):
+        players = self._queues.get(waiter.priority, {})
+        waiters = players.get(waiter.player_id)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            self._queued[waiter.priority] -= 1
+            if not waiters:
+                del players[waiter.player_id]
+
+    def _record_queue_time(self, priority: int, seconds: float):
+        samples = self._queue_times.setdefault(priority, deque(maxlen=QUEUE_TIME_SAMPLES))
+        samples.append(seconds)
+        self._max_queue_time[priority] = max(self._max_queue_time.get(priority, 0.0), seconds)
+
+    def get_stats(self) -> Dict[str, Any]:
+        classes = {}
+        for priority, name in PRIORITY_NAMES.items():
+            samples = sorted(self._queue_times.get(priority, ()))
+            classes[name] = {
+                'queued': self._queued.get(priority, 0),
+                'queue_limit': self.queue_limits.get(priority),
+                'rejected': self.rejected.get(priority, 0),
+                'started': len(samples),
+                'avg_queue_time': sum(samples) / len(samples) if samples else 0.0,
+                'p95_queue_time': samples[int(0.95 * (len(samples) - 1))] if samples else 0.0,
+                'max_queue_time': self._max_queue_time.get(priority, 0.0)
+            }
+        return {
+            'max_in_flight': self.max_in_flight,
+            'in_flight': self._in_flight,
+            'completed': self.completed,
+            'classes': classes
+        }
+
+
+def configured_scheduler() -> LLMScheduler:
+    """Planificador con LLM_MAX_IN_FLIGHT y LLM_MAX_QUEUE (cola interactiva)"""
+    max_in_flight = int(os.getenv(MAX_IN_FLIGHT_ENV) or DEFAULT_MAX_IN_FLIGHT)
+    queue_limits = {}
+    if os.getenv(MAX_QUEUE_ENV):
+        interactive = int(os.getenv(MAX_QUEUE_ENV))
+        queue_limits = {
+            PRIORITY_INTERACTIVE: interactive,
+            PRIORITY_AMBIENT: max(1, interactive // 4)
+        }
+    return LLMScheduler(max_in_flight, queue_limits)
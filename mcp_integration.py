@@ -6,6 +6,30 @@ import asyncio
 from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
 from memory_system import PerfectMemorySystem, GameObject, Location, GameEvent
+from search_cache import SearchResultCache
+from context_snapshots import LocationSnapshotStore
+from context_budget import (
+    ContextSection, PRIORITY_ACTIVITY, PRIORITY_GUIDANCE, PRIORITY_LOCATION,
+    PRIORITY_OBJECTS, PRIORITY_QUERY
+)
+
+# Bloque fijo al final del contexto del mundo
+MEMORY_GUIDANCE_SECTION = ContextSection(
+    'memory_guidance',
+    """💾 GARANTÍA DE MEMORIA:
+- Todos los objetos y sus ubicaciones están permanentemente registrados
+- Cada acción queda grabada con timestamp exacto
+- Las propiedades de objetos evolucionan en el tiempo (oxidación, desgaste, etc.)
+- NADA se olvida jamás, incluso después de meses de juego
+
+🤖 INSTRUCCIONES PARA IA:
+- Usa esta información como verdad absoluta del mundo
+- Los objetos mencionados EXISTEN y están donde se indica
+- Considera las propiedades actuales de los objetos
+- Recuerda que las acciones del jugador tienen consecuencias permanentes""",
+    PRIORITY_GUIDANCE,
+    summary="🤖 Usa esta información como verdad absoluta: los objetos EXISTEN y están donde se indica."
+)
 
 class MCPContextProvider:
     """
@@ -15,31 +39,40 @@ class MCPContextProvider:
     
     def __init__(self, memory_system: PerfectMemorySystem):
         self.memory = memory_system
-        self.context_cache = {}
         self.cache_ttl = timedelta(seconds=30)  # Cache de 30 segundos
         
+        # Contexto de ubicación por (ubicación, versión del mundo): un cambio
+        # de objetos en la sala cambia la clave; el TTL acota la actividad
+        # reciente mostrada, que no cambia la versión
+        self.context_cache = SearchResultCache(
+            max_entries=256, ttl_seconds=self.cache_ttl.total_seconds()
+        )
+        
+        # Contexto renderizado por ubicación, regenerado solo cuando cambia
+        self.snapshots = LocationSnapshotStore(
+            build=self._build_static_sections,
+            load_activity=self._load_recent_activity,
+            version=self.memory.world_version
+        )
+        self.memory.add_change_listener(self.snapshots.on_change)
+    
+    def _context_cache_key(self, kind: str, location_id: str) -> tuple:
+        return self.context_cache.make_key(
+            kind, location_id, None, None, 0, self.memory.world_version(location_id)
+        )
+        
     async def get_location_context(self, location_id: str) -> Dict[str, Any]:
         """Obtiene contexto completo de una ubicación para la IA"""
+        cache_key = self._context_cache_key('location', location_id)
+        cached = self.context_cache.get(cache_key)
+        if cached is not None:
+            return dict(cached)
         
         # Obtener objetos en la ubicación
         objects = await self.memory.get_objects_in_location(location_id)
         
         # Obtener eventos recientes en la ubicación
-        cursor = self.memory.db_connection.execute("""
-            SELECT * FROM game_events 
-            WHERE location_id = ? 
-            ORDER BY timestamp DESC 
-            LIMIT 20
-        """, (location_id,))
-        
-        recent_events = []
-        for row in cursor.fetchall():
-            recent_events.append({
-                'timestamp': row[1],
-                'actor': row[3],
-                'action': row[4],
-                'context': json.loads(row[7] or "{}")
-            })
+        recent_events = await self._load_recent_activity(location_id)
         
         # Construir contexto
         context = {
@@ -59,11 +92,39 @@ class MCPContextProvider:
             "has_persistent_memory": True
         }
         
-        return context
+        self.context_cache.put(cache_key, context, self.context_cache.version(location_id))
+        return dict(context)
     
-    async def get_object_context(self, object_id: str) -> Dict[str, Any]:
-        """Obtiene contexto completo de un objeto específico"""
+    async def _load_recent_activity(self, location_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Eventos recientes de una ubicación, el más reciente primero"""
+        cursor = self.memory.db_connection.execute("""
+            SELECT * FROM game_events 
+            WHERE location_id = ? 
+            ORDER BY timestamp DESC 
+            LIMIT ?
+        """, (location_id, limit))
         
+        recent_events = []
+        for row in cursor.fetchall():
+            recent_events.append({
+                'timestamp': row[1],
+                'actor': row[3],
+                'action': row[4],
+                'context': json.loads(row[7] or "{}")
+            })
+        return recent_events
+    
+    async def get_object_context(self, object_id: str, include_history: bool = False,
+                                 history_offset: int = 0,
+                                 history_limit: int = 50) -> Dict[str, Any]:
+        """
+        Obtiene contexto de un objeto específico
+
+        Por defecto incluye solo el resumen de su historial (`history_summary`);
+        con include_history=True añade una página del historial completo,
+        del evento más antiguo al más reciente.
+        """
+
         # Obtener datos del objeto
         cursor = self.memory.db_connection.execute("""
             SELECT * FROM game_objects WHERE id = ?
@@ -73,9 +134,9 @@ class MCPContextProvider:
         if not row:
             return {"error": "object_not_found"}
         
-        # Obtener historial completo
-        history = await self.memory.get_object_history(object_id)
-        
+        # Resumen del historial (tamaño acotado, se mantiene con cada evento)
+        summary = await self.memory.get_object_history_summary(object_id)
+
         # Obtener ubicación actual
         cursor = self.memory.db_connection.execute("""
             SELECT name, description FROM locations WHERE id = ?
@@ -96,35 +157,49 @@ class MCPContextProvider:
             "created_at": row[5],
             "last_modified": row[6],
             "version": row[7],
-            "complete_history": [
+            "history_summary": summary.to_dict(),
+            "history_length": summary.event_count
+        }
+
+        if include_history:
+            history = await self.memory.get_object_history(
+                object_id, limit=history_limit, offset=history_offset
+            )
+            context["history"] = [
                 {
-                    "timestamp": event.timestamp.isoformat(),
+                    "timestamp": event.timestamp,
                     "event_type": event.event_type,
                     "actor": event.actor,
                     "action": event.action,
                     "context": event.context
                 }
                 for event in history
-            ],
-            "history_length": len(history)
-        }
-        
+            ]
+            context["history_page"] = {
+                "offset": history_offset,
+                "limit": history_limit,
+                "has_more": history_offset + len(history) < summary.event_count
+            }
+
         return context
     
     async def get_player_context(self, player_id: str = "player") -> Dict[str, Any]:
         """Obtiene contexto del jugador y sus acciones recientes"""
         
-        # Obtener eventos del jugador
+        # Estadísticas de sus últimas 50 acciones, agregadas en SQL
+        stats = await self.memory.get_actor_stats(player_id, window=50)
+        
+        # Solo las 10 acciones más recientes viajan completas
         cursor = self.memory.db_connection.execute("""
             SELECT * FROM game_events 
             WHERE actor = ? 
             ORDER BY timestamp DESC 
-            LIMIT 50
+            LIMIT 10
         """, (player_id,))
         
-        player_events = []
+        recent_actions = []
         for row in cursor.fetchall():
-            player_events.append({
+            recent_actions.append({
                 'id': row[0],
                 'timestamp': row[1],
                 'event_type': row[2],
@@ -134,47 +209,32 @@ class MCPContextProvider:
                 'context': json.loads(row[7] or "{}")
             })
         
-        # Analizar patrones
-        locations_visited = set()
-        objects_interacted = set()
-        
-        for event in player_events:
-            locations_visited.add(event['location_id'])
-            if event['target']:
-                objects_interacted.add(event['target'])
-        
         context = {
             "player_id": player_id,
-            "recent_actions": player_events[:10],  # Solo las 10 más recientes
-            "total_actions": len(player_events),
-            "locations_visited": list(locations_visited),
-            "objects_interacted": list(objects_interacted),
-            "play_style_analysis": self._analyze_play_style(player_events),
+            "recent_actions": recent_actions,
+            "total_actions": stats['total_actions'],
+            "locations_visited": stats['locations_visited'],
+            "objects_interacted": stats['objects_interacted'],
+            "play_style_analysis": self._analyze_play_style(stats['action_distribution']),
             "memory_integrity": "perfect"
         }
         
         return context
     
-    def _analyze_play_style(self, events: List[Dict]) -> Dict[str, Any]:
-        """Analiza el estilo de juego del jugador"""
-        if not events:
+    def _analyze_play_style(self, action_types: Dict[str, int]) -> Dict[str, Any]:
+        """Analiza el estilo de juego a partir del recuento por tipo de evento"""
+        if not action_types:
             return {"analysis": "no_data"}
         
-        # Contar tipos de acciones
-        action_types = {}
-        for event in events:
-            event_type = event['event_type']
-            action_types[event_type] = action_types.get(event_type, 0) + 1
-        
         # Determinar tendencias
-        total_actions = len(events)
+        total_actions = sum(action_types.values())
         exploration_actions = action_types.get('object_moved', 0) + action_types.get('location_visited', 0)
         
         return {
             "total_actions": total_actions,
             "action_distribution": action_types,
-            "exploration_tendency": exploration_actions / total_actions if total_actions > 0 else 0,
-            "most_common_action": max(action_types.items(), key=lambda x: x[1])[0] if action_types else None
+            "exploration_tendency": exploration_actions / total_actions,
+            "most_common_action": max(action_types.items(), key=lambda x: x[1])[0]
         }
     
     async def generate_world_context_for_ai(self, current_location_id: str, 
@@ -183,76 +243,100 @@ class MCPContextProvider:
         Genera un contexto textual completo para que la IA entienda 
         perfectamente el estado del mundo
         """
+        sections = await self.get_world_context_sections(current_location_id, query)
+        return "\n\n".join(section.text for section in sections)
+    
+    async def get_world_context_sections(self, current_location_id: str,
+                                         query: str = None) -> List[ContextSection]:
+        """
+        Contexto del mundo por secciones, con prioridad y versión resumida
+        
+        Permite a ContextAssembler ajustar el prompt a un presupuesto de
+        tokens. Las secciones salen de la instantánea de la ubicación
+        (ver LocationSnapshotStore): en una sala sin cambios es una consulta.
+        """
+        snapshot = await self.snapshots.get(current_location_id)
+        if snapshot is None:
+            return [ContextSection('location', "Error: ubicación no encontrada",
+                                   PRIORITY_LOCATION, required=True)]
         
-        # Obtener contexto de la ubicación actual
-        location_context = await self.get_location_context(current_location_id)
+        location_section, objects_section, guidance_section = snapshot.static
         
-        # Obtener ubicación actual
+        activity_lines = ["📜 ACTIVIDAD RECIENTE:"]
+        for event in snapshot.activity[:5]:
+            timestamp = datetime.fromisoformat(event['timestamp']).strftime("%H:%M:%S")
+            activity_lines.append(f"- {timestamp}: {event['actor']} {event['action']}")
+        
+        sections = [
+            location_section,
+            objects_section,
+            ContextSection('activity', "\n".join(activity_lines), PRIORITY_ACTIVITY)
+        ]
+        
+        # Si hay una consulta específica, buscar información relevante
+        if query:
+            query_lines = [f"🔍 INFORMACIÓN ESPECÍFICA SOBRE: '{query}'"]
+            
+            # Buscar objetos relacionados
+            related_events = await self.memory.search_events_by_content(query, limit=10)
+            if related_events:
+                query_lines.append("Eventos relacionados encontrados:")
+                for event in related_events[:3]:
+                    query_lines.append(f"- {event.action} (en {event.location_id})")
+            sections.append(ContextSection('query', "\n".join(query_lines), PRIORITY_QUERY))
+        
+        sections.append(guidance_section)
+        return sections
+    
+    async def _build_static_sections(self, location_id: str) -> Optional[tuple]:
+        """Secciones de la instantánea: (ubicación, objetos, garantía de memoria)"""
         cursor = self.memory.db_connection.execute("""
             SELECT name, description, connections FROM locations WHERE id = ?
-        """, (current_location_id,))
+        """, (location_id,))
         
         location_row = cursor.fetchone()
         if not location_row:
-            return "Error: ubicación no encontrada"
+            return None
         
         location_name = location_row[0]
         location_desc = location_row[1]
         connections = json.loads(location_row[2] or "{}")
+        connections_text = ', '.join([f'{dir} -> {dest}' for dir, dest in connections.items()])
         
-        # Construir contexto textual
-        context_text = f"""
-🌍 CONTEXTO ACTUAL DEL MUNDO (MEMORIA PERFECTA ACTIVA)
+        location_section = ContextSection(
+            'location',
+            f"""🌍 CONTEXTO ACTUAL DEL MUNDO (MEMORIA PERFECTA ACTIVA)
 
 📍 UBICACIÓN ACTUAL: {location_name}
 Descripción: {location_desc}
-Conexiones disponibles: {', '.join([f'{dir} -> {dest}' for dir, dest in connections.items()])}
-
-🏷️ OBJETOS PRESENTES ({len(location_context['objects_present'])}):
-"""
-        
-        for obj in location_context['objects_present']:
-            context_text += f"- {obj['name']}: {obj['description']}\n"
-            if obj['properties']:
+Conexiones disponibles: {connections_text}""",
+            PRIORITY_LOCATION,
+            summary=f"📍 UBICACIÓN ACTUAL: {location_name}\nConexiones disponibles: {connections_text}",
+            required=True
+        )
+        
+        objects_present = await self.memory.get_objects_in_location(location_id)
+        header = f"🏷️ OBJETOS PRESENTES ({len(objects_present)}):"
+        object_lines = []
+        for obj in objects_present:
+            object_lines.append(f"- {obj.name}: {obj.description}")
+            if obj.properties:
                 props = []
-                for key, value in obj['properties'].items():
+                for key, value in obj.properties.items():
                     props.append(f"{key}: {value}")
-                context_text += f"  Propiedades: {', '.join(props)}\n"
-        
-        if not location_context['objects_present']:
-            context_text += "- No hay objetos visibles en esta ubicación\n"
+                object_lines.append(f"  Propiedades: {', '.join(props)}")
         
-        context_text += f"\n📜 ACTIVIDAD RECIENTE:\n"
-        for event in location_context['recent_activity'][:5]:
-            timestamp = datetime.fromisoformat(event['timestamp']).strftime("%H:%M:%S")
-            context_text += f"- {timestamp}: {event['actor']} {event['action']}\n"
-        
-        # Si hay una consulta específica, buscar información relevante
-        if query:
-            context_text += f"\n🔍 INFORMACIÓN ESPECÍFICA SOBRE: '{query}'\n"
-            
-            # Buscar objetos relacionados
-            related_events = await self.memory.search_events_by_content(query, limit=10)
-            if related_events:
-                context_text += "Eventos relacionados encontrados:\n"
-                for event in related_events[:3]:
-                    context_text += f"- {event.action} (en {event.location_id})\n"
+        if not objects_present:
+            object_lines.append("- No hay objetos visibles en esta ubicación")
         
-        context_text += f"""
-💾 GARANTÍA DE MEMORIA:
-- Todos los objetos y sus ubicaciones están permanentemente registrados
-- Cada acción queda grabada con timestamp exacto
-- Las propiedades de objetos evolucionan en el tiempo (oxidación, desgaste, etc.)
-- NADA se olvida jamás, incluso después de meses de juego
-
-🤖 INSTRUCCIONES PARA IA:
-- Usa esta información como verdad absoluta del mundo
-- Los objetos mencionados EXISTEN y están donde se indica
-- Considera las propiedades actuales de los objetos
-- Recuerda que las acciones del jugador tienen consecuencias permanentes
-"""
+        objects_section = ContextSection(
+            'objects', "\n".join([header] + object_lines), PRIORITY_OBJECTS,
+            # Sin descripciones ni propiedades: solo qué hay en la sala
+            summary="\n".join([header] + [f"- {obj.name}" for obj in objects_present])
+            if objects_present else None
+        )
         
-        return context_text
+        return location_section, objects_section, MEMORY_GUIDANCE_SECTION
     
     async def get_mcp_memory_stats(self) -> Dict[str, Any]:
         """Obtiene estadísticas del sistema de memoria para MCP"""
@@ -281,6 +365,8 @@ Conexiones disponibles: {', '.join([f'{dir} -> {dest}' for dir, dest in connecti
             "last_recorded_event": stats_row[3] if stats_row else None,
             "memory_integrity": "PERFECT - Nothing is ever forgotten",
             "persistence": "Guaranteed across sessions and time",
+            "context_cache": self.context_cache.get_stats(),
+            "context_snapshots": self.snapshots.get_stats(),
             "features": [
                 "Event sourcing",
                 "Object versioning", 
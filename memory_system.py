@@ -4,17 +4,78 @@
 import asyncio
 import json
 import sqlite3
+import threading
 import uuid
 from datetime import datetime, timezone
-from typing import Dict, List, Optional, Any, Tuple
-from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List, Optional, Any, Tuple
+from dataclasses import dataclass, asdict, field
 from pathlib import Path
 import logging
 
+import numpy as np
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Versión del esquema (PRAGMA user_version)
+# 1: game_events.embedding_vector pasa de JSON (TEXT) a float32 empaquetados (BLOB)
+# 2: game_events.embedding_model anota el modelo que calculó cada vector
+# 3: object_history_rollups resume el historial de cada objeto
+SCHEMA_VERSION = 3
+
+# Tamaño del resumen de historial de cada objeto
+OBJECT_HISTORY_RECENT = 10       # Últimos eventos conservados
+OBJECT_HISTORY_TRANSITIONS = 10  # Últimos cambios de propiedades
+
+# Mayor rowid de SQLite: inicio del recorrido de filas con otro modelo
+MAX_ROWID = 2 ** 63 - 1
+
+
+def pack_embedding(vector: Any) -> bytes:
+    """Empaqueta un embedding como float32 little-endian para la columna BLOB"""
+    return np.asarray(vector, dtype='<f4').tobytes()
+
+
+def unpack_embedding(value: Any) -> Optional[List[float]]:
+    """
+    Lee un embedding almacenado
+
+    Acepta el formato actual (BLOB float32) y el antiguo (texto JSON)
+    de bases de datos aún no migradas.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return np.frombuffer(bytes(value), dtype='<f4').tolist() or None
+    try:
+        vector = json.loads(value)
+    except (TypeError, ValueError):
+        return None
+    return [float(x) for x in vector] if vector else None
+
+
+def event_document_text(event_type: str, timestamp: str, target: Optional[str],
+                        location_id: Optional[str], context: Dict[str, Any]) -> str:
+    """Texto de un evento para generar su embedding (mismo formato que el índice vectorial)"""
+    content_parts = [
+        f"Evento: {event_type}",
+        f"Timestamp: {timestamp}"
+    ]
+    
+    if target:
+        content_parts.append(f"Objeto: {target}")
+    
+    if location_id:
+        content_parts.append(f"Ubicación: {location_id}")
+    
+    # Agregar datos específicos del evento
+    for key, value in context.items():
+        if value and str(value).strip():
+            content_parts.append(f"{key}: {value}")
+    
+    return " | ".join(content_parts)
+
 @dataclass
 class GameObject:
     """Representa un objeto en el mundo del juego"""
@@ -74,6 +135,206 @@ class GameEvent:
         data['timestamp'] = self.timestamp.isoformat()
         return data
 
+@dataclass
+class ObjectHistoryRollup:
+    """
+    Resumen del historial de un objeto, actualizado evento a evento
+
+    Guarda recuentos por tipo, primera y última aparición, los últimos
+    eventos y los últimos cambios de propiedades (y de ubicación), de modo
+    que el contexto de un objeto no dependa de la longitud de su historia.
+    """
+    object_id: str
+    event_count: int = 0
+    counts_by_type: Dict[str, int] = field(default_factory=dict)
+    first_seen: Optional[str] = None
+    last_seen: Optional[str] = None
+    recent_events: List[Dict[str, Any]] = field(default_factory=list)
+    property_transitions: List[Dict[str, Any]] = field(default_factory=list)
+
+    def apply(self, event: GameEvent):
+        """Incorpora un evento (admite eventos que llegan desordenados)"""
+        timestamp = event.timestamp.isoformat()
+
+        self.event_count += 1
+        self.counts_by_type[event.event_type] = self.counts_by_type.get(event.event_type, 0) + 1
+        self.first_seen = min(filter(None, (self.first_seen, timestamp)))
+        self.last_seen = max(filter(None, (self.last_seen, timestamp)))
+
+        self.recent_events = sorted(self.recent_events + [{
+            'timestamp': timestamp,
+            'event_type': event.event_type,
+            'actor': event.actor,
+            'action': event.action,
+            'context': event.context
+        }], key=lambda entry: entry['timestamp'])[-OBJECT_HISTORY_RECENT:]
+
+        transitions = self._transitions(event, timestamp)
+        if transitions:
+            self.property_transitions = sorted(
+                self.property_transitions + transitions, key=lambda entry: entry['timestamp']
+            )[-OBJECT_HISTORY_TRANSITIONS:]
+
+    @staticmethod
+    def _transitions(event: GameEvent, timestamp: str) -> List[Dict[str, Any]]:
+        context = event.context or {}
+        if event.event_type == "object_moved":
+            changes = [("location", context.get("old_location"), context.get("new_location"))]
+        elif event.event_type == "object_modified":
+            old_properties = context.get("old_properties") or {}
+            changes = [
+                (name, old_properties.get(name), value)
+                for name, value in (context.get("property_updates") or {}).items()
+            ]
+        else:
+            return []
+
+        return [
+            {'timestamp': timestamp, 'property': name, 'from': old, 'to': new, 'actor': event.actor}
+            for name, old, new in changes if old != new
+        ]
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+class EventEmbeddingWorker:
+    """
+    Hilo en segundo plano que calcula los embeddings de los eventos
+
+    Busca eventos con embedding_vector NULL (los más recientes primero),
+    los codifica por lotes y guarda el resultado como BLOB float32. Así la
+    base de datos contiene los vectores: las copias de seguridad los
+    incluyen y el índice vectorial se puede reconstruir sin el modelo.
+
+    Cada fila anota el modelo que calculó su vector; al cambiar de modelo
+    se re-codifican también las filas de modelos anteriores.
+    """
+
+    def __init__(self, db_path: str, encode: Callable[[List[str]], Any],
+                 model_name: Optional[Callable[[], str]] = None,
+                 batch_size: int = 64, poll_interval: float = 5.0):
+        self.db_path = db_path
+        self.encode = encode
+        self.model_name = model_name or (lambda: None)
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+
+        # Modelo cuyo relleno de filas antiguas ya terminó
+        self._stale_checked_for: Optional[str] = None
+        # Recorrido de filas antiguas: de rowid alto a bajo (recientes
+        # primero), retomado en `_stale_cursor` en cada lote
+        self._stale_model: Optional[str] = None
+        self._stale_cursor = MAX_ROWID
+
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Métricas
+        self.embedded = 0
+        self.failed_batches = 0
+        self.last_error: Optional[str] = None
+
+    def start(self):
+        """Arranca el hilo si no está en marcha"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="event-embeddings", daemon=True)
+        self._thread.start()
+
+    def notify(self):
+        """Avisa de que hay eventos nuevos sin embedding"""
+        self._wake.set()
+
+    def stop(self, timeout: float = 5.0):
+        """Detiene el hilo tras el lote en curso"""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        try:
+            while not self._stopping.is_set():
+                try:
+                    processed = self.run_once(connection)
+                except Exception as e:
+                    processed = 0
+                    self.failed_batches += 1
+                    self.last_error = str(e)
+                    logger.error(f"❌ Error calculando embeddings de eventos: {e}")
+
+                # Lote completo: probablemente quedan más pendientes
+                if processed < self.batch_size:
+                    self._wake.wait(self.poll_interval)
+                    self._wake.clear()
+        finally:
+            connection.close()
+
+    def run_once(self, connection: sqlite3.Connection) -> int:
+        """Codifica y guarda un lote de eventos pendientes; retorna cuántos"""
+        model = self.model_name()
+        rows = connection.execute("""
+            SELECT id, timestamp, event_type, target, location_id, context
+            FROM game_events
+            WHERE embedding_vector IS NULL
+            ORDER BY timestamp DESC
+            LIMIT ?
+        """, (self.batch_size,)).fetchall()
+
+        stale_scan = False
+        if not rows and model and self._stale_checked_for != model:
+            # Vectores de otro modelo: recorrido completo una sola vez por
+            # modelo, paginado por rowid para no volver a leer la tabla
+            # entera en cada lote
+            if self._stale_model != model:
+                self._stale_model = model
+                self._stale_cursor = MAX_ROWID
+            rows = connection.execute("""
+                SELECT id, timestamp, event_type, target, location_id, context, rowid
+                FROM game_events
+                WHERE rowid <= ? AND embedding_model IS NOT ?
+                ORDER BY rowid DESC
+                LIMIT ?
+            """, (self._stale_cursor, model, self.batch_size)).fetchall()
+            if not rows:
+                self._stale_checked_for = model
+            stale_scan = True
+
+        if not rows:
+            return 0
+
+        texts = [
+            event_document_text(event_type, timestamp, target, location_id,
+                                json.loads(context or '{}'))
+            for _, timestamp, event_type, target, location_id, context, *_ in rows
+        ]
+        embeddings = self.encode(texts)
+        if self.model_name() != model:
+            return 0  # Cambio de modelo durante el lote: se repite con el nuevo
+
+        with connection:
+            connection.executemany(
+                "UPDATE game_events SET embedding_vector = ?, embedding_model = ? WHERE id = ?",
+                [(pack_embedding(embedding), model, row[0]) for row, embedding in zip(rows, embeddings)]
+            )
+        if stale_scan:
+            self._stale_cursor = rows[-1][6] - 1
+
+        self.embedded += len(rows)
+        return len(rows)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Progreso del relleno de embeddings"""
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'embedded': self.embedded,
+            'failed_batches': self.failed_batches,
+            'last_error': self.last_error
+        }
+
 class PerfectMemorySystem:
     """
     Sistema de memoria que garantiza persistencia perfecta de todos los elementos
@@ -86,6 +347,14 @@ class PerfectMemorySystem:
     def __init__(self, db_path: str = "perfect_memory.db"):
         self.db_path = Path(db_path)
         self.db_connection: Optional[sqlite3.Connection] = None
+        self._embedding_worker: Optional['EventEmbeddingWorker'] = None
+        
+        # Versión del mundo por ubicación: cambia cuando entran, salen o se
+        # modifican objetos (o la propia ubicación). Sirve de clave de caché
+        self._world_versions: Dict[str, int] = {}
+        self._world_versions_lock = threading.Lock()
+        self._change_listeners: List[Callable[[str, Optional['GameEvent']], None]] = []
+        
         self._initialize_database()
     
     async def initialize(self):
@@ -147,20 +416,21 @@ class PerfectMemorySystem:
         """)
         
         # Tabla de eventos (Event Sourcing)
+        self._create_events_table()
+
+        # Resumen del historial de cada objeto (ObjectHistoryRollup)
         self.db_connection.execute("""
-            CREATE TABLE IF NOT EXISTS game_events (
-                id TEXT PRIMARY KEY,
-                timestamp TEXT NOT NULL,
-                event_type TEXT NOT NULL,
-                actor TEXT NOT NULL,
-                action TEXT NOT NULL,
-                target TEXT,
-                location_id TEXT NOT NULL,
-                context TEXT, -- JSON
-                embedding_vector TEXT, -- JSON de vector de embeddings
-                FOREIGN KEY (location_id) REFERENCES locations (id)
+            CREATE TABLE IF NOT EXISTS object_history_rollups (
+                object_id TEXT PRIMARY KEY,
+                event_count INTEGER NOT NULL,
+                counts_by_type TEXT, -- JSON
+                first_seen TEXT,
+                last_seen TEXT,
+                recent_events TEXT, -- JSON
+                property_transitions TEXT -- JSON
             )
         """)
+        self._migrate_schema()
         
         # Tabla de estados del mundo (snapshots para optimización)
         self.db_connection.execute("""
@@ -188,8 +458,254 @@ class PerfectMemorySystem:
             ON game_events(location_id)
         """)
         
+        self.db_connection.execute("""
+            CREATE INDEX IF NOT EXISTS idx_events_target
+            ON game_events(target)
+        """)
+
+        # Eventos recientes de un actor (get_events_by_actor, get_actor_stats)
+        self.db_connection.execute("""
+            CREATE INDEX IF NOT EXISTS idx_events_actor_timestamp
+            ON game_events(actor, timestamp)
+        """)
+        
+        # Eventos pendientes de embedding (los busca EventEmbeddingWorker)
+        self.db_connection.execute("""
+            CREATE INDEX IF NOT EXISTS idx_events_pending_embedding
+            ON game_events(timestamp) WHERE embedding_vector IS NULL
+        """)
+        
         logger.info("✅ Base de datos inicializada correctamente")
     
+    def _create_events_table(self):
+        """Tabla de eventos; embedding_vector guarda float32 empaquetados"""
+        self.db_connection.execute("""
+            CREATE TABLE IF NOT EXISTS game_events (
+                id TEXT PRIMARY KEY,
+                timestamp TEXT NOT NULL,
+                event_type TEXT NOT NULL,
+                actor TEXT NOT NULL,
+                action TEXT NOT NULL,
+                target TEXT,
+                location_id TEXT NOT NULL,
+                context TEXT, -- JSON
+                embedding_vector BLOB, -- float32 little-endian (pack_embedding)
+                embedding_model TEXT, -- modelo que calculó embedding_vector
+                FOREIGN KEY (location_id) REFERENCES locations (id)
+            )
+        """)
+    
+    def _migrate_schema(self):
+        """
+        Migra bases de datos antiguas a SCHEMA_VERSION
+        
+        v1: reconstruye game_events con embedding_vector BLOB y convierte
+        los vectores guardados como JSON. Se ejecuta en una transacción:
+        si falla, la tabla queda como estaba.
+        v2: añade embedding_model.
+        v3: calcula el resumen de historial de los objetos existentes.
+        """
+        version = self.db_connection.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+
+        columns = {
+            row[1]: (row[2] or '').upper()
+            for row in self.db_connection.execute("PRAGMA table_info(game_events)")
+        }
+        if columns.get('embedding_vector') != 'BLOB':
+            # La tabla reconstruida ya incluye embedding_model
+            self._migrate_embeddings_to_blob()
+        elif 'embedding_model' not in columns:
+            self.db_connection.execute("ALTER TABLE game_events ADD COLUMN embedding_model TEXT")
+
+        if version < 3:
+            self._rebuild_object_rollups()
+
+        self.db_connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _rebuild_object_rollups(self):
+        """v3: recorre una vez los eventos con objeto y guarda sus resúmenes"""
+        rollups: Dict[str, ObjectHistoryRollup] = {}
+        cursor = self.db_connection.execute("""
+            SELECT id, timestamp, event_type, actor, action, target, location_id, context
+            FROM game_events WHERE target IS NOT NULL
+            ORDER BY timestamp ASC
+        """)
+        for row in cursor:
+            event = GameEvent(
+                id=row[0],
+                timestamp=datetime.fromisoformat(row[1]),
+                event_type=row[2],
+                actor=row[3],
+                action=row[4],
+                target=row[5],
+                location_id=row[6],
+                context=json.loads(row[7] or "{}")
+            )
+            rollups.setdefault(event.target, ObjectHistoryRollup(event.target)).apply(event)
+
+        self.db_connection.execute("BEGIN")
+        try:
+            self.db_connection.execute("DELETE FROM object_history_rollups")
+            for rollup in rollups.values():
+                self._save_rollup(rollup)
+            self.db_connection.execute("COMMIT")
+        except Exception:
+            self.db_connection.execute("ROLLBACK")
+            raise
+
+        logger.info(f"📦 Resumen de historial calculado para {len(rollups)} objetos")
+
+    def _load_rollup(self, object_id: str) -> Optional[ObjectHistoryRollup]:
+        row = self.db_connection.execute("""
+            SELECT event_count, counts_by_type, first_seen, last_seen,
+                   recent_events, property_transitions
+            FROM object_history_rollups WHERE object_id = ?
+        """, (object_id,)).fetchone()
+        if not row:
+            return None
+        return ObjectHistoryRollup(
+            object_id=object_id,
+            event_count=row[0],
+            counts_by_type=json.loads(row[1] or "{}"),
+            first_seen=row[2],
+            last_seen=row[3],
+            recent_events=json.loads(row[4] or "[]"),
+            property_transitions=json.loads(row[5] or "[]")
+        )
+
+    def _save_rollup(self, rollup: ObjectHistoryRollup):
+        self.db_connection.execute("""
+            INSERT OR REPLACE INTO object_history_rollups
+            (object_id, event_count, counts_by_type, first_seen, last_seen,
+             recent_events, property_transitions)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (
+            rollup.object_id,
+            rollup.event_count,
+            json.dumps(rollup.counts_by_type),
+            rollup.first_seen,
+            rollup.last_seen,
+            json.dumps(rollup.recent_events),
+            json.dumps(rollup.property_transitions)
+        ))
+
+    def _insert_event(self, event: GameEvent):
+        """Guarda el evento y actualiza el resumen de su objeto en la misma transacción"""
+        self.db_connection.execute("BEGIN")
+        try:
+            self.db_connection.execute("""
+                INSERT INTO game_events
+                (id, timestamp, event_type, actor, action, target, location_id, context, embedding_vector)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                event.id,
+                event.timestamp.isoformat(),
+                event.event_type,
+                event.actor,
+                event.action,
+                event.target,
+                event.location_id,
+                json.dumps(event.context),
+                # Si falta, lo calcula EventEmbeddingWorker en segundo plano
+                pack_embedding(event.embedding_vector) if event.embedding_vector else None
+            ))
+            if event.target:
+                rollup = self._load_rollup(event.target) or ObjectHistoryRollup(event.target)
+                rollup.apply(event)
+                self._save_rollup(rollup)
+            self.db_connection.execute("COMMIT")
+        except Exception:
+            self.db_connection.execute("ROLLBACK")
+            raise
+    
+    def _migrate_embeddings_to_blob(self):
+        """v1: embedding_vector de JSON (TEXT) a BLOB float32"""
+        legacy_vectors = [
+            (pack_embedding(vector), row[0])
+            for row in self.db_connection.execute(
+                "SELECT id, embedding_vector FROM game_events WHERE embedding_vector IS NOT NULL"
+            )
+            for vector in [unpack_embedding(row[1])] if vector
+        ]
+        
+        self.db_connection.execute("BEGIN")
+        try:
+            self.db_connection.execute("ALTER TABLE game_events RENAME TO game_events_legacy")
+            self._create_events_table()
+            self.db_connection.execute("""
+                INSERT INTO game_events
+                (id, timestamp, event_type, actor, action, target, location_id, context)
+                SELECT id, timestamp, event_type, actor, action, target, location_id, context
+                FROM game_events_legacy
+            """)
+            self.db_connection.executemany(
+                "UPDATE game_events SET embedding_vector = ? WHERE id = ?", legacy_vectors
+            )
+            self.db_connection.execute("DROP TABLE game_events_legacy")
+            self.db_connection.execute("PRAGMA user_version = 1")
+            self.db_connection.execute("COMMIT")
+        except Exception:
+            self.db_connection.execute("ROLLBACK")
+            raise
+        
+        logger.info(
+            f"📦 game_events migrada a embeddings BLOB ({len(legacy_vectors)} vectores convertidos)"
+        )
+    
+    def start_embedding_worker(self, encode: Callable[[List[str]], Any],
+                               model_name: Optional[Callable[[], str]] = None,
+                               batch_size: int = 64,
+                               poll_interval: float = 5.0) -> 'EventEmbeddingWorker':
+        """
+        Arranca el hilo que rellena game_events.embedding_vector
+        
+        `encode` recibe una lista de textos y retorna sus embeddings
+        (normalmente el modelo del servicio vectorial compartido) y
+        `model_name` indica el modelo activo para anotarlo en cada fila.
+        """
+        if self._embedding_worker is None:
+            self._embedding_worker = EventEmbeddingWorker(
+                str(self.db_path), encode, model_name, batch_size, poll_interval
+            )
+        self._embedding_worker.start()
+        return self._embedding_worker
+    
+    def stop_embedding_worker(self, timeout: float = 5.0):
+        """Detiene el hilo de embeddings (termina el lote en curso)"""
+        if self._embedding_worker is not None:
+            self._embedding_worker.stop(timeout)
+    
+    def world_version(self, location_id: str) -> int:
+        """Versión actual del contenido de una ubicación"""
+        with self._world_versions_lock:
+            return self._world_versions.get(location_id, 0)
+    
+    def _bump_world_version(self, *location_ids: Optional[str]):
+        changed = set(filter(None, location_ids))
+        with self._world_versions_lock:
+            for location_id in changed:
+                self._world_versions[location_id] = self._world_versions.get(location_id, 0) + 1
+        for location_id in changed:
+            self._notify_change(location_id, None)
+    
+    def add_change_listener(self, listener: Callable[[str, Optional['GameEvent']], None]):
+        """
+        Registra `listener(location_id, event)`
+        
+        Se llama con event=None cuando cambia la versión del mundo de la
+        ubicación y con el evento cuando se registra uno nuevo en ella.
+        """
+        self._change_listeners.append(listener)
+    
+    def _notify_change(self, location_id: str, event: Optional['GameEvent']):
+        for listener in self._change_listeners:
+            try:
+                listener(location_id, event)
+            except Exception as e:
+                logger.error(f"❌ Error notificando cambio en {location_id}: {e}")
+    
     async def create_location(self, name: str, description: str, 
                             connections: Dict[str, str] = None, 
                             properties: Dict[str, Any] = None) -> Location:
@@ -221,6 +737,7 @@ class PerfectMemorySystem:
             location.created_at.isoformat(),
             location.last_modified.isoformat()
         ))
+        self._bump_world_version(location_id)
         
         # Registrar evento
         await self._record_event(
@@ -266,6 +783,7 @@ class PerfectMemorySystem:
             game_object.last_modified.isoformat(),
             game_object.version
         ))
+        self._bump_world_version(location_id)
         
         # Registrar evento
         await self._record_event(
@@ -305,6 +823,7 @@ class PerfectMemorySystem:
             SET location_id = ?, last_modified = ?, version = version + 1
             WHERE id = ?
         """, (new_location_id, now.isoformat(), object_id))
+        self._bump_world_version(old_location, new_location_id)
         
         # Registrar evento
         await self._record_event(
@@ -352,6 +871,7 @@ class PerfectMemorySystem:
             SET properties = ?, last_modified = ?, version = version + 1
             WHERE id = ?
         """, (json.dumps(current_properties), now.isoformat(), object_id))
+        self._bump_world_version(location_id)
         
         # Registrar evento
         await self._record_event(
@@ -392,13 +912,15 @@ class PerfectMemorySystem:
         
         return objects
     
-    async def get_object_history(self, object_id: str) -> List[GameEvent]:
-        """Obtiene el historial completo de un objeto"""
+    async def get_object_history(self, object_id: str, limit: Optional[int] = None,
+                                 offset: int = 0) -> List[GameEvent]:
+        """Obtiene el historial de un objeto (completo o una página, del más antiguo)"""
         cursor = self.db_connection.execute("""
-            SELECT * FROM game_events 
-            WHERE target = ? 
+            SELECT * FROM game_events
+            WHERE target = ?
             ORDER BY timestamp ASC
-        """, (object_id,))
+            LIMIT ? OFFSET ?
+        """, (object_id, -1 if limit is None else limit, offset))
         
         events = []
         for row in cursor.fetchall():
@@ -411,12 +933,16 @@ class PerfectMemorySystem:
                 'target': row[5],
                 'location_id': row[6],
                 'context': json.loads(row[7] or "{}"),
-                'embedding_vector': json.loads(row[8] or "null")
+                'embedding_vector': unpack_embedding(row[8])
             }
             events.append(GameEvent(**event_data))
         
         return events
     
+    async def get_object_history_summary(self, object_id: str) -> ObjectHistoryRollup:
+        """Resumen del historial de un objeto (vacío si no tiene eventos)"""
+        return self._load_rollup(object_id) or ObjectHistoryRollup(object_id)
+
     async def search_events_by_content(self, search_text: str, 
                                      limit: int = 50) -> List[GameEvent]:
         """Busca eventos por contenido de texto (búsqueda simple)"""
@@ -438,7 +964,7 @@ class PerfectMemorySystem:
                 'target': row[5],
                 'location_id': row[6],
                 'context': json.loads(row[7] or "{}"),
-                'embedding_vector': json.loads(row[8] or "null")
+                'embedding_vector': unpack_embedding(row[8])
             }
             events.append(GameEvent(**event_data))
         
@@ -463,21 +989,11 @@ class PerfectMemorySystem:
         )
         
         # Guardar en base de datos
-        self.db_connection.execute("""
-            INSERT INTO game_events
-            (id, timestamp, event_type, actor, action, target, location_id, context, embedding_vector)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            event.id,
-            event.timestamp.isoformat(),
-            event.event_type,
-            event.actor,
-            event.action,
-            event.target,
-            event.location_id,
-            json.dumps(event.context),
-            None  # Embedding vector se calculará después
-        ))
+        self._insert_event(event)
+
+        if self._embedding_worker is not None:
+            self._embedding_worker.notify()
+        self._notify_change(location_id, event)
         
         return event_id
     
@@ -513,6 +1029,45 @@ class PerfectMemorySystem:
             "memory_integrity": "perfect"  # Siempre perfecto con este sistema
         }
     
+    async def get_actor_stats(self, actor: str, window: int = 50) -> Dict[str, Any]:
+        """
+        Estadísticas de los últimos `window` eventos de un actor
+
+        Una sola consulta sobre idx_events_actor_timestamp agrupa por tipo
+        de evento, ubicación y objeto (de más a menos frecuente).
+        """
+        cursor = self.db_connection.execute("""
+            WITH recent AS (
+                SELECT event_type, target, location_id FROM game_events
+                WHERE actor = ?
+                ORDER BY timestamp DESC
+                LIMIT ?
+            )
+            SELECT 'event_type', event_type, COUNT(*) FROM recent GROUP BY event_type
+            UNION ALL
+            SELECT 'location', location_id, COUNT(*) FROM recent GROUP BY location_id
+            UNION ALL
+            SELECT 'target', target, COUNT(*) FROM recent WHERE target IS NOT NULL GROUP BY target
+            ORDER BY 1, 3 DESC, 2
+        """, (actor, window))
+
+        stats = {
+            'total_actions': 0,
+            'action_distribution': {},
+            'locations_visited': [],
+            'objects_interacted': []
+        }
+        for kind, value, count in cursor.fetchall():
+            if kind == 'event_type':
+                stats['action_distribution'][value] = count
+                stats['total_actions'] += count
+            elif kind == 'location':
+                stats['locations_visited'].append(value)
+            else:
+                stats['objects_interacted'].append(value)
+
+        return stats
+
     async def get_events_by_actor(self, actor: str, limit: int = 10) -> List[GameEvent]:
         """Obtiene los eventos más recientes de un actor específico"""
         cursor = self.db_connection.execute("""
@@ -533,7 +1088,7 @@ class PerfectMemorySystem:
                 'target': row[5],
                 'location_id': row[6],
                 'context': json.loads(row[7] or '{}'),
-                'embedding_vector': json.loads(row[8] or '[]') if row[8] else None
+                'embedding_vector': unpack_embedding(row[8])
             }
             events.append(GameEvent(**event_data))
         
@@ -566,7 +1121,7 @@ class PerfectMemorySystem:
                 'target': row[5],
                 'location_id': row[6],
                 'context': json.loads(row[7] or '{}'),
-                'embedding_vector': json.loads(row[8] or '[]') if row[8] else None
+                'embedding_vector': unpack_embedding(row[8])
             }
             events.append(GameEvent(**event_data))
         
@@ -574,21 +1129,10 @@ class PerfectMemorySystem:
     
     async def add_event(self, event: GameEvent):
         """Añade un evento al historial"""
-        self.db_connection.execute("""
-            INSERT INTO game_events 
-            (id, timestamp, event_type, actor, action, target, location_id, context, embedding_vector)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            event.id,
-            event.timestamp.isoformat(),
-            event.event_type,
-            event.actor,
-            event.action,
-            event.target,
-            event.location_id,
-            json.dumps(event.context),
-            json.dumps(event.embedding_vector) if event.embedding_vector else None
-        ))
+        self._insert_event(event)
+        if not event.embedding_vector and self._embedding_worker is not None:
+            self._embedding_worker.notify()
+        self._notify_change(event.location_id, event)
         logger.info(f"✅ Evento añadido: {event.event_type} por {event.actor}")
     
     async def get_location_info(self, location_id: str) -> Dict[str, Any]:
@@ -633,6 +1177,7 @@ class PerfectMemorySystem:
     
     def close(self):
         """Cierra la conexión a la base de datos"""
+        self.stop_embedding_worker()
         if self.db_connection:
             self.db_connection.close()
             logger.info("🔒 Conexión a base de datos cerrada")
@@ -683,6 +1228,7 @@ class PerfectMemorySystem:
                 SET connections = ?, last_modified = ?
                 WHERE id = ?
             """, (json.dumps(connections), now.isoformat(), location_id))
+            self._bump_world_version(location_id)
             
             # Registrar evento
             await self._record_event(
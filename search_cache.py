@@ -0,0 +1,121 @@
+"""
+Caché de Resultados de Búsqueda para Adventure Game
+Evita repetir embedding + consulta ANN para búsquedas recurrentes
+Se invalida por versión de colección, con TTL y tamaño máximo
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class SearchResultCache:
+    """
+    Caché LRU de resultados de búsqueda con invalidación por versión
+
+    Cada colección tiene un contador de versión que se incrementa en cada
+    escritura (add/upsert/delete). Una entrada solo es válida si se
+    calculó con la versión actual de su colección y no superó el TTL.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple, Tuple[int, float, Any]]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def normalize_query(query: Optional[str]) -> str:
+        """
+        Normaliza la consulta para la clave
+
+        El modelo de embeddings no distingue mayúsculas, así que minúsculas
+        y espacios colapsados producen el mismo vector.
+        """
+        return ' '.join((query or '').lower().split())
+
+    @classmethod
+    def make_key(cls, kind: str, collection: str, query: Optional[str],
+                 filters: Optional[Dict[str, Any]], k: int, *extra: Hashable) -> Tuple:
+        """Clave (tipo, colección, consulta normalizada, filtros, k)"""
+        filters_key = json.dumps(filters, sort_keys=True, default=str) if filters else ''
+        return (kind, collection, cls.normalize_query(query), filters_key, k, *extra)
+
+    def version(self, collection: str) -> int:
+        """Versión actual de una colección"""
+        with self._lock:
+            return self._versions.get(collection, 0)
+
+    def bump(self, collection: str):
+        """Marca la colección como modificada: sus entradas dejan de ser válidas"""
+        with self._lock:
+            self._versions[collection] = self._versions.get(collection, 0) + 1
+            self.invalidations += 1
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        """Resultado cacheado o None si no existe, expiró o su colección cambió"""
+        collection = key[1]
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                version, expires_at, value = entry
+                if version == self._versions.get(collection, 0) and expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+            self.misses += 1
+            return None
+
+    def put(self, key: Tuple, value: Any, version: int):
+        """
+        Guarda un resultado calculado con `version`
+
+        La versión se toma antes de consultar: si hubo una escritura
+        mientras tanto el resultado ya nace obsoleto y no se guarda.
+        """
+        collection = key[1]
+
+        with self._lock:
+            if version != self._versions.get(collection, 0):
+                return
+
+            self._entries[key] = (version, time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Vacía la caché (las versiones se mantienen)"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Métricas de uso de la caché"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'versions': dict(self._versions)
+            }
@@ -0,0 +1,59 @@
+"""
+Prueba del Ensamblador de Contexto con Presupuesto de Tokens
+Verifica prioridades, resúmenes, recorte por líneas y orden final
+"""
+
+import os
+
+from context_budget import (
+    CONTEXT_BUDGET_ENV, SECTION_DROPPED, SECTION_FULL, SECTION_SUMMARY, SECTION_TRIMMED,
+    ContextAssembler, context_budget_for_model, estimate_tokens
+)
+
+
+def test_low_priority_sections_are_summarized_trimmed_or_dropped():
+    objects = "\n".join(["🏷️ OBJETOS PRESENTES (20):"] + [
+        f"- objeto {i}: una descripción bastante larga del objeto número {i}" for i in range(20)
+    ])
+    activity = "\n".join(["📜 ACTIVIDAD RECIENTE:"] + [f"- 10:0{i}: player mirar" for i in range(5)])
+
+    assembler = ContextAssembler(budget_tokens=120)
+    assembler.add('rules', "Eres el narrador. " * 10, 0, required=True)
+    assembler.add('guidance', "Instrucciones extensas. " * 40, 8, summary="Usa el contexto.")
+    assembler.add('objects', objects, 2)
+    assembler.add('activity', activity, 4)
+    text = assembler.assemble()
+
+    statuses = {entry['section']: entry['status'] for entry in assembler.report}
+    assert statuses['rules'] == SECTION_FULL
+    assert statuses['objects'] == SECTION_TRIMMED
+    assert statuses['guidance'] in (SECTION_SUMMARY, SECTION_DROPPED)
+    assert "líneas omitidas" in text
+    assert estimate_tokens(text) <= 120
+
+    # El orden de inserción se conserva aunque se admitan por prioridad
+    assert text.index("Eres el narrador") < text.index("OBJETOS PRESENTES")
+
+
+def test_everything_fits_and_model_budgets():
+    assembler = ContextAssembler(budget_tokens=1000)
+    assembler.add('a', "uno", 3).add('b', "dos", 1).add('vacía', "  ", 0)
+    assert assembler.assemble() == "uno\n\ndos"
+    assert [entry['section'] for entry in assembler.report] == ['a', 'b']
+
+    previous = os.environ.pop(CONTEXT_BUDGET_ENV, None)
+    try:
+        assert context_budget_for_model("llama3.2:latest") == 1536
+        assert context_budget_for_model("llama3:8b") == 2048
+        os.environ[CONTEXT_BUDGET_ENV] = "800"
+        assert context_budget_for_model("llama3.2") == 800
+    finally:
+        os.environ.pop(CONTEXT_BUDGET_ENV, None)
+        if previous is not None:
+            os.environ[CONTEXT_BUDGET_ENV] = previous
+
+
+if __name__ == "__main__":
+    test_low_priority_sections_are_summarized_trimmed_or_dropped()
+    test_everything_fits_and_model_budgets()
+    print("✅ Presupuesto de contexto OK")
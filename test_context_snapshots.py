@@ -0,0 +1,107 @@
+"""
+Prueba de las Instantáneas de Contexto por Ubicación
+Verifica la consulta sin reconstrucción, la actividad incremental y la
+regeneración en segundo plano al cambiar los objetos, y la caché de
+get_location_context por versión del mundo de cada sala
+"""
+
+import asyncio
+import tempfile
+from pathlib import Path
+
+from mcp_integration import MCPContextProvider
+from memory_system import PerfectMemorySystem
+
+
+async def _scenario(tmp: str):
+    memory = PerfectMemorySystem(str(Path(tmp) / "mundo.db"))
+    mcp = MCPContextProvider(memory)
+    workshop = await memory.create_location("Taller", "Un taller con un banco de roble.")
+    yard = await memory.create_location("Patio", "Un patio empedrado.")
+    hammer = await memory.create_object("martillo", "Un martillo pesado.", workshop.id)
+
+    builds = []
+    original_build = mcp._build_static_sections
+
+    async def counting_build(location_id):
+        builds.append(location_id)
+        return await original_build(location_id)
+
+    mcp.snapshots.build = counting_build
+
+    first = await mcp.generate_world_context_for_ai(workshop.id)
+    assert "martillo" in first and len(builds) == 1
+
+    # Comandos repetidos en la misma sala: la actividad se añade sin reconstruir
+    await memory._record_event("player_command", "player", "issued command: mirar",
+                               None, workshop.id, {})
+    second = await mcp.generate_world_context_for_ai(workshop.id)
+    assert "player issued command: mirar" in second
+    assert len(builds) == 1
+    assert mcp.snapshots.hits == 1
+
+    # Un objeto sale de la sala: regeneración en segundo plano
+    await memory.move_object(hammer.id, yard.id)
+    await asyncio.sleep(mcp.snapshots.rebuild_delay * 4)
+    assert mcp.snapshots.background_rebuilds == 1
+
+    third = await mcp.generate_world_context_for_ai(workshop.id)
+    assert "OBJETOS PRESENTES (0)" in third
+    assert len(builds) == 2
+
+    await mcp.snapshots.close()
+    memory.close()
+
+
+async def _location_cache_scenario(tmp: str):
+    memory = PerfectMemorySystem(str(Path(tmp) / "mundo.db"))
+    mcp = MCPContextProvider(memory)
+    workshop = await memory.create_location("Taller", "Un taller con un banco de roble.")
+    yard = await memory.create_location("Patio", "Un patio empedrado.")
+
+    versions = lambda: (memory.world_version(workshop.id), memory.world_version(yard.id))
+    before = versions()
+    hammer = await memory.create_object("martillo", "Un martillo pesado.", workshop.id)
+    assert versions() == (before[0] + 1, before[1])
+
+    await memory.move_object(hammer.id, yard.id)
+    assert versions() == (before[0] + 2, before[1] + 1)
+
+    await memory.modify_object_properties(hammer.id, {"oxidado": True})
+    assert versions() == (before[0] + 2, before[1] + 2)
+
+    # Sala sin cambios: la segunda consulta sale de la caché
+    first = await mcp.get_location_context(yard.id)
+    assert [obj["name"] for obj in first["objects_present"]] == ["martillo"]
+    assert await mcp.get_location_context(yard.id) == first
+    assert mcp.context_cache.hits == 1
+
+    # Un cambio en la sala cambia la clave y se vuelve a consultar
+    await memory.modify_object_properties(hammer.id, {"oxidado": False})
+    updated = await mcp.get_location_context(yard.id)
+    assert updated["objects_present"][0]["properties"]["oxidado"] is False
+    assert mcp.context_cache.hits == 1
+
+    # Los cambios en otra sala no invalidan esta
+    await memory.create_object("sierra", "Una sierra.", workshop.id)
+    assert await mcp.get_location_context(yard.id) == updated
+    assert mcp.context_cache.hits == 2
+
+    await mcp.snapshots.close()
+    memory.close()
+
+
+def test_location_context_cache_follows_world_version():
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_location_cache_scenario(tmp))
+
+
+def test_snapshots_lookup_and_incremental_updates():
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_scenario(tmp))
+
+
+if __name__ == "__main__":
+    test_snapshots_lookup_and_incremental_updates()
+    test_location_context_cache_follows_world_version()
+    print("✅ Instantáneas de contexto OK")
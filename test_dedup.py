@@ -0,0 +1,99 @@
+"""
+Prueba de Supresión de Casi-Duplicados
+Verifica normalización, colapso exacto/aproximado y rango temporal
+"""
+
+from dedup import (
+    DUPLICATE_ID_SAMPLE, NearDuplicateIndex, estimated_jaccard, minhash, normalize_for_dedup
+)
+
+
+HAMMER_ID = "3f2a9c1e-8b4d-4e6f-9a0b-1c2d3e4f5a6b"
+SAW_ID = "7d8e9f0a-1b2c-4d3e-8f4a-5b6c7d8e9f0a"
+
+
+def _command_event(timestamp: str) -> str:
+    return (f"Evento: player_command | Timestamp: {timestamp} | "
+            f"Ubicación: taller | command: mirar | raw_input: True")
+
+
+def test_normalization_keeps_entity_ids():
+    text = f"Evento: object_moved | Timestamp: 2025-01-01T10:00:00 | Objeto: {HAMMER_ID} | pasos: 3"
+    normalized = normalize_for_dedup(text)
+    assert "2025" not in normalized
+    assert HAMMER_ID in normalized
+    assert "pasos: #" in normalized
+
+
+def test_collapse_repeated_commands_with_time_range():
+    index = NearDuplicateIndex()
+
+    first_metadata = {}
+    assert index.check("evt_1", _command_event("2025-01-01T10:00:00"), first_metadata,
+                       "2025-01-01T10:00:00") is None
+    assert first_metadata["occurrence_count"] == 1
+
+    group = index.check("evt_2", _command_event("2025-01-01T12:30:00"), {}, "2025-01-01T12:30:00")
+    group = index.check("evt_3", _command_event("2025-01-01T09:15:00"), {}, "2025-01-01T09:15:00")
+
+    assert group.doc_id == "evt_1"
+    assert group.duplicate_ids == ["evt_2", "evt_3"]
+    # El dict del canónico se actualiza en su lugar
+    assert first_metadata["occurrence_count"] == 3
+    assert first_metadata["first_seen"] == "2025-01-01T09:15:00"
+    assert first_metadata["last_seen"] == "2025-01-01T12:30:00"
+
+
+def test_different_objects_are_not_duplicates():
+    index = NearDuplicateIndex()
+    hammer = f"Evento: object_moved | Objeto: {HAMMER_ID} | Ubicación: taller"
+    saw = f"Evento: object_moved | Objeto: {SAW_ID} | Ubicación: taller"
+
+    assert index.check("evt_1", hammer, {}, "") is None
+    assert index.check("evt_2", saw, {}, "") is None
+    assert index.get_stats()["canonical_documents"] == 2
+
+
+def test_near_duplicate_by_minhash():
+    base = ("Player p1: mirar alrededor del viejo taller de carpintería buscando "
+            "herramientas útiles para reparar la puerta principal del castillo abandonado")
+    variant = base + " ahora"
+
+    similarity = estimated_jaccard(minhash(normalize_for_dedup(base)),
+                                   minhash(normalize_for_dedup(variant)))
+    assert similarity > 0.8
+
+    index = NearDuplicateIndex()
+    assert index.check("conv_1", base, {}, "") is None
+    assert index.check("conv_2", variant, {}, "").doc_id == "conv_1"
+    assert index.check("conv_3", "Player p1: abrir el cofre con la llave de bronce", {}, "") is None
+
+
+def test_memory_is_bounded():
+    index = NearDuplicateIndex(max_canonical=2)
+
+    # Un comando muy repetido: contador completo, muestra de ids acotada
+    for i in range(100):
+        group = index.check(f"evt_{i}", _command_event(f"2025-01-01T10:00:{i % 60:02d}"), {}, "")
+    assert group.count == 100
+    assert group.duplicate_ids == [f"evt_{i}" for i in range(100 - DUPLICATE_ID_SAMPLE, 100)]
+
+    hammer = f"Evento: object_moved | Objeto: {HAMMER_ID} | Ubicación: taller"
+    saw = f"Evento: object_moved | Objeto: {SAW_ID} | Ubicación: taller"
+    assert index.check("evt_hammer", hammer, {}, "") is None
+    assert index.check("evt_saw", saw, {}, "") is None
+
+    # El comando (el menos reciente) se olvida: su siguiente aparición es canónica
+    stats = index.get_stats()
+    assert stats["canonical_documents"] == 2 and stats["canonical_evicted"] == 1
+    assert index.check("evt_again", _command_event("2025-01-02T10:00:00"), {}, "") is None
+    assert index.check("evt_saw_2", saw, {}, "").doc_id == "evt_saw"
+
+
+if __name__ == "__main__":
+    test_normalization_keeps_entity_ids()
+    test_collapse_repeated_commands_with_time_range()
+    test_different_objects_are_not_duplicates()
+    test_near_duplicate_by_minhash()
+    test_memory_is_bounded()
+    print("✅ Supresión de duplicados OK")
@@ -0,0 +1,82 @@
+"""
+Prueba del Registro de Modelos de Embeddings
+Verifica el control de dimensión, la escritura dual y el corte de modelo
+"""
+
+import tempfile
+
+from embedding_registry import (
+    CollectionEmbedding, EmbeddingDimensionMismatch, EmbeddingRegistry,
+    GuardedCollection, physical_collection_name
+)
+
+
+class MemoryCollection:
+    """Colección mínima en memoria con la interfaz de ChromaDB usada"""
+
+    def __init__(self):
+        self.vectors = {}
+
+    def upsert(self, ids, embeddings=None, documents=None, metadatas=None):
+        for doc_id, embedding in zip(ids, embeddings):
+            self.vectors[doc_id] = list(embedding)
+
+    add = upsert
+
+    def delete(self, ids=None, where=None):
+        for doc_id in ids or []:
+            self.vectors.pop(doc_id, None)
+
+    def query(self, query_embeddings, n_results=10, **kwargs):
+        return {'ids': [list(self.vectors)[:n_results]]}
+
+    def count(self):
+        return len(self.vectors)
+
+
+def test_dimension_guard_dual_write_and_cutover():
+    old, new = MemoryCollection(), MemoryCollection()
+    collection = GuardedCollection(old, CollectionEmbedding("game_events", "game_events", "a", 2))
+
+    collection.add(ids=["e1"], embeddings=[[1.0, 0.0]], documents=["abrir cofre"])
+    try:
+        collection.add(ids=["e2"], embeddings=[[1.0, 0.0, 0.0]], documents=["mover martillo"])
+        assert False, "debería rechazar la dimensión"
+    except EmbeddingDimensionMismatch:
+        pass
+    assert old.count() == 1
+
+    collection.start_dual_write(new, lambda texts: [[0.0, 0.0, 1.0] for _ in texts])
+    collection.upsert(ids=["e3"], embeddings=[[0.0, 1.0]], documents=["coger llave"])
+    assert new.vectors == {"e3": [0.0, 0.0, 1.0]}
+
+    new_name = physical_collection_name("game_events", "modelo/B")
+    collection.cutover(CollectionEmbedding("game_events", new_name, "modelo/B", 3))
+    assert collection.target is new
+    assert collection.count() == 1
+
+    # Consultas con vectores del modelo anterior siguen yendo a la colección retirada
+    assert collection.query(query_embeddings=[[1.0, 0.0]])['ids'] == [["e1", "e3"]]
+    assert collection.query(query_embeddings=[[0.0, 0.0, 1.0]])['ids'] == [["e3"]]
+
+
+def test_registry_persists_cutover():
+    with tempfile.TemporaryDirectory() as tmp:
+        registry = EmbeddingRegistry(tmp)
+        registry.register(CollectionEmbedding("rag_memories", "rag_memories", "a", 384))
+        assert registry.active_model == "a"
+
+        name = physical_collection_name("rag_memories", "b")
+        registry.cutover("b", [CollectionEmbedding("rag_memories", name, "b", 768)], ["rag_memories"])
+
+        reloaded = EmbeddingRegistry(tmp)
+        assert reloaded.active_model == "b"
+        assert reloaded.get("rag_memories").physical_name == "rag_memories__b"
+        assert reloaded.get("rag_memories").dimension == 768
+        assert reloaded.to_dict()['retired'] == ["rag_memories"]
+
+
+if __name__ == "__main__":
+    test_dimension_guard_dual_write_and_cutover()
+    test_registry_persists_cutover()
+    print("✅ Registro de embeddings OK")
@@ -0,0 +1,137 @@
+"""
+Prueba de Embeddings de Eventos en SQLite
+Verifica la migración de JSON a BLOB y el relleno en segundo plano
+"""
+
+import json
+import sqlite3
+import tempfile
+from pathlib import Path
+
+from memory_system import (
+    SCHEMA_VERSION, EventEmbeddingWorker, PerfectMemorySystem,
+    pack_embedding, unpack_embedding
+)
+
+
+def _legacy_database(path: Path):
+    """Base de datos con el esquema anterior (embedding_vector TEXT)"""
+    connection = sqlite3.connect(path)
+    connection.execute("""
+        CREATE TABLE game_events (
+            id TEXT PRIMARY KEY, timestamp TEXT NOT NULL, event_type TEXT NOT NULL,
+            actor TEXT NOT NULL, action TEXT NOT NULL, target TEXT,
+            location_id TEXT NOT NULL, context TEXT, embedding_vector TEXT
+        )
+    """)
+    connection.executemany("INSERT INTO game_events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+        ("e1", "2025-01-01T10:00:00", "object_moved", "player", "mover", "martillo",
+         "taller", json.dumps({"pasos": 2}), json.dumps([0.5, -1.0, 2.0])),
+        ("e2", "2025-01-02T10:00:00", "player_command", "player", "mirar", None,
+         "taller", "{}", None),
+    ])
+    connection.commit()
+    connection.close()
+
+
+def test_pack_roundtrip_and_legacy_json():
+    assert unpack_embedding(pack_embedding([0.25, -1.5])) == [0.25, -1.5]
+    assert unpack_embedding("[1, 2]") == [1.0, 2.0]
+    assert unpack_embedding(None) is None
+
+
+def test_migration_and_worker_fill_blobs():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "juego.db"
+        _legacy_database(db_path)
+
+        memory = PerfectMemorySystem(str(db_path))
+        connection = memory.db_connection
+        assert connection.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+
+        column_types = {row[1]: row[2] for row in connection.execute("PRAGMA table_info(game_events)")}
+        assert column_types["embedding_vector"] == "BLOB"
+        assert column_types["embedding_model"] == "TEXT"
+
+        stored = connection.execute(
+            "SELECT embedding_vector FROM game_events WHERE id = 'e1'"
+        ).fetchone()[0]
+        assert isinstance(stored, bytes)
+        assert unpack_embedding(stored) == [0.5, -1.0, 2.0]
+
+        encoded = []
+
+        def encode(texts):
+            encoded.extend(texts)
+            return [[float(len(text)), 1.0] for text in texts]
+
+        model = ["modelo-a"]
+        worker = EventEmbeddingWorker(str(db_path), encode, lambda: model[0], batch_size=10)
+        assert worker.run_once(sqlite3.connect(db_path)) == 1
+        assert encoded[0].startswith("Evento: player_command")
+
+        filled, filled_model = connection.execute(
+            "SELECT embedding_vector, embedding_model FROM game_events WHERE id = 'e2'"
+        ).fetchone()
+        assert unpack_embedding(filled) == [float(len(encoded[0])), 1.0]
+        assert filled_model == "modelo-a"
+
+        # e1 venía de la migración sin modelo: se re-codifica una vez
+        assert worker.run_once(sqlite3.connect(db_path)) == 1
+        assert worker.run_once(sqlite3.connect(db_path)) == 0
+
+        # Con otro modelo activo se re-codifican todas las filas
+        model[0] = "modelo-b"
+        assert worker.run_once(sqlite3.connect(db_path)) == 2
+        memory.close()
+
+
+def test_stale_rows_are_paged_by_rowid():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "juego.db"
+        _legacy_database(db_path)
+        memory = PerfectMemorySystem(str(db_path))
+        memory.db_connection.executemany(
+            "INSERT INTO game_events (id, timestamp, event_type, actor, action, location_id, context) "
+            "VALUES (?, ?, 'player_command', 'player', 'mirar', 'taller', '{}')",
+            [(f"extra_{i}", f"2025-01-03T10:00:{i:02d}") for i in range(7)]
+        )
+        memory.db_connection.commit()
+
+        model = ["modelo-a"]
+        worker = EventEmbeddingWorker(str(db_path), lambda texts: [[1.0]] * len(texts),
+                                      lambda: model[0], batch_size=3)
+        connection = sqlite3.connect(db_path)
+
+        def run_until_idle():
+            batches = []
+            while True:
+                processed = worker.run_once(connection)
+                if not processed:
+                    return batches
+                batches.append(processed)
+
+        assert sum(run_until_idle()) == 9
+
+        # Migración de modelo: cada lote retoma el recorrido donde lo dejó el anterior
+        model[0] = "modelo-b"
+        assert run_until_idle() == [3, 3, 3]
+        assert connection.execute(
+            "SELECT COUNT(*) FROM game_events WHERE embedding_model = 'modelo-b'"
+        ).fetchone()[0] == 9
+
+        plan = " ".join(row[-1] for row in connection.execute("""
+            EXPLAIN QUERY PLAN
+            SELECT id FROM game_events WHERE rowid <= ? AND embedding_model IS NOT ?
+            ORDER BY rowid DESC LIMIT 3
+        """, (9, "modelo-b")))
+        assert "rowid<?" in plan.replace(" ", "")
+        connection.close()
+        memory.close()
+
+
+if __name__ == "__main__":
+    test_pack_roundtrip_and_legacy_json()
+    test_migration_and_worker_fill_blobs()
+    test_stale_rows_are_paged_by_rowid()
+    print("✅ Embeddings de eventos OK")
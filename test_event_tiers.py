@@ -0,0 +1,101 @@
+"""
+Prueba de los Niveles Caliente/Frío de Eventos
+Verifica el índice en memoria, los filtros where y el enrutado entre niveles
+"""
+
+from datetime import datetime, timezone
+
+from event_tiers import HotEventIndex, TieredEventCollection
+
+
+class ColdCollection:
+    """Nivel frío mínimo con la interfaz de collection.query"""
+
+    def __init__(self, doc_id, distance):
+        self.doc_id = doc_id
+        self.distance = distance
+        self.queries = 0
+
+    def query(self, query_embeddings, n_results, where=None, include=None):
+        self.queries += 1
+        return {
+            'ids': [[self.doc_id]],
+            'documents': [["evento antiguo"]],
+            'metadatas': [[{'location_id': 'taller', 'timestamp_epoch': 1.0}]],
+            'distances': [[self.distance]]
+        }
+
+
+def _hot_index():
+    index = HotEventIndex()
+    index.upsert(
+        ["evt_a", "evt_b", "evt_c"],
+        [[1.0, 0.0], [0.0, 1.0], [0.7, 0.7]],
+        ["mover martillo", "abrir cofre", "mover sierra"],
+        [
+            {'location_id': 'taller', 'timestamp_epoch': 100.0},
+            {'location_id': 'bodega', 'timestamp_epoch': 200.0},
+            {'location_id': 'taller', 'timestamp_epoch': 300.0},
+        ]
+    )
+    return index
+
+
+def test_hot_query_with_where():
+    index = _hot_index()
+
+    results = index.query([[1.0, 0.0]], 2, where={'location_id': 'taller'})
+    assert results['ids'] == [["evt_a", "evt_c"]]
+    assert results['distances'][0][0] == 0.0
+
+    results = index.query([[1.0, 0.0]], 5, where={
+        '$and': [{'location_id': 'taller'}, {'timestamp_epoch': {'$gte': 200.0}}]
+    })
+    assert results['ids'] == [["evt_c"]]
+
+    index.delete(["evt_c"])
+    index.upsert(["evt_d"], [[0.0, 1.0]], ["coger llave"], [{'timestamp_epoch': 400.0}])
+    assert index.count() == 3
+    assert index.compaction_candidates(cutoff_epoch=150.0, max_documents=10) == ["evt_a"]
+    assert index.compaction_candidates(cutoff_epoch=0.0, max_documents=1) == ["evt_a", "evt_b"]
+
+
+def test_recurring_events_age_by_last_seen_and_empty_queries():
+    index = _hot_index()
+    # evt_a apareció primero pero se repitió después que los demás
+    recent = datetime.fromtimestamp(500.0, tz=timezone.utc).isoformat()
+    index.update_metadata(["evt_a"], [{'location_id': 'taller', 'timestamp_epoch': 100.0,
+                                       'last_seen': recent, 'occurrence_count': 3}])
+
+    assert index.compaction_candidates(cutoff_epoch=250.0, max_documents=10) == ["evt_b"]
+    assert index.compaction_candidates(cutoff_epoch=0.0, max_documents=1) == ["evt_b", "evt_c"]
+
+    assert index.query([[1.0, 0.0], [0.0, 1.0]], 0) == {
+        'ids': [[], []], 'documents': [[], []], 'metadatas': [[], []], 'distances': [[], []]
+    }
+
+
+def test_auto_tier_falls_back_to_cold_only_when_needed():
+    index = _hot_index()
+    cold = ColdCollection("evt_viejo", distance=0.1)
+
+    auto = TieredEventCollection(index, cold, "auto")
+    results = auto.query([[1.0, 0.0]], 1)
+    assert results['ids'] == [["evt_a"]]
+    assert cold.queries == 0
+
+    # Faltan resultados calientes: se consulta el nivel frío y se fusiona por distancia
+    results = auto.query([[1.0, 0.0]], 4)
+    assert cold.queries == 1
+    assert results['ids'][0][:2] == ["evt_a", "evt_viejo"]
+
+    TieredEventCollection(index, cold, "hot").query([[1.0, 0.0]], 4)
+    assert cold.queries == 1
+    assert index.cold_fallbacks == 1
+
+
+if __name__ == "__main__":
+    test_hot_query_with_where()
+    test_recurring_events_age_by_last_seen_and_empty_queries()
+    test_auto_tier_falls_back_to_cold_only_when_needed()
+    print("✅ Niveles de eventos OK")
@@ -0,0 +1,152 @@
+"""
+Prueba del Reconocimiento de Comandos Mecánicos
+Verifica qué comandos toman el camino rápido y que las direcciones se
+reconocen como palabras completas
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+from types import SimpleNamespace
+
+from adventure_game import NARRATOR_BUSY_RESPONSE, IntelligentAdventureGame
+from game_mechanics import (
+    ACTION_DROP, ACTION_INVENTORY, ACTION_LOOK, ACTION_MOVE, ACTION_TAKE, TAKE_VERBS,
+    MechanicalCommand, find_direction, matches_object_name, names_only_object,
+    parse_mechanical_command, resolve_object, words_after_verb
+)
+
+
+def test_parse_mechanical_commands():
+    assert parse_mechanical_command("norte") == MechanicalCommand(ACTION_MOVE, "norte")
+    assert parse_mechanical_command("O") == MechanicalCommand(ACTION_MOVE, "oeste")
+    assert parse_mechanical_command("ir al este") == MechanicalCommand(ACTION_MOVE, "este")
+    assert parse_mechanical_command("go north!") == MechanicalCommand(ACTION_MOVE, "norte")
+    assert parse_mechanical_command("tomar la llave") == MechanicalCommand(ACTION_TAKE, "la llave")
+    assert parse_mechanical_command("soltar martillo") == MechanicalCommand(ACTION_DROP, "martillo")
+    assert parse_mechanical_command("inventario") == MechanicalCommand(ACTION_INVENTORY)
+    assert parse_mechanical_command("mirar") == MechanicalCommand(ACTION_LOOK)
+
+
+def test_free_form_commands_go_to_the_narrator():
+    assert parse_mechanical_command("mirar el libro con atención") is None
+    assert parse_mechanical_command("hablar con el fantasma") is None
+    assert parse_mechanical_command("ir norte y luego sur") is None
+    assert parse_mechanical_command("tomar") is None
+    assert parse_mechanical_command("") is None
+
+
+def test_directions_are_whole_words():
+    # Antes "s" o "e" dentro de cualquier palabra movían al jugador
+    assert find_direction("abrir la puerta") is None
+    assert find_direction("leer este libro") is None
+    assert find_direction("grito o canto") is None
+    assert find_direction("corro hacia el norte") == "norte"
+    assert find_direction("corro hacia el e") == "este"
+    assert find_direction("s") == "sur"
+
+
+def test_object_names():
+    assert matches_object_name("llave oxidada", "la llave")
+    assert matches_object_name("llave oxidada", "con cuidado la llave oxidada")
+    assert matches_object_name("libro de hechizos", "este libro")
+    assert not matches_object_name("llave oxidada", "el libro")
+    assert words_after_verb("con cuidado tomo la llave", TAKE_VERBS) == "la llave"
+    assert words_after_verb("mirar la llave", TAKE_VERBS) is None
+
+
+def test_take_and_drop_need_exactly_one_object():
+    objects = [SimpleNamespace(name="llave oxidada"), SimpleNamespace(name="llave dorada"),
+               SimpleNamespace(name="libro de hechizos")]
+    assert resolve_object("el libro", objects) is objects[2]
+    assert resolve_object("llave oxidada", objects) is objects[0]
+    assert resolve_object("la llave", objects) is None          # ambigua
+    assert resolve_object("asiento", objects) is None
+    assert not names_only_object("llave oxidada", "la llave y abre la puerta")
+
+
+def test_fast_path_skips_the_narrator():
+    async def scenario():
+        tmp = tempfile.mkdtemp()
+        game = IntelligentAdventureGame(os.path.join(tmp, "mundo.db"),
+                                        vector_db_path=os.path.join(tmp, "vector_db"))
+        await game.initialize_world()
+        prompts = []
+        llm_players = []
+
+        async def fake_generate(model, prompt, system=None, **kwargs):
+            prompts.append(prompt)
+            llm_players.append(kwargs.get("player_id"))
+            return "El narrador responde."
+
+        game.ollama.generate = fake_generate
+        try:
+            start = game.current_location_id
+            assert "llave oxidada" in await game.process_command_async("coge la llave")
+            for command in ("toma asiento", "deja de llorar", "coge la llave y abre la puerta"):
+                assert await game.process_command_async(command) == "El narrador responde."
+            assert await game.process_command_async("norte") != "El narrador responde."
+
+            assert game.current_location_id != start
+            assert prompts == [f"Comando del jugador: {command}" for command in
+                               ("toma asiento", "deja de llorar", "coge la llave y abre la puerta")]
+            assert game.command_stats["fast_path"] == 2
+
+            # Con varios jugadores en la misma partida, el turno del planificador es por jugador
+            await game.process_command_async("toma asiento", player_id="ana")
+            assert llm_players == ["player"] * 3 + ["ana"]
+        finally:
+            await game.close()
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    asyncio.run(scenario())
+
+
+def test_mechanical_narration_reaches_listeners():
+    async def scenario():
+        tmp = tempfile.mkdtemp()
+        game = IntelligentAdventureGame(os.path.join(tmp, "mundo.db"), narrate_mechanics=True,
+                                        vector_db_path=os.path.join(tmp, "vector_db"))
+        await game.initialize_world()
+        narrations = []
+        prompts = []
+        replies = ["La llave cruje entre tus dedos.", NARRATOR_BUSY_RESPONSE]
+
+        async def fake_generate(model, prompt, system=None, **kwargs):
+            prompts.append((prompt, kwargs.get("player_id")))
+            return replies.pop(0)
+
+        async def listener(player_id, command, narration):
+            narrations.append((player_id, command, narration))
+
+        game.ollama.generate = fake_generate
+        game.add_narration_listener(listener)
+        try:
+            # El resultado mecánico llega al momento; la narración, después
+            response = await game.process_command_async("coge la llave", player_id="ana")
+            assert "llave oxidada" in response and narrations == []
+            await asyncio.gather(*game._narration_tasks)
+            assert narrations == [("ana", "coge la llave", "La llave cruje entre tus dedos.")]
+            assert response in prompts[0][0] and prompts[0][1] == "ana"
+
+            # Con el narrador saturado la narración opcional se descarta
+            await game.process_command_async("deja la llave", player_id="ana")
+            await asyncio.gather(*game._narration_tasks)
+            assert len(narrations) == 1 and game.command_stats["narrations"] == 1
+        finally:
+            await game.close()
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    test_parse_mechanical_commands()
+    test_free_form_commands_go_to_the_narrator()
+    test_directions_are_whole_words()
+    test_object_names()
+    test_take_and_drop_need_exactly_one_object()
+    test_fast_path_skips_the_narrator()
+    test_mechanical_narration_reaches_listeners()
+    print("✅ Pruebas de comandos mecánicos completadas")
@@ -0,0 +1,108 @@
+"""
+Prueba de la Búsqueda Híbrida (léxica + vectorial)
+Verifica el índice FTS5, la fusión RRF y el modo degradado sin modelo
+"""
+
+import asyncio
+import tempfile
+from pathlib import Path
+
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from vector_search import VectorSearchEngine
+
+
+def _sample_documents():
+    ids = ["obj_1_1", "obj_2_1", "obj_3_1"]
+    documents = [
+        "Nombre: martillo | Descripción: Un martillo de acero",
+        "Nombre: llave de bronce | Descripción: Abre la puerta de la cripta",
+        "Nombre: sierra | Descripción: Herramienta de carpintería",
+    ]
+    metadatas = [
+        {"object_id": "1", "name": "martillo", "location_id": "taller"},
+        {"object_id": "2", "name": "llave de bronce", "location_id": "cripta"},
+        {"object_id": "3", "name": "sierra", "location_id": "taller"},
+    ]
+    return ids, documents, metadatas
+
+
+def test_lexical_index_bm25_and_filters():
+    with tempfile.TemporaryDirectory() as tmp:
+        index = LexicalIndex(str(Path(tmp) / "lexical.db"))
+        index.upsert("objects", *_sample_documents())
+
+        results = index.search("objects", "llave de bronce", limit=3)
+        assert results[0][0] == "obj_2_1"
+
+        # Sin acentos también encuentra ("carpinteria")
+        results = index.search("objects", "carpinteria", limit=3)
+        assert [r[0] for r in results] == ["obj_3_1"]
+
+        results = index.search("objects", "martillo sierra", limit=5,
+                               filters={"location_id": "taller"})
+        assert {r[0] for r in results} == {"obj_1_1", "obj_3_1"}
+
+        # Reemplazo por id y borrado
+        index.upsert("objects", ["obj_1_1"], ["Nombre: maza"], [{"name": "maza"}])
+        assert index.search("objects", "martillo", limit=3) == []
+        index.delete(["obj_1_1"])
+        assert index.count("objects") == 2
+
+        # Entrada del jugador con sintaxis FTS no rompe la consulta
+        assert index.search("objects", 'martillo" OR (', limit=3) == []
+        index.close()
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], k=60)
+    assert fused[0][0] == "b"
+    assert {doc_id for doc_id, _ in fused} == {"a", "b", "c", "d"}
+
+
+def test_hybrid_search_degrades_to_lexical():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = VectorSearchEngine(str(Path(tmp) / "game.db"), str(Path(tmp) / "vector_db"))
+            engine.lexical_index.upsert("objects", *_sample_documents())
+
+            # Sin modelo de embeddings la rama vectorial falla y se usa solo BM25
+            engine._ensure_initialized = lambda: (_ for _ in ()).throw(RuntimeError("sin modelo"))
+            results = await engine.hybrid_search("objects", "martillo", limit=2)
+            assert results
+            assert results[0].document.metadata["name"] == "martillo"
+            engine.lexical_index.close()
+
+    asyncio.run(run())
+
+
+def test_exact_name_match_skips_vector_query():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = VectorSearchEngine(str(Path(tmp) / "game.db"), str(Path(tmp) / "vector_db"))
+            engine.lexical_index.upsert("objects", *_sample_documents())
+            vector_queries = []
+
+            def query_collection(collection_type, query, limit, filters=None):
+                vector_queries.append(query)
+                return []
+
+            engine._query_collection = query_collection
+            results = await engine.hybrid_search("objects", "martillo", limit=1)
+            assert [r.document.id for r in results] == ["obj_1_1"]
+            assert results[0].context["fusion"] == "lexical_exact"
+            assert vector_queries == []
+
+            # Sin coincidencias exactas suficientes sí se consulta el índice vectorial
+            await engine.hybrid_search("objects", "herramienta", limit=2)
+            assert vector_queries == ["herramienta"]
+            engine.lexical_index.close()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_lexical_index_bm25_and_filters()
+    test_reciprocal_rank_fusion()
+    test_hybrid_search_degrades_to_lexical()
+    test_exact_name_match_skips_vector_query()
+    print("✅ Búsqueda híbrida OK")
@@ -0,0 +1,57 @@
+"""
+Prueba de la Cola de Ingestión por Lotes
+Verifica agrupación, codificación única por lote y métricas
+"""
+
+import threading
+
+from ingestion_queue import IngestionQueue
+
+
+def test_batches_encode_once_and_keep_latest():
+    encode_calls = []
+    written = {}
+    release = threading.Event()
+
+    def encode(texts):
+        release.wait(2)  # Simula un modelo lento: los documentos se acumulan
+        encode_calls.append(len(texts))
+        return [[float(len(text))] for text in texts]
+
+    def writer(ids, embeddings, documents, metadatas):
+        for doc_id, document in zip(ids, documents):
+            written[doc_id] = document
+
+    ingestion = IngestionQueue(encode, max_batch_size=50, max_delay=0.2)
+    ingestion.register_writer("events", writer)
+
+    for i in range(10):
+        assert ingestion.submit("events", f"evt_{i}", f"evento {i}", {})
+    ingestion.submit("events", "evt_0", "evento 0 actualizado", {})
+    release.set()
+
+    assert ingestion.flush(timeout=5)
+    assert sum(encode_calls) == 10
+    assert len(encode_calls) <= 2
+    assert written["evt_0"] == "evento 0 actualizado"
+
+    stats = ingestion.get_stats()
+    assert stats["depth"] == 0
+    assert stats["written"] == 10
+    assert stats["max_lag_seconds"] > 0
+    ingestion.stop()
+
+
+def test_unknown_collection_rejected():
+    ingestion = IngestionQueue(lambda texts: [[0.0] for _ in texts])
+    try:
+        ingestion.submit("desconocida", "x", "texto", {})
+    except KeyError:
+        return
+    raise AssertionError("Se esperaba KeyError")
+
+
+if __name__ == "__main__":
+    test_batches_encode_once_and_keep_latest()
+    test_unknown_collection_rejected()
+    print("✅ Cola de ingestión OK")
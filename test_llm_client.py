@@ -0,0 +1,231 @@
+"""
+Prueba del Cliente LLM Compartido
+Verifica reintentos, circuit breaker, streaming y concurrencia contra un
+servidor Ollama simulado en local
+"""
+
+import asyncio
+import json
+import time
+
+from aiohttp import web
+
+from llm_client import (
+    CIRCUIT_CLOSED, CIRCUIT_OPEN, CircuitBreaker, LLMCircuitOpen, LLMClient, LLMError,
+    LLMHTTPError
+)
+
+
+async def _stub_server(handler):
+    """Servidor /api/generate en un puerto libre; retorna (runner, url)"""
+    app = web.Application()
+    app.router.add_post("/api/generate", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def test_retries_transient_errors():
+    async def scenario():
+        calls = []
+
+        async def handler(request):
+            calls.append(await request.json())
+            if len(calls) < 3:
+                return web.Response(status=503, text="cargando modelo")
+            return web.json_response({"response": "hola"})
+
+        runner, url = await _stub_server(handler)
+        client = LLMClient(url, retry_backoff=0.01)
+        try:
+            assert await client.generate({"model": "m", "prompt": "p"}) == "hola"
+            assert len(calls) == 3 and calls[0]["stream"] is False
+            assert client.retries == 2
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    asyncio.run(scenario())
+
+
+def test_client_errors_are_not_retried_and_open_the_circuit():
+    async def scenario():
+        calls = []
+
+        async def handler(request):
+            calls.append(1)
+            return web.Response(status=404, text="modelo no encontrado")
+
+        runner, url = await _stub_server(handler)
+        client = LLMClient(url, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+        try:
+            for _ in range(2):
+                try:
+                    await client.generate({"model": "m", "prompt": "p"})
+                    assert False, "debería fallar"
+                except LLMHTTPError as e:
+                    assert e.status == 404
+            assert len(calls) == 2
+            assert client.breaker.state == CIRCUIT_OPEN
+
+            try:
+                await client.generate({"model": "m", "prompt": "p"})
+                assert False, "el circuito debería rechazar"
+            except LLMCircuitOpen:
+                pass
+            assert len(calls) == 2 and client.rejected == 1
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    asyncio.run(scenario())
+
+
+def test_half_open_probe_closes_circuit():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.state == CIRCUIT_OPEN
+    assert breaker.allow()          # sonda en half_open
+    assert not breaker.allow()      # solo una a la vez
+    breaker.record_success()
+    assert breaker.state == CIRCUIT_CLOSED and breaker.allow()
+
+
+def test_cancelled_half_open_probe_releases_the_circuit():
+    async def scenario():
+        release = asyncio.Event()
+
+        async def handler(request):
+            body = await request.json()
+            if body["prompt"] == "lenta":
+                await release.wait()
+            return web.json_response({"response": "ok"})
+
+        runner, url = await _stub_server(handler)
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+        breaker.record_failure()
+        client = LLMClient(url, breaker=breaker)
+        try:
+            # La sonda se cancela a mitad (wait_for, cierre del juego...)
+            try:
+                await asyncio.wait_for(client.generate({"model": "m", "prompt": "lenta"}), 0.1)
+                assert False, "debería expirar"
+            except asyncio.TimeoutError:
+                pass
+            release.set()
+
+            # El circuito no queda bloqueado: la siguiente llamada vuelve a probar
+            assert await client.generate({"model": "m", "prompt": "p"}) == "ok"
+            assert breaker.state == CIRCUIT_CLOSED
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    asyncio.run(scenario())
+
+
+def test_token_callback_errors_do_not_open_the_circuit():
+    async def scenario():
+        async def handler(request):
+            response = web.StreamResponse()
+            await response.prepare(request)
+            await response.write((json.dumps({"response": "Hola", "done": True}) + "\n").encode())
+            return response
+
+        class Disconnected(Exception):
+            pass
+
+        async def on_token(token):
+            raise Disconnected("cliente desconectado")
+
+        runner, url = await _stub_server(handler)
+        client = LLMClient(url, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+        try:
+            for _ in range(5):
+                try:
+                    await client.generate({"model": "m", "prompt": "p"}, on_token=on_token)
+                    assert False, "debería propagar el error del callback"
+                except Disconnected:
+                    pass
+
+            assert client.breaker.state == CIRCUIT_CLOSED
+            assert client.failures == 0 and client.callback_errors == 5
+            assert await client.generate({"model": "m", "prompt": "p"}) == "Hola"
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    asyncio.run(scenario())
+
+
+def test_streaming_and_no_retry_after_partial_output():
+    async def scenario():
+        async def handler(request):
+            body = await request.json()
+            response = web.StreamResponse()
+            await response.prepare(request)
+            await response.write((json.dumps({"response": "Hola ", "done": False}) + "\n").encode())
+            if body["prompt"] == "corte":
+                raise ConnectionResetError("servidor caído a mitad")
+            await response.write((json.dumps({"response": "mundo", "done": True}) + "\n").encode())
+            return response
+
+        runner, url = await _stub_server(handler)
+        client = LLMClient(url, retry_backoff=0.01)
+        tokens = []
+
+        async def on_token(token):
+            tokens.append(token)
+
+        try:
+            assert await client.generate({"model": "m", "prompt": "p"}, on_token=on_token) == "Hola mundo"
+            assert tokens == ["Hola ", "mundo"]
+
+            tokens.clear()
+            try:
+                await client.generate({"model": "m", "prompt": "corte"}, on_token=on_token)
+                assert False, "debería fallar"
+            except LLMError:
+                pass
+            assert tokens == ["Hola "] and client.retries == 0
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_generations_do_not_block_each_other():
+    async def scenario():
+        async def handler(request):
+            await asyncio.sleep(0.3)
+            return web.json_response({"response": "ok"})
+
+        runner, url = await _stub_server(handler)
+        client = LLMClient(url, pool_size=4)
+        try:
+            start = time.perf_counter()
+            results = await asyncio.gather(*[
+                client.generate({"model": "m", "prompt": str(i)}) for i in range(4)
+            ])
+            assert results == ["ok"] * 4
+            assert time.perf_counter() - start < 1.0
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    test_retries_transient_errors()
+    test_client_errors_are_not_retried_and_open_the_circuit()
+    test_half_open_probe_closes_circuit()
+    test_cancelled_half_open_probe_releases_the_circuit()
+    test_token_callback_errors_do_not_open_the_circuit()
+    test_streaming_and_no_retry_after_partial_output()
+    test_concurrent_generations_do_not_block_each_other()
+    print("✅ Pruebas del cliente LLM completadas")
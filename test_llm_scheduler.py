@@ -0,0 +1,162 @@
+"""
+Prueba del Planificador de Peticiones LLM
+Verifica el límite de generaciones simultáneas, las prioridades, el
+turno por jugador y el rechazo rápido contra un servidor Ollama simulado
+"""
+
+import asyncio
+import time
+
+from aiohttp import web
+
+from adventure_game import NARRATOR_BUSY_RESPONSE, OllamaClient
+from llm_client import LLMClient
+from llm_scheduler import PRIORITY_AMBIENT, PRIORITY_INTERACTIVE, LLMQueueFull, LLMScheduler
+
+
+class StubOllama:
+    """Servidor /api/generate que anota el orden y la concurrencia de las peticiones"""
+
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.order = []
+        self.active = 0
+        self.max_active = 0
+
+    async def handler(self, request):
+        body = await request.json()
+        self.order.append(body["prompt"])
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        return web.json_response({"response": f"ok {body['prompt']}"})
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_post("/api/generate", self.handler)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        return f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+
+async def _launch(client: LLMClient, prompt: str, priority: int = PRIORITY_INTERACTIVE,
+                  player_id: str = "p"):
+    """Lanza una generación y cede el bucle para que quede encolada en orden"""
+    task = asyncio.create_task(client.generate(
+        {"model": "m", "prompt": prompt}, priority=priority, player_id=player_id
+    ))
+    await asyncio.sleep(0)
+    return task
+
+
+def test_max_in_flight_is_respected():
+    async def scenario():
+        stub = StubOllama()
+        client = LLMClient(await stub.start(), scheduler=LLMScheduler(max_in_flight=2))
+        try:
+            results = await asyncio.gather(*[
+                client.generate({"model": "m", "prompt": str(i)}, player_id=f"p{i}")
+                for i in range(6)
+            ])
+            assert results == [f"ok {i}" for i in range(6)]
+            assert stub.max_active == 2
+
+            stats = client.scheduler.get_stats()
+            assert stats["in_flight"] == 0 and stats["completed"] == 6
+            assert stats["classes"]["interactive"]["max_queue_time"] > 0
+        finally:
+            await client.close()
+            await stub.runner.cleanup()
+
+    asyncio.run(scenario())
+
+
+def test_interactive_before_ambient_and_round_robin_between_players():
+    async def scenario():
+        stub = StubOllama()
+        client = LLMClient(await stub.start(), scheduler=LLMScheduler(max_in_flight=1))
+        try:
+            tasks = [await _launch(client, "inicial")]
+            tasks.append(await _launch(client, "ambiente", PRIORITY_AMBIENT, "mundo"))
+            for prompt in ("a1", "a2", "a3"):
+                tasks.append(await _launch(client, prompt, player_id="ana"))
+            tasks.append(await _launch(client, "b1", player_id="bruno"))
+            await asyncio.gather(*tasks)
+
+            # Bruno no espera a las tres peticiones de Ana y el ambiente va al final
+            assert stub.order == ["inicial", "a1", "b1", "a2", "a3", "ambiente"]
+        finally:
+            await client.close()
+            await stub.runner.cleanup()
+
+    asyncio.run(scenario())
+
+
+def test_deep_queue_is_rejected_with_fast_fallback():
+    async def scenario():
+        stub = StubOllama(delay=0.3)
+        scheduler = LLMScheduler(max_in_flight=1, queue_limits={
+            PRIORITY_INTERACTIVE: 1, PRIORITY_AMBIENT: 0
+        })
+        client = LLMClient(await stub.start(), scheduler=scheduler)
+        try:
+            running = await _launch(client, "inicial")
+            waiting = await _launch(client, "en cola")
+
+            start = time.perf_counter()
+            try:
+                await client.generate({"model": "m", "prompt": "ambiente"}, priority=PRIORITY_AMBIENT)
+                assert False, "debería rechazarse"
+            except LLMQueueFull:
+                pass
+
+            # El juego responde al momento con el aviso de narrador ocupado
+            ollama = OllamaClient()
+            ollama.client = client
+            assert await ollama.generate("m", "otra más") == NARRATOR_BUSY_RESPONSE
+            assert time.perf_counter() - start < 0.1
+
+            await asyncio.gather(running, waiting)
+            stats = scheduler.get_stats()["classes"]
+            assert stats["interactive"]["rejected"] == 1
+            assert stats["ambient"]["rejected"] == 1
+            assert stub.order == ["inicial", "en cola"]
+        finally:
+            await client.close()
+            await stub.runner.cleanup()
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        stub = StubOllama(delay=0.1)
+        client = LLMClient(await stub.start(), scheduler=LLMScheduler(max_in_flight=1))
+        try:
+            running = await _launch(client, "inicial")
+            abandoned = await _launch(client, "abandonada")
+            abandoned.cancel()
+            await asyncio.gather(abandoned, return_exceptions=True)
+            assert client.scheduler.get_stats()["classes"]["interactive"]["queued"] == 0
+
+            await running
+            assert await client.generate({"model": "m", "prompt": "siguiente"}) == "ok siguiente"
+            assert stub.order == ["inicial", "siguiente"]
+        finally:
+            await client.close()
+            await stub.runner.cleanup()
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    test_max_in_flight_is_respected()
+    test_interactive_before_ambient_and_round_robin_between_players()
+    test_deep_queue_is_rejected_with_fast_fallback()
+    test_cancelled_waiter_leaves_the_queue()
+    print("✅ Pruebas del planificador LLM completadas")
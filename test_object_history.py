@@ -0,0 +1,100 @@
+"""
+Prueba del Resumen de Historial de Objetos
+Verifica el resumen incremental, su cálculo en la migración y la
+paginación del historial en el contexto MCP
+"""
+
+import asyncio
+import tempfile
+from pathlib import Path
+
+from memory_system import OBJECT_HISTORY_RECENT, PerfectMemorySystem
+from mcp_integration import MCPContextProvider
+
+
+async def _used_hammer(memory: PerfectMemorySystem):
+    workshop = await memory.create_location("Taller", "Un viejo taller.")
+    hammer = await memory.create_object("martillo", "Un martillo de acero.", workshop.id,
+                                        properties={"rust_level": 0})
+    for level in range(1, 16):
+        await memory.modify_object_properties(hammer.id, {"rust_level": level}, actor="time")
+    await memory.move_object(hammer.id, "inventory_player", actor="player")
+    return hammer
+
+
+def test_rollup_is_bounded_and_incremental():
+    async def scenario():
+        with tempfile.TemporaryDirectory() as tmp:
+            memory = PerfectMemorySystem(str(Path(tmp) / "juego.db"))
+            hammer = await _used_hammer(memory)
+
+            summary = await memory.get_object_history_summary(hammer.id)
+            assert summary.event_count == 17
+            assert summary.counts_by_type == {
+                "object_created": 1, "object_modified": 15, "object_moved": 1
+            }
+            assert summary.first_seen <= summary.last_seen
+            assert len(summary.recent_events) == OBJECT_HISTORY_RECENT
+            assert summary.recent_events[-1]["event_type"] == "object_moved"
+
+            last = summary.property_transitions[-1]
+            assert (last["property"], last["to"]) == ("location", "inventory_player")
+            assert summary.property_transitions[-2]["from"] == 14
+            memory.close()
+
+    asyncio.run(scenario())
+
+
+def test_object_context_pages_full_history():
+    async def scenario():
+        with tempfile.TemporaryDirectory() as tmp:
+            memory = PerfectMemorySystem(str(Path(tmp) / "juego.db"))
+            hammer = await _used_hammer(memory)
+            provider = MCPContextProvider(memory)
+
+            context = await provider.get_object_context(hammer.id)
+            assert "history" not in context
+            assert context["history_length"] == 17
+            assert context["history_summary"]["counts_by_type"]["object_modified"] == 15
+
+            page = await provider.get_object_context(hammer.id, include_history=True,
+                                                     history_offset=10, history_limit=5)
+            assert len(page["history"]) == 5
+            assert page["history_page"]["has_more"]
+
+            tail = await provider.get_object_context(hammer.id, include_history=True,
+                                                     history_offset=15, history_limit=5)
+            assert [event["event_type"] for event in tail["history"]] == [
+                "object_modified", "object_moved"
+            ]
+            assert not tail["history_page"]["has_more"]
+            memory.close()
+
+    asyncio.run(scenario())
+
+
+def test_migration_rebuilds_rollups():
+    async def scenario():
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = str(Path(tmp) / "juego.db")
+            memory = PerfectMemorySystem(db_path)
+            hammer = await _used_hammer(memory)
+            expected = await memory.get_object_history_summary(hammer.id)
+
+            # Base de datos anterior al resumen
+            memory.db_connection.execute("DELETE FROM object_history_rollups")
+            memory.db_connection.execute("PRAGMA user_version = 2")
+            memory.close()
+
+            migrated = PerfectMemorySystem(db_path)
+            assert await migrated.get_object_history_summary(hammer.id) == expected
+            migrated.close()
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    test_rollup_is_bounded_and_incremental()
+    test_object_context_pages_full_history()
+    test_migration_rebuilds_rollups()
+    print("✅ Pruebas de historial de objetos completadas")
@@ -0,0 +1,56 @@
+"""
+Prueba del Contexto del Jugador
+Verifica que las estadísticas se agregan en SQL sobre la ventana de
+acciones recientes y usan el índice por actor
+"""
+
+import asyncio
+import tempfile
+from pathlib import Path
+
+from memory_system import PerfectMemorySystem
+from mcp_integration import MCPContextProvider
+
+
+def test_player_context_aggregates_recent_window():
+    async def scenario():
+        with tempfile.TemporaryDirectory() as tmp:
+            memory = PerfectMemorySystem(str(Path(tmp) / "juego.db"))
+            workshop = await memory.create_location("Taller", "Un viejo taller.")
+            cellar = await memory.create_location("Bodega", "Una bodega húmeda.")
+            hammer = await memory.create_object("martillo", "De acero.", workshop.id)
+            lamp = await memory.create_object("lámpara", "De aceite.", cellar.id)
+
+            await memory.move_object(hammer.id, cellar.id, actor="player")
+            await memory.move_object(hammer.id, workshop.id, actor="player")
+            await memory.modify_object_properties(lamp.id, {"lit": True}, actor="player")
+
+            stats = await memory.get_actor_stats("player")
+            assert stats["total_actions"] == 3
+            assert stats["action_distribution"] == {"object_moved": 2, "object_modified": 1}
+            assert set(stats["locations_visited"]) == {workshop.id, cellar.id}
+            assert stats["objects_interacted"] == [hammer.id, lamp.id]
+
+            # La ventana limita las acciones consideradas
+            window = await memory.get_actor_stats("player", window=1)
+            assert window["total_actions"] == 1
+            assert window["action_distribution"] == {"object_modified": 1}
+
+            context = await MCPContextProvider(memory).get_player_context("player")
+            assert len(context["recent_actions"]) == 3
+            assert context["play_style_analysis"]["most_common_action"] == "object_moved"
+            assert context["play_style_analysis"]["exploration_tendency"] == 2 / 3
+
+            plan = " ".join(row[3] for row in memory.db_connection.execute(
+                "EXPLAIN QUERY PLAN SELECT event_type FROM game_events "
+                "WHERE actor = ? ORDER BY timestamp DESC LIMIT 50", ("player",)
+            ))
+            assert "idx_events_actor_timestamp" in plan
+            memory.close()
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    test_player_context_aggregates_recent_window()
+    print("✅ Pruebas de contexto del jugador completadas")
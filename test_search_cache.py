@@ -0,0 +1,62 @@
+"""
+Prueba de la Caché de Resultados de Búsqueda
+Verifica invalidación por versión, TTL, límite de tamaño y métricas
+"""
+
+import time
+
+from search_cache import SearchResultCache
+
+
+def test_cache_hit_and_version_invalidation():
+    cache = SearchResultCache(max_entries=10, ttl_seconds=60)
+    key = cache.make_key('vector', 'objects', '  Herramientas   ÚTILES ', {'location_id': 'taller'}, 5)
+
+    assert cache.get(key) is None
+    cache.put(key, ['martillo'], cache.version('objects'))
+
+    # Misma consulta con otras mayúsculas/espacios comparte entrada
+    same_key = cache.make_key('vector', 'objects', 'herramientas útiles', {'location_id': 'taller'}, 5)
+    assert cache.get(same_key) == ['martillo']
+
+    # Una escritura en otra colección no afecta; en la propia invalida
+    cache.bump('events')
+    assert cache.get(key) == ['martillo']
+    cache.bump('objects')
+    assert cache.get(key) is None
+
+    stats = cache.get_stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 2
+    assert stats['hit_rate'] == 0.5
+
+
+def test_stale_result_not_stored():
+    cache = SearchResultCache()
+    key = cache.make_key('vector', 'objects', 'martillo', None, 3)
+
+    version = cache.version('objects')
+    cache.bump('objects')  # Escritura mientras se calculaba el resultado
+    cache.put(key, ['viejo'], version)
+    assert cache.get(key) is None
+
+
+def test_ttl_and_size_bounds():
+    cache = SearchResultCache(max_entries=2, ttl_seconds=0.05)
+    keys = [cache.make_key('vector', 'objects', f'consulta {i}', None, 3) for i in range(3)]
+    for key in keys:
+        cache.put(key, [key], 0)
+
+    assert cache.get(keys[0]) is None  # Expulsada por LRU
+    assert cache.get(keys[2]) == [keys[2]]
+    assert cache.get_stats()['evictions'] == 1
+
+    time.sleep(0.06)
+    assert cache.get(keys[2]) is None  # Expirada por TTL
+
+
+if __name__ == "__main__":
+    test_cache_hit_and_version_invalidation()
+    test_stale_result_not_stored()
+    test_ttl_and_size_bounds()
+    print("✅ Caché de búsqueda OK")
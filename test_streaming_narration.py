@@ -0,0 +1,76 @@
+"""
+Prueba de la Narración en Streaming
+Verifica que los fragmentos de Ollama llegan como mensajes response_chunk
+(igual que en /ws/{player_id}) antes de la respuesta final, contra un
+servidor Ollama simulado
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+
+from aiohttp import web
+
+from adventure_game import IntelligentAdventureGame, OllamaClient
+
+
+NARRATION = ["Te sientas ", "en un banco ", "de piedra."]
+
+
+async def _stub_ollama(requests: list):
+    """Servidor /api/generate que responde en NDJSON; retorna (runner, url)"""
+    async def handler(request):
+        requests.append(await request.json())
+        response = web.StreamResponse()
+        await response.prepare(request)
+        for i, token in enumerate(NARRATION):
+            line = {"response": token, "done": i == len(NARRATION) - 1}
+            await response.write((json.dumps(line) + "\n").encode())
+        return response
+
+    app = web.Application()
+    app.router.add_post("/api/generate", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+
+def test_narration_is_streamed_as_response_chunks():
+    async def scenario():
+        requests = []
+        runner, url = await _stub_ollama(requests)
+        tmp = tempfile.mkdtemp()
+        game = IntelligentAdventureGame(os.path.join(tmp, "mundo.db"),
+                                        vector_db_path=os.path.join(tmp, "vector_db"))
+        game.ollama = OllamaClient(url)
+        await game.initialize_world()
+        messages = []
+
+        async def send_chunk(chunk: str):
+            messages.append({"type": "response_chunk", "content": chunk})
+
+        try:
+            response = await game.process_command_async("toma asiento", on_token=send_chunk)
+            assert [message["content"] for message in messages] == NARRATION
+            assert response == "".join(NARRATION)
+            assert requests[0]["stream"] is True
+
+            # Los comandos mecánicos no generan fragmentos ni llamadas al modelo
+            messages.clear()
+            await game.process_command_async("coge la llave", on_token=send_chunk)
+            assert messages == [] and len(requests) == 1
+        finally:
+            await game.close()
+            shutil.rmtree(tmp, ignore_errors=True)
+            await runner.cleanup()
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    test_narration_is_streamed_as_response_chunks()
+    print("✅ Pruebas de narración en streaming completadas")
@@ -0,0 +1,73 @@
+"""
+Prueba del Contexto Vectorial con Presupuesto de Tiempo
+Verifica que las secciones lentas se descartan a tiempo, que se cuentan
+y que una sección descartada no se relanza mientras su trabajo en hilo
+sigue en curso
+"""
+
+import asyncio
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from enhanced_mcp import EnhancedMCPProvider
+from memory_system import PerfectMemorySystem
+
+
+def _provider(tmp: str) -> EnhancedMCPProvider:
+    db_path = str(Path(tmp) / "game.db")
+    provider = EnhancedMCPProvider(PerfectMemorySystem(db_path), db_path,
+                                   str(Path(tmp) / "vector_db"))
+    provider.vector_context_deadline = 0.2
+    provider.vector_context_budgets = {'location_patterns': 0.05, 'suggestions': 0.2}
+    return provider
+
+
+def test_slow_sections_are_dropped_and_not_relaunched():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            provider = _provider(tmp)
+            release = threading.Event()
+            started = []
+
+            async def slow_patterns(location_id):
+                started.append(location_id)
+                await asyncio.to_thread(release.wait, 5)
+                return "Patrones detectados"
+
+            async def suggestions(location_id, inventory, actions):
+                return "  • Objetos relevantes aquí: martillo"
+
+            provider._analyze_current_location_patterns = slow_patterns
+            provider._generate_semantic_suggestions = suggestions
+
+            # La sección lenta se descarta sin retrasar al resto
+            start = time.perf_counter()
+            sections = await provider._generate_vector_sections("taller", [], [])
+            assert time.perf_counter() - start < provider.vector_context_deadline
+            assert [section.name for section in sections] == ['semantic_suggestions']
+            assert provider.vector_context_stats['dropped'] == {'location_patterns': 1}
+
+            # Su hilo sigue ocupado: la siguiente construcción no la relanza
+            await provider._generate_vector_sections("taller", [], [])
+            assert started == ["taller"]
+            assert provider.vector_context_stats['skipped'] == {'location_patterns': 1}
+
+            # Al terminar el trabajo pendiente la sección vuelve a ejecutarse
+            release.set()
+            while provider._pending_context_sections:
+                await asyncio.sleep(0.01)
+            sections = await provider._generate_vector_sections("taller", [], [])
+            assert [section.name for section in sections] == \
+                ['semantic_location_patterns', 'semantic_suggestions']
+            assert started == ["taller", "taller"]
+            assert provider.vector_context_stats['builds'] == 3
+            provider.memory.db_connection.close()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_slow_sections_are_dropped_and_not_relaunched()
+    print("✅ Pruebas del contexto vectorial completadas")
@@ -0,0 +1,329 @@
+"""
+Prueba del Motor de Búsqueda Vectorial
+Verifica búsquedas acotadas, mantenimiento de colecciones y cachés del
+motor sobre colecciones en memoria y un codificador determinista, sin
+necesitar ChromaDB ni el modelo de embeddings
+"""
+
+import asyncio
+import hashlib
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+import vector_search
+from event_tiers import HotEventIndex
+from memory_system import PerfectMemorySystem
+from vector_search import SearchRequest, VectorSearchEngine
+from vector_service import STATE_LOADING
+
+
+class MemoryCollection(HotEventIndex):
+    """Colección con la interfaz de ChromaDB que usa el motor, en memoria"""
+
+    def get(self, ids=None, where=None, limit=None, include=None):
+        return super().get(ids, where, limit)
+
+    def query(self, query_embeddings, n_results, where=None, include=None):
+        return super().query(query_embeddings, n_results, where)
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        super().upsert(ids, embeddings, documents, metadatas)
+
+    add = upsert
+
+    def delete(self, ids=None):
+        return super().delete(ids)
+
+
+class HashingEncoder:
+    """Bolsa de palabras con hashing: textos con palabras comunes quedan cerca"""
+
+    dimension = 64
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def encode(self, texts):
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in str(text).lower().replace('|', ' ').replace(':', ' ').split():
+                digest = hashlib.md5(word.encode()).digest()
+                vectors[row, digest[0] % self.dimension] += 1.0
+            norm = np.linalg.norm(vectors[row])
+            if norm:
+                vectors[row] /= norm
+        return vectors
+
+
+def _engine(tmp: str, **kwargs) -> VectorSearchEngine:
+    engine = VectorSearchEngine(str(Path(tmp) / "game.db"), str(Path(tmp) / "vector_db"), **kwargs)
+    engine.embedding_model = HashingEncoder()
+    engine.collections = {
+        name: MemoryCollection()
+        for name in ('objects', 'locations', 'events', 'actions', 'objects_history')
+    }
+    engine.initialized = True
+    return engine
+
+
+async def _workshop_world(tmp: str):
+    """Taller y almacén con tres objetos; retorna (memoria, taller, almacén, objetos)"""
+    memory = PerfectMemorySystem(str(Path(tmp) / "game.db"))
+    taller = await memory.create_location("Taller", "Un taller de carpintería")
+    almacen = await memory.create_location("Almacén", "Estanterías llenas de cajas")
+    objects = [
+        await memory.create_object("martillo", "Martillo de acero", taller.id),
+        await memory.create_object("sierra", "Sierra de carpintería", taller.id),
+        await memory.create_object("cuerda", "Cuerda de cáñamo", almacen.id),
+    ]
+    return memory, taller, almacen, objects
+
+
+def test_scoped_search_uses_current_object_locations():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            memory, taller, almacen, (martillo, sierra, cuerda) = await _workshop_world(tmp)
+            engine = _engine(tmp)
+            await engine.initialize_from_existing_data()
+
+            # El índice no se toca al mover: la ubicación sale de game_objects
+            await memory.move_object(martillo.id, almacen.id)
+            names = lambda results: sorted(r.document.metadata['name'] for r in results)
+            assert names(await engine.search_scoped('objects', 'herramienta', location_id=almacen.id)) \
+                == ['cuerda', 'martillo']
+            assert names(await engine.search_scoped('objects', location_id=taller.id)) == ['sierra']
+
+            empty = await memory.create_location("Sótano", "Vacío")
+            assert await engine.search_scoped('objects', 'martillo', location_id=empty.id) == []
+            engine.lexical_index.close()
+            memory.db_connection.close()
+
+    asyncio.run(run())
+
+
+def test_scoped_search_without_query_returns_most_recent():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = _engine(tmp)
+            encoder = HashingEncoder()
+            ids = [f"evt_{i}" for i in range(6)]
+            engine.collections['events'].upsert(
+                ids, encoder.encode(ids), ids,
+                [{'event_id': str(i), 'timestamp_epoch': float(epoch)}
+                 for i, epoch in enumerate([5, 1, 9, 3, 7, 2])]
+            )
+
+            try:
+                for scoring_limit in (512, 2):  # ámbito pequeño y ámbito grande
+                    vector_search.SCOPED_LOCAL_SCORING_LIMIT = scoring_limit
+                    engine.search_cache.clear()
+                    results = await engine.search_scoped('events', limit=3)
+                    assert [r.document.id for r in results] == ["evt_2", "evt_4", "evt_0"]
+            finally:
+                vector_search.SCOPED_LOCAL_SCORING_LIMIT = 512
+                engine.lexical_index.close()
+
+    asyncio.run(run())
+
+
+def test_location_patterns_cache_and_text_format():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            memory, taller, _, _ = await _workshop_world(tmp)
+            engine = _engine(tmp)
+            await engine.initialize_from_existing_data()
+
+            # Un objeto sin indexar se codifica con el mismo formato que el índice
+            await memory.create_object("martillo", "Martillo de acero", taller.id)
+            result = await engine.analyze_location_patterns(taller.id, similarity_threshold=0.0)
+            assert result['patterns'][0]['object1'] == result['patterns'][0]['object2'] == "martillo"
+            assert result['patterns'][0]['similarity'] > 0.999
+            assert len(result['patterns']) == 3
+
+            # Umbral y top_k distintos no reutilizan un resultado ajeno
+            strict = await engine.analyze_location_patterns(taller.id, similarity_threshold=0.999)
+            assert len(strict['patterns']) == 1
+            assert len((await engine.analyze_location_patterns(taller.id, 0.0, top_k=1))['patterns']) == 1
+            assert await engine.analyze_location_patterns(taller.id, similarity_threshold=0.0) == result
+
+            for threshold in range(vector_search.PATTERN_CACHE_SIZE + 10):
+                await engine.analyze_location_patterns(taller.id, similarity_threshold=threshold / 1000)
+            assert len(engine._pattern_cache) == vector_search.PATTERN_CACHE_SIZE
+            engine.lexical_index.close()
+            memory.db_connection.close()
+
+    asyncio.run(run())
+
+
+def test_location_patterns_while_the_model_loads():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            memory, taller, _, _ = await _workshop_world(tmp)
+            engine = VectorSearchEngine(str(Path(tmp) / "game.db"), str(Path(tmp) / "vector_db"))
+            engine.vector_service.state = STATE_LOADING
+            errors = []
+            engine.logger.error = errors.append
+
+            result = await engine.analyze_location_patterns(taller.id)
+            assert result['patterns'] == [] and "cargándose" in result['summary']
+            assert errors == [] and not engine._pattern_cache
+            engine.lexical_index.close()
+            memory.db_connection.close()
+
+    asyncio.run(run())
+
+
+def _object_vector(engine, object_id: str, version: int, doc_id: str = None):
+    text = f"Nombre: objeto {object_id} | versión {version}"
+    return ([doc_id or engine._object_doc_id(object_id)], engine.embedding_model.encode([text]).tolist(),
+            [text], [{'object_id': object_id, 'name': object_id, 'version': version}])
+
+
+def test_object_upsert_archives_and_trims_history():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = _engine(tmp, object_history_versions=2)
+        for version in range(1, 5):
+            engine._upsert_object_vectors(*_object_vector(engine, "cofre", version))
+        # Re-escribir la misma versión no crea historial
+        engine._upsert_object_vectors(*_object_vector(engine, "cofre", 4))
+
+        live = engine.collections['objects'].get(ids=["obj_cofre"])
+        assert live['metadatas'][0]['version'] == 4
+        history = engine.collections['objects_history'].get()
+        assert sorted(history['ids']) == ["obj_cofre_2", "obj_cofre_3"]
+        engine.lexical_index.close()
+
+
+def test_compaction_promotes_latest_legacy_vector_without_archiving_it():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = _engine(tmp, object_history_versions=5)
+            objects = engine.collections['objects']
+            # Índice antiguo: un vector por versión; "lampara" sin vector vivo
+            for version in (1, 2):
+                objects.upsert(*_object_vector(engine, "lampara", version, f"obj_lampara_{version}"))
+            objects.upsert(*_object_vector(engine, "mesa", 1, "obj_mesa_1"))
+            objects.upsert(*_object_vector(engine, "mesa", 2))
+
+            stats = await engine.compact_object_vectors()
+            assert stats == {'superseded_removed': 3, 'promoted': 1, 'archived': 2,
+                             'history_trimmed': 0}
+            assert sorted(objects.get()['ids']) == ["obj_lampara", "obj_mesa"]
+            assert objects.get(ids=["obj_lampara"])['metadatas'][0]['version'] == 2
+            assert sorted(engine.collections['objects_history'].get()['ids']) == \
+                ["obj_lampara_1", "obj_mesa_1"]
+            engine.lexical_index.close()
+
+    asyncio.run(run())
+
+
+def test_similar_to_many_excludes_the_queried_entities():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            memory, taller, _, (martillo, sierra, cuerda) = await _workshop_world(tmp)
+            engine = _engine(tmp)
+            await engine.initialize_from_existing_data()
+
+            doc_ids = engine.object_document_ids([martillo.id, sierra.id, "inexistente"])
+            assert doc_ids == {martillo.id: f"obj_{martillo.id}", sierra.id: f"obj_{sierra.id}"}
+
+            similar = await engine.similar_to_many(
+                [doc_ids[martillo.id], doc_ids[sierra.id], doc_ids[martillo.id], "obj_inexistente"], k=5
+            )
+            assert set(similar) == set(doc_ids.values())
+            for results in similar.values():
+                # Ninguna de las entidades consultadas aparece como similar
+                assert sorted(r.document.metadata['name'] for r in results) == ["cuerda"]
+                assert results[0].context['similar_to'] in doc_ids.values()
+
+            single = await engine.similar_to(doc_ids[martillo.id], k=5)
+            assert sorted(r.document.metadata['name'] for r in single) == ["cuerda", "sierra"]
+            engine.lexical_index.close()
+            memory.db_connection.close()
+
+    asyncio.run(run())
+
+
+def test_object_document_ids_prefers_latest_version_and_live_document():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = _engine(tmp)
+        objects = engine.collections['objects']
+        # Antes de compactar: versiones sueltas y, para "mesa", el vivo a la par de la v2
+        objects.upsert(*_object_vector(engine, "lampara", 1, "obj_lampara_1"))
+        objects.upsert(*_object_vector(engine, "lampara", 3, "obj_lampara_3"))
+        objects.upsert(*_object_vector(engine, "lampara", 2))
+        objects.upsert(*_object_vector(engine, "mesa", 2, "obj_mesa_2"))
+        objects.upsert(*_object_vector(engine, "mesa", 2))
+
+        assert engine.object_document_ids(["lampara", "mesa", "silla"]) == {
+            "lampara": "obj_lampara_3", "mesa": "obj_mesa"
+        }
+        assert engine.object_document_ids([]) == {}
+        engine.lexical_index.close()
+
+
+def test_search_many_batches_text_and_vector_requests():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            memory, taller, _, _ = await _workshop_world(tmp)
+            engine = _engine(tmp)
+            await engine.initialize_from_existing_data()
+            encoded = []
+            encode = engine.embedding_model.encode
+            engine.embedding_model.encode = lambda texts: encoded.append(list(texts)) or encode(texts)
+
+            vector = encode(["Nombre: cuerda | Descripción: Cuerda de cáñamo"])[0]
+            batches = await engine.search_many([
+                ('objects', "martillo de acero", 1),
+                ('objects', vector, 1),
+                SearchRequest('objects', "martillo de acero", k=2),
+                ('locations', "taller de carpintería", 1),
+            ])
+            assert [r.document.metadata['name'] for r in batches[0]] == ["martillo"]
+            assert [r.document.metadata['name'] for r in batches[1]] == ["cuerda"]
+            assert len(batches[2]) == 2 and batches[3][0].document.metadata['name'] == "Taller"
+            # Un único lote de embeddings con los textos distintos
+            assert encoded == [["martillo de acero", "taller de carpintería"]]
+
+            try:
+                await engine.search_many([('objects', {"no": "es un vector"}, 1)])
+                assert False, "debería rechazar el objetivo"
+            except TypeError:
+                pass
+
+            results = await engine.search_all("martillo", limit=2)
+            assert all(len(results[name]) == 1 for name in ('objects', 'locations', 'events'))
+            engine.lexical_index.close()
+            memory.db_connection.close()
+
+    asyncio.run(run())
+
+
+def test_stats_keep_collections_apart_from_runtime_metrics():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = _engine(tmp)
+        engine.collections['objects'].upsert(*_object_vector(engine, "cofre", 1))
+        stats = engine.get_stats()
+
+        runtime = stats.pop('runtime')
+        assert {'readiness', 'search_cache', 'ingestion', 'event_dedup', 'event_tiers'} <= set(runtime)
+        # Todas las demás entradas son colecciones (el formato que lee el demo)
+        assert stats['objects'] == {'document_count': 1, 'status': 'active'}
+        assert all({'document_count', 'status'} <= set(data) for data in stats.values())
+        engine.lexical_index.close()
+
+
+if __name__ == "__main__":
+    test_scoped_search_uses_current_object_locations()
+    test_scoped_search_without_query_returns_most_recent()
+    test_location_patterns_cache_and_text_format()
+    test_location_patterns_while_the_model_loads()
+    test_object_upsert_archives_and_trims_history()
+    test_compaction_promotes_latest_legacy_vector_without_archiving_it()
+    test_similar_to_many_excludes_the_queried_entities()
+    test_object_document_ids_prefers_latest_version_and_live_document()
+    test_search_many_batches_text_and_vector_requests()
+    test_stats_keep_collections_apart_from_runtime_metrics()
+    print("✅ Pruebas del motor vectorial completadas")
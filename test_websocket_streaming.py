@@ -0,0 +1,86 @@
+"""
+Prueba del Streaming por WebSocket
+Verifica que /ws/{player_id} envía los fragmentos de la narración
+(response_chunk) antes de la respuesta final, tanto para la narración del
+AIEngine como para los comandos delegados al juego original, contra un
+servidor Ollama simulado
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+
+from fastapi import WebSocketDisconnect
+
+import ai_web_server
+from adventure_game import OllamaClient
+from ai_integration import AIAdventureGame
+from llm_client import close_llm_clients
+from test_streaming_narration import NARRATION, _stub_ollama
+
+
+class ScriptedWebSocket:
+    """WebSocket con los mensajes del cliente fijados de antemano; anota los enviados"""
+
+    def __init__(self, incoming: list):
+        self.incoming = list(incoming)
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        self.sent.append(json.loads(text))
+
+    async def receive_text(self) -> str:
+        if not self.incoming:
+            raise WebSocketDisconnect()
+        return json.dumps(self.incoming.pop(0))
+
+
+def test_websocket_sends_chunks_before_the_response():
+    async def scenario():
+        requests = []
+        runner, url = await _stub_ollama(requests)
+        tmp = tempfile.mkdtemp()
+        game = AIAdventureGame(os.path.join(tmp, "mundo.db"), os.path.join(tmp, "vector_db"))
+        game.ai_config["ollama_host"] = url
+        try:
+            assert await game.initialize()
+            game.original_game.ollama = OllamaClient(url)
+            ai_web_server.ai_game = game
+
+            # "ayuda" lo narra el AIEngine; "toma asiento" se delega al juego original
+            commands = ["ayuda", "toma asiento"]
+            websocket = ScriptedWebSocket([{"type": "command", "command": c} for c in commands])
+            await ai_web_server.websocket_endpoint(websocket, "ana")
+
+            assert websocket.sent[0]["type"] == "connection"
+            replies = websocket.sent[1:]
+            assert [message["type"] for message in replies] == \
+                (["response_chunk"] * len(NARRATION) + ["response"]) * len(commands)
+
+            for i, command in enumerate(commands):
+                *chunks, response = replies[i * (len(NARRATION) + 1):(i + 1) * (len(NARRATION) + 1)]
+                assert [chunk["content"] for chunk in chunks] == NARRATION
+                assert {chunk["command"] for chunk in chunks} == {command}
+                assert response["result"]["message"] == "".join(NARRATION)
+                assert (response["result"]["game_action"] == "ai_conversation") == (command == "ayuda")
+
+            assert len(requests) == len(commands) and all(r["stream"] for r in requests)
+            assert "ana" not in ai_web_server.active_connections
+        finally:
+            ai_web_server.ai_game = None
+            await game.close()
+            await close_llm_clients()
+            await runner.cleanup()
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    test_websocket_sends_chunks_before_the_response()
+    print("✅ Pruebas de streaming por WebSocket completadas")
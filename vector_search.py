@@ -8,16 +8,39 @@ import asyncio
 import json
 import logging
 import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
 from datetime import datetime
 from typing import List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass, asdict
 import numpy as np
 from pathlib import Path
 
-# Lazy imports for heavy dependencies
-chromadb = None
-SentenceTransformer = None
-Settings = None
+from dedup import DuplicateGroup, NearDuplicateIndex
+from event_tiers import (
+    DEFAULT_HOT_DAYS, DEFAULT_HOT_MAX_DISTANCE, DEFAULT_HOT_MAX_DOCUMENTS,
+    TIER_AUTO, HotEventIndex, TieredEventCollection, activity_epoch
+)
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from memory_system import event_document_text, unpack_embedding
+from search_cache import SearchResultCache
+from vector_service import VectorService, VectorServiceNotReady, get_vector_service
+
+
+# Prefijo del id de documento -> colección, y campo de metadata que identifica la entidad
+COLLECTION_PREFIXES = {'obj_': 'objects', 'loc_': 'locations', 'evt_': 'events'}
+IDENTITY_FIELDS = {'objects': 'object_id', 'locations': 'location_id', 'events': 'event_id'}
+
+# Ámbitos pequeños se puntúan localmente con los embeddings ya almacenados
+SCOPED_LOCAL_SCORING_LIMIT = 512
+
+# Resultados de analyze_location_patterns conservados (LRU)
+PATTERN_CACHE_SIZE = 128
+
+# Cada cuánto el hilo de ingestión mueve eventos caducados al nivel frío
+EVENT_COMPACTION_INTERVAL = 600.0
 
 
 @dataclass
@@ -41,6 +64,17 @@ class SearchResult:
     context: Dict[str, Any]
 
 
+@dataclass
+class SearchRequest:
+    """Una búsqueda de search_many: por texto (`query`) o por vector (`vector`)"""
+    collection: str
+    query: Optional[str] = None
+    vector: Optional[List[float]] = None
+    k: int = 10
+    filters: Optional[Dict] = None
+    tiers: str = TIER_AUTO
+
+
 class VectorSearchEngine:
     """
     Motor de búsqueda vectorial para el adventure game
@@ -53,50 +87,86 @@ class VectorSearchEngine:
     """
     
     def __init__(self, db_path: str = "adventure_game.db", 
-                 vector_db_path: str = "./vector_db"):
+                 vector_db_path: str = "./vector_db",
+                 object_history_versions: int = 0,
+                 cache_size: int = 512, cache_ttl: float = 300.0,
+                 vector_service: Optional[VectorService] = None,
+                 hot_event_days: float = DEFAULT_HOT_DAYS,
+                 hot_event_max_documents: int = DEFAULT_HOT_MAX_DOCUMENTS):
         self.db_path = db_path
         self.vector_db_path = Path(vector_db_path)
         self.vector_db_path.mkdir(exist_ok=True)
         
+        # Modelo y cliente ChromaDB compartidos con el resto del proceso
+        self.vector_service = vector_service or get_vector_service(str(self.vector_db_path))
+        
+        # Las altas individuales se vectorizan por lotes en segundo plano
+        self.ingestion = self.vector_service.ingestion
+        self.ingestion.register_writer('game_objects', self._write_object_batch)
+        self.ingestion.register_writer('game_events', self._write_event_batch)
+        
+        # El nivel caliente de eventos guarda vectores propios: se re-codifican al cambiar de modelo
+        self.vector_service.add_cutover_listener(self._prepare_model_cutover)
+        
         # Lazy initialization - se inicializan cuando se necesitan
         self.chroma_client = None
-        self.embedding_model = None
         self.collections = {}
         self.initialized = False
         
+        # Índice léxico (FTS5/BM25) - ligero, disponible sin cargar el modelo
+        self.lexical_index = LexicalIndex(str(self.vector_db_path / "lexical_index.db"))
+        
+        # Eventos casi idénticos se colapsan en un documento canónico
+        self.event_dedup = NearDuplicateIndex()
+        
+        # Eventos de los últimos `hot_event_days` días en memoria (nivel caliente);
+        # el resto en la colección 'events' en disco (nivel frío)
+        self.hot_events = HotEventIndex()
+        self.hot_event_days = hot_event_days
+        self.hot_event_max_documents = hot_event_max_documents
+        self._last_event_compaction = time.monotonic()
+        self._event_compaction_stats = {'compactions': 0, 'moved_to_cold': 0}
+        
+        # Caché de resultados invalidada por versión de colección
+        self.search_cache = SearchResultCache(cache_size, cache_ttl)
+        
+        # Un único vector vivo por objeto; opcionalmente N versiones anteriores
+        # en una colección de historial aparte
+        self.object_history_versions = object_history_versions
+        
+        # Conexión SQLite reutilizable y caché de patrones por ubicación
+        self._db_connection: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._pattern_cache: "OrderedDict[Tuple, Tuple[Tuple, Dict[str, Any]]]" = OrderedDict()
+        # Los análisis de patrones corren en hilos (asyncio.to_thread)
+        self._pattern_lock = threading.Lock()
+        
         self.logger = logging.getLogger(__name__)
     
     def _ensure_initialized(self):
-        """Inicializa ChromaDB y SentenceTransformer solo cuando se necesitan"""
+        """
+        Inicializa ChromaDB y SentenceTransformer solo cuando se necesitan
+        
+        Si el modelo se está cargando en segundo plano lanza
+        VectorServiceNotReady en lugar de bloquear la petición.
+        """
         if self.initialized:
             return
         
+        self.vector_service.check_ready()
+        
         try:
-            # Lazy imports de dependencias pesadas
-            global chromadb, SentenceTransformer, Settings
-            if chromadb is None:
-                import chromadb
-                from chromadb.config import Settings
-                from sentence_transformers import SentenceTransformer
-            
-            # Configurar ChromaDB
-            self.chroma_client = chromadb.PersistentClient(
-                path=str(self.vector_db_path),
-                settings=Settings(
-                    anonymized_telemetry=False,
-                    allow_reset=True
-                )
-            )
-            
-            # Modelo de embeddings - optimizado para español e inglés
-            self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+            # Cliente y modelo de embeddings del servicio compartido
+            self.vector_service.ensure_loaded()
+            self.chroma_client = self.vector_service.client
             
-            # Colecciones separadas por tipo
+            # Colecciones separadas por tipo (namespace "game": game_objects, ...)
             self.collections = {
-                'objects': self._get_or_create_collection('game_objects'),
-                'locations': self._get_or_create_collection('game_locations'),
-                'events': self._get_or_create_collection('game_events'),
-                'actions': self._get_or_create_collection('game_actions')
+                'objects': self._get_or_create_collection('objects'),
+                'locations': self._get_or_create_collection('locations'),
+                'events': self._get_or_create_collection('events'),
+                'actions': self._get_or_create_collection('actions'),
+                'objects_history': self._get_or_create_collection('objects_history')
             }
             
             self.initialized = True
@@ -106,15 +176,142 @@ class VectorSearchEngine:
             self.logger.error(f"❌ Error inicializando vector search: {e}")
             raise
         
-    def _get_or_create_collection(self, name: str):
-        """Obtiene o crea una colección en ChromaDB"""
+    @property
+    def embedding_model(self):
+        """Modelo activo del servicio compartido (cambia tras una migración de modelo)"""
+        return self.vector_service.model
+    
+    @embedding_model.setter
+    def embedding_model(self, model):
+        self.vector_service.model = model
+    
+    def _prepare_model_cutover(self, encode):
+        """
+        Re-codifica el nivel caliente de eventos con el modelo nuevo
+        
+        El trabajo pesado se hace aquí; la función retornada solo sustituye
+        los vectores y se ejecuta dentro del corte, con la ingestión detenida.
+        """
+        snapshot = self.hot_events.get()
+        reencoded = dict(zip(
+            zip(snapshot['ids'], snapshot['documents']),
+            encode(snapshot['documents']) if snapshot['ids'] else []
+        ))
+        
+        def apply_cutover():
+            current = self.hot_events.get()
+            keys = list(zip(current['ids'], current['documents']))
+            # Eventos llegados (o modificados) después de la preparación
+            late = [key for key in keys if key not in reencoded]
+            if late:
+                reencoded.update(zip(late, encode([document for _, document in late])))
+            
+            self.hot_events.clear()
+            self.hot_events.upsert(current['ids'], [reencoded[key] for key in keys],
+                                   current['documents'], current['metadatas'])
+            self.search_cache.clear()
+            with self._pattern_lock:
+                self._pattern_cache.clear()
+        
+        return apply_cutover
+    
+    @property
+    def is_ready(self) -> bool:
+        """Modelo de embeddings cargado: la búsqueda vectorial responde sin esperas"""
+        return self.initialized or self.vector_service.is_ready
+    
+    def start_warmup(self):
+        """Arranca la carga del modelo compartido en segundo plano"""
+        self.vector_service.start_background_load()
+    
+    def get_readiness(self) -> Dict[str, Any]:
+        """Estado de carga del subsistema vectorial"""
+        return {
+            'state': self.vector_service.state,
+            'ready': self.is_ready,
+            'load_seconds': self.vector_service.load_seconds,
+            'error': self.vector_service.load_error,
+            'fallback': None if self.is_ready else 'lexical'
+        }
+    
+    def _get_connection(self) -> sqlite3.Connection:
+        """Conexión SQLite de solo lectura reutilizada entre consultas"""
+        if self._db_connection is None:
+            self._db_connection = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db_connection.row_factory = sqlite3.Row
+        return self._db_connection
+    
+    def _fetch_all(self, sql: str, parameters: Tuple = ()) -> List[sqlite3.Row]:
+        """Lectura sobre la conexión compartida desde cualquier hilo"""
+        with self._db_lock:
+            return self._get_connection().execute(sql, parameters).fetchall()
+    
+    @staticmethod
+    def _object_doc_id(object_id: str) -> str:
+        """Id del documento vectorial vivo de un objeto (uno por objeto)"""
+        return f"obj_{object_id}"
+    
+    @staticmethod
+    def _object_history_doc_id(object_id: str, version: int) -> str:
+        """Id de una versión archivada de un objeto"""
+        return f"obj_{object_id}_{version}"
+    
+    @staticmethod
+    def _object_text(name: str, description: Optional[str], properties: Dict[str, Any]) -> str:
+        """
+        Documento indexado de un objeto
+        
+        Único formato para el índice y para los objetos que se codifican
+        sobre la marcha, de modo que sus embeddings sean comparables.
+        """
+        content_parts = [
+            f"Nombre: {name}",
+            f"Descripción: {description or 'Sin descripción'}"
+        ]
+        
+        # Agregar propiedades importantes al texto
+        for key, value in properties.items():
+            if value and str(value).strip():
+                content_parts.append(f"{key}: {value}")
+        
+        return " | ".join(content_parts)
+    
+    @staticmethod
+    def _object_type(properties: Dict[str, Any]) -> str:
+        """Tipo de objeto declarado en sus propiedades ('type' o 'tipo')"""
+        return str(properties.get('type') or properties.get('tipo') or '')
+    
+    @staticmethod
+    def _to_epoch(value: Any) -> float:
+        """Convierte un timestamp (ISO o datetime) a segundos para filtros de rango"""
+        if isinstance(value, (int, float)):
+            return float(value)
         try:
-            return self.chroma_client.get_collection(name)
-        except Exception:
-            return self.chroma_client.create_collection(
-                name=name,
-                metadata={"description": f"Vector embeddings for {name}"}
-            )
+            if not isinstance(value, datetime):
+                value = datetime.fromisoformat(str(value))
+            return value.timestamp()
+        except (TypeError, ValueError):
+            return 0.0
+    
+    def _get_or_create_collection(self, name: str):
+        """Obtiene o crea una colección del namespace del juego"""
+        return self.vector_service.get_collection('game', name)
+    
+    def _collection(self, collection_type: str, tiers: str = TIER_AUTO):
+        """
+        Colección a consultar para un tipo de documento
+        
+        Para eventos retorna una vista sobre el nivel caliente (memoria)
+        y el frío (disco) que decide qué niveles consulta según `tiers`.
+        """
+        if collection_type == 'events':
+            return TieredEventCollection(self.hot_events, self.collections['events'],
+                                         tiers, DEFAULT_HOT_MAX_DISTANCE)
+        return self.collections[collection_type]
+    
+    def _hot_event_cutoff(self) -> float:
+        """Epoch a partir del cual un evento pertenece al nivel caliente"""
+        return time.time() - self.hot_event_days * 86400
     
     async def initialize_from_existing_data(self):
         """
@@ -161,17 +358,7 @@ class VectorSearchEngine:
         for row in cursor:
             # Crear contenido textual rico para embedding
             properties = json.loads(row['properties'] or '{}')
-            content_parts = [
-                f"Nombre: {row['name']}",
-                f"Descripción: {row['description'] or 'Sin descripción'}"
-            ]
-            
-            # Agregar propiedades importantes al texto
-            for key, value in properties.items():
-                if value and str(value).strip():
-                    content_parts.append(f"{key}: {value}")
-            
-            content = " | ".join(content_parts)
+            content = self._object_text(row['name'], row['description'], properties)
             
             # Metadata para búsqueda y filtrado - filtrar valores None
             metadata = {
@@ -179,25 +366,22 @@ class VectorSearchEngine:
                 'name': row['name'] or '',
                 'location_id': row['location_id'] or '',
                 'created_at': row['created_at'] or '',
+                'timestamp_epoch': self._to_epoch(row['created_at']),
                 'version': int(row['version'] or 1),
                 'type': 'object',
+                'object_type': self._object_type(properties),
                 'properties': json.dumps(properties)  # Convertir dict a JSON string
             }
             
             documents.append(content)
             metadatas.append(metadata)
-            ids.append(f"obj_{row['id']}_{row['version']}")
+            ids.append(self._object_doc_id(row['id']))
         
         if documents:
             # Generar embeddings y almacenar
             embeddings = self.embedding_model.encode(documents).tolist()
             
-            self.collections['objects'].add(
-                embeddings=embeddings,
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids
-            )
+            self._upsert_object_vectors(ids, embeddings, documents, metadatas)
             
             self.logger.info(f"📦 Procesados {len(documents)} objetos")
     
@@ -246,14 +430,21 @@ class VectorSearchEngine:
                 metadatas=metadatas,
                 ids=ids
             )
+            self.lexical_index.upsert('locations', ids, documents, metadatas)
+            self.search_cache.bump('locations')
             
             self.logger.info(f"🏠 Procesadas {len(documents)} ubicaciones")
     
     async def _process_existing_events(self, conn):
-        """Procesa eventos históricos"""
+        """
+        Procesa eventos históricos
+        
+        Reutiliza los embeddings que EventEmbeddingWorker ya guardó en
+        SQLite; solo se codifican los eventos que aún no lo tienen.
+        """
         cursor = conn.execute("""
             SELECT id, event_type, target, location_id, 
-                   context, timestamp
+                   context, timestamp, embedding_vector, embedding_model
             FROM game_events
             ORDER BY timestamp DESC
             LIMIT 10000  -- Limitamos para no sobrecargar
@@ -262,27 +453,13 @@ class VectorSearchEngine:
         documents = []
         metadatas = []
         ids = []
+        stored_embeddings = []
+        duplicate_ids = []
         
         for row in cursor:
             context_data = json.loads(row['context'] or '{}')
-            
-            content_parts = [
-                f"Evento: {row['event_type']}",
-                f"Timestamp: {row['timestamp']}"
-            ]
-            
-            if row['target']:
-                content_parts.append(f"Objeto: {row['target']}")
-            
-            if row['location_id']:
-                content_parts.append(f"Ubicación: {row['location_id']}")
-            
-            # Agregar datos específicos del evento
-            for key, value in context_data.items():
-                if value and str(value).strip():
-                    content_parts.append(f"{key}: {value}")
-            
-            content = " | ".join(content_parts)
+            content = event_document_text(row['event_type'], row['timestamp'], row['target'],
+                                          row['location_id'], context_data)
             
             metadata = {
                 'event_id': row['id'] or '',
@@ -290,25 +467,60 @@ class VectorSearchEngine:
                 'object_id': row['target'] or '',
                 'location_id': row['location_id'] or '',
                 'timestamp': row['timestamp'] or '',
+                'timestamp_epoch': self._to_epoch(row['timestamp']),
                 'type': 'event',
                 'event_data': json.dumps(context_data)  # Convertir dict a JSON string
             }
             
+            doc_id = f"evt_{row['id']}"
+            if self.event_dedup.check(doc_id, content, metadata, row['timestamp'] or ''):
+                duplicate_ids.append(doc_id)
+                continue
+            
             documents.append(content)
             metadatas.append(metadata)
-            ids.append(f"evt_{row['id']}")
+            ids.append(doc_id)
+            # Solo sirven vectores del modelo activo
+            stored_embeddings.append(
+                unpack_embedding(row['embedding_vector'])
+                if row['embedding_model'] == self.vector_service.model_name else None
+            )
+        
+        # Duplicados indexados por versiones anteriores
+        for start in range(0, len(duplicate_ids), 500):
+            batch = duplicate_ids[start:start + 500]
+            self.collections['events'].delete(ids=batch)
+            self.hot_events.delete(batch)
+            self.lexical_index.delete(batch)
         
         if documents:
-            embeddings = self.embedding_model.encode(documents).tolist()
+            embeddings = self._reuse_or_encode(documents, stored_embeddings)
             
-            self.collections['events'].add(
-                embeddings=embeddings,
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids
-            )
+            hot_count = self._write_event_tiers(ids, embeddings, documents, metadatas,
+                                                evict_cold=True)
+            self.lexical_index.upsert('events', ids, documents, metadatas)
             
-            self.logger.info(f"📅 Procesados {len(documents)} eventos")
+            self.logger.info(
+                f"📅 Procesados {len(documents)} eventos ({hot_count} en el nivel caliente)"
+            )
+    
+    def _reuse_or_encode(self, documents: List[str],
+                         stored: List[Optional[List[float]]]) -> List[List[float]]:
+        """Embeddings ya calculados si tienen la dimensión del modelo; el resto se codifica"""
+        dimension = self.embedding_model.get_sentence_embedding_dimension()
+        missing = [i for i, vector in enumerate(stored) if not vector or len(vector) != dimension]
+        
+        embeddings = list(stored)
+        if missing:
+            encoded = self.embedding_model.encode([documents[i] for i in missing]).tolist()
+            for i, vector in zip(missing, encoded):
+                embeddings[i] = vector
+        
+        self.logger.info(
+            f"♻️ {len(documents) - len(missing)} embeddings reutilizados de SQLite, "
+            f"{len(missing)} calculados"
+        )
+        return embeddings
     
     async def search_objects(self, query: str, limit: int = 10, 
                            filters: Optional[Dict] = None) -> List[SearchResult]:
@@ -335,283 +547,1081 @@ class VectorSearchEngine:
         return await self._search_in_collection('locations', query, limit, filters)
     
     async def search_events(self, query: str, limit: int = 10,
-                          filters: Optional[Dict] = None) -> List[SearchResult]:
+                          filters: Optional[Dict] = None,
+                          tiers: str = TIER_AUTO) -> List[SearchResult]:
         """
         Busca eventos históricos semánticamente
         
+        Por defecto ("auto") se buscan primero los eventos recientes en
+        memoria y el histórico en disco solo si no bastan; "hot" se limita
+        a los recientes y "all" consulta siempre ambos niveles.
+        
         Ejemplos:
         - "cuando se movió el martillo"
         - "eventos de oxidación"
         - "acciones de carpintería"
         """
-        return await self._search_in_collection('events', query, limit, filters)
+        return await self._search_in_collection('events', query, limit, filters, tiers)
     
     async def search_all(self, query: str, limit: int = 20) -> Dict[str, List[SearchResult]]:
         """
         Búsqueda global en todas las colecciones
         Retorna resultados organizados por tipo
         """
-        results = {}
+        collection_types = ['objects', 'locations', 'events']
+        batches = await self.search_many([
+            SearchRequest(collection_type, query, k=max(1, limit // 3))
+            for collection_type in collection_types
+        ])
+        return dict(zip(collection_types, batches))
+    
+    async def search_many(self, requests: List[Any]) -> List[List[SearchResult]]:
+        """
+        Varias búsquedas independientes en una sola pasada
+        
+        Cada petición es un SearchRequest o una tupla
+        (colección, consulta o vector, k, filtros). Los textos se codifican
+        en un único lote y las peticiones de una misma colección con los
+        mismos filtros se resuelven con una consulta multi-vector.
+        Los resultados se retornan en el orden de las peticiones.
+        """
+        normalized = [self._as_search_request(request) for request in requests]
+        try:
+            return await asyncio.to_thread(self._search_many, normalized)
+        except VectorServiceNotReady:
+            # Sin modelo: léxico para las consultas de texto, nada para los vectores
+            return [
+                self._lexical_search(request.collection, request.query, request.k, request.filters)
+                if request.query else []
+                for request in normalized
+            ]
+    
+    @staticmethod
+    def _as_search_request(request: Any) -> SearchRequest:
+        if isinstance(request, SearchRequest):
+            return request
+        collection, target, *rest = request
+        if isinstance(target, str):
+            return SearchRequest(collection, target, None, *rest)
+        if isinstance(target, (list, tuple, np.ndarray)) and len(target) and all(
+            isinstance(value, (int, float, np.number)) and not isinstance(value, bool)
+            for value in target
+        ):
+            return SearchRequest(collection, None, list(target), *rest)
+        raise TypeError(
+            f"search_many: se esperaba una consulta (str) o un vector numérico, "
+            f"no {type(target).__name__}"
+        )
+    
+    def _search_many(self, requests: List[SearchRequest]) -> List[List[SearchResult]]:
+        """search_many síncrono (se ejecuta en un hilo aparte)"""
+        results: List[Optional[List[SearchResult]]] = [None] * len(requests)
         
-        for collection_type in ['objects', 'locations', 'events']:
+        # Las consultas de texto comparten caché con _query_collection
+        cache_keys: Dict[int, Tuple] = {}
+        cache_versions: Dict[int, int] = {}
+        for i, request in enumerate(requests):
+            if request.query is None or request.vector is not None:
+                continue
+            cache_keys[i] = self.search_cache.make_key(
+                'vector', request.collection, request.query, request.filters,
+                request.k, request.tiers
+            )
+            cache_versions[i] = self.search_cache.version(request.collection)
+            cached = self.search_cache.get(cache_keys[i])
+            if cached is not None:
+                results[i] = list(cached)
+        
+        pending = [i for i, result in enumerate(results) if result is None]
+        if not pending:
+            return results
+        
+        self._ensure_initialized()
+        
+        # Un solo lote de embeddings para todos los textos distintos
+        texts = list(dict.fromkeys(
+            requests[i].query for i in pending if requests[i].vector is None
+        ))
+        encoded = dict(zip(texts, self.embedding_model.encode(texts).tolist())) if texts else {}
+        
+        groups: Dict[Tuple, List[int]] = {}
+        for i in pending:
+            request = requests[i]
+            where = self._build_where(request.filters)
+            group_key = (request.collection, request.tiers,
+                         json.dumps(where, sort_keys=True, default=str))
+            groups.setdefault(group_key, []).append(i)
+        
+        for (collection_type, tiers, _), indexes in groups.items():
+            first = requests[indexes[0]]
             try:
-                results[collection_type] = await self._search_in_collection(
-                    collection_type, query, limit//3
+                query_results = self._collection(collection_type, tiers).query(
+                    query_embeddings=[
+                        list(requests[i].vector) if requests[i].vector is not None
+                        else encoded[requests[i].query]
+                        for i in indexes
+                    ],
+                    n_results=max(requests[i].k for i in indexes),
+                    where=self._build_where(first.filters),
+                    include=['metadatas', 'documents', 'distances']
                 )
             except Exception as e:
-                self.logger.error(f"Error buscando en {collection_type}: {e}")
-                results[collection_type] = []
+                self.logger.error(f"Error en búsqueda por lotes en {collection_type}: {e}")
+                for i in indexes:
+                    results[i] = []
+                continue
+            
+            for row, i in enumerate(indexes):
+                request = requests[i]
+                context = {'query': request.query} if request.query is not None else {'vector': True}
+                results[i] = self._to_search_results(
+                    query_results, row, collection_type, context
+                )[:request.k]
+                if i in cache_keys:
+                    self.search_cache.put(cache_keys[i], results[i], cache_versions[i])
+                    results[i] = list(results[i])
         
         return results
     
     async def _search_in_collection(self, collection_type: str, query: str, 
-                                  limit: int, filters: Optional[Dict] = None) -> List[SearchResult]:
-        """Realiza búsqueda vectorial en una colección específica"""
+                                  limit: int, filters: Optional[Dict] = None,
+                                  tiers: str = TIER_AUTO) -> List[SearchResult]:
+        """
+        Realiza búsqueda vectorial en una colección específica
+        Mientras el modelo carga responde con el índice léxico
+        """
+        try:
+            return await asyncio.to_thread(self._query_collection, collection_type, query,
+                                           limit, filters, tiers)
+        except VectorServiceNotReady:
+            return self._lexical_search(collection_type, query, limit, filters)
+    
+    def _query_collection(self, collection_type: str, query: str,
+                          limit: int, filters: Optional[Dict] = None,
+                          tiers: str = TIER_AUTO) -> List[SearchResult]:
+        """Consulta vectorial síncrona (se puede ejecutar en un hilo aparte)"""
+        cache_key = self.search_cache.make_key('vector', collection_type, query, filters, limit, tiers)
+        cached = self.search_cache.get(cache_key)
+        if cached is not None:
+            return list(cached)
+        
         self._ensure_initialized()  # Asegurar que está inicializado
+        cache_version = self.search_cache.version(collection_type)
         
         try:
-            collection = self.collections[collection_type]
+            collection = self._collection(collection_type, tiers)
             
             # Generar embedding de la consulta
             query_embedding = self.embedding_model.encode([query]).tolist()[0]
             
-            # Construir filtros de metadata
-            where_clause = {}
-            if filters:
-                where_clause.update(filters)
-            
             # Realizar búsqueda vectorial
             results = collection.query(
                 query_embeddings=[query_embedding],
                 n_results=limit,
-                where=where_clause if where_clause else None,
+                where=self._build_where(filters),
                 include=['metadatas', 'documents', 'distances']
             )
             
-            # Convertir resultados
-            search_results = []
-            if results['ids'][0]:  # Si hay resultados
-                for i, doc_id in enumerate(results['ids'][0]):
-                    document = VectorDocument(
-                        id=doc_id,
-                        content=results['documents'][0][i],
-                        metadata=results['metadatas'][0][i],
-                        document_type=collection_type
-                    )
-                    
-                    # ChromaDB retorna distancias (menor = más similar)
-                    # Convertir a score de similitud (mayor = más similar)
-                    distance = results['distances'][0][i]
-                    similarity_score = max(0, 1.0 - distance)
-                    
-                    search_result = SearchResult(
-                        document=document,
-                        similarity_score=similarity_score,
-                        context={'collection': collection_type, 'query': query}
-                    )
-                    
-                    search_results.append(search_result)
-            
-            return search_results
+            search_results = self._to_search_results(
+                results, 0, collection_type, {'query': query}
+            )
+            self.search_cache.put(cache_key, search_results, cache_version)
+            return list(search_results)
             
         except Exception as e:
             self.logger.error(f"Error en búsqueda vectorial: {e}")
             return []
     
+    @staticmethod
+    def _to_search_results(results: Dict[str, Any], row: int, collection_type: str,
+                           context: Dict[str, Any]) -> List[SearchResult]:
+        """Convierte la fila `row` de un resultado de collection.query"""
+        search_results = []
+        
+        for i, doc_id in enumerate(results['ids'][row]):
+            document = VectorDocument(
+                id=doc_id,
+                content=results['documents'][row][i],
+                metadata=results['metadatas'][row][i],
+                document_type=collection_type
+            )
+            
+            # ChromaDB retorna distancias (menor = más similar)
+            # Convertir a score de similitud (mayor = más similar)
+            distance = results['distances'][row][i]
+            similarity_score = max(0, 1.0 - distance)
+            
+            search_results.append(SearchResult(
+                document=document,
+                similarity_score=similarity_score,
+                context={'collection': collection_type, **context}
+            ))
+        
+        return search_results
+    
+    @staticmethod
+    def _build_where(filters: Optional[Dict] = None,
+                     exclude: Optional[Tuple[str, List[str]]] = None,
+                     conditions: Optional[List[Dict]] = None) -> Optional[Dict]:
+        """
+        Construye la cláusula where de ChromaDB
+        Varias condiciones se combinan con $and; `exclude` descarta entidades por id
+        y `conditions` agrega condiciones ya formadas (p. ej. rangos sobre un campo)
+        """
+        conditions = list(conditions or []) + [{key: value} for key, value in (filters or {}).items()]
+        
+        if exclude and exclude[1]:
+            field, values = exclude
+            if len(values) == 1:
+                conditions.append({field: {'$ne': values[0]}})
+            else:
+                conditions.append({field: {'$nin': list(values)}})
+        
+        if not conditions:
+            return None
+        if len(conditions) == 1:
+            return conditions[0]
+        return {'$and': conditions}
+    
+    @staticmethod
+    def _collection_for_document(document_id: str) -> str:
+        """Deduce la colección a partir del prefijo del id del documento"""
+        for prefix, collection_type in COLLECTION_PREFIXES.items():
+            if document_id.startswith(prefix):
+                return collection_type
+        raise ValueError(f"Id de documento sin colección conocida: {document_id}")
+    
+    async def search_scoped(self, collection_type: str, query: Optional[str] = None,
+                            limit: int = 10, location_id: Optional[str] = None,
+                            object_type: Optional[str] = None,
+                            since: Optional[Any] = None, until: Optional[Any] = None,
+                            filters: Optional[Dict] = None,
+                            tiers: str = TIER_AUTO) -> List[SearchResult]:
+        """
+        Búsqueda semántica restringida a un ámbito
+        
+        El ámbito (ubicación, tipo de objeto, rango de tiempo) se resuelve
+        primero sobre la metadata indexada y solo los candidatos que lo
+        cumplen se puntúan contra la consulta. La ubicación de los objetos
+        se toma de game_objects (la metadata del índice no se actualiza al
+        moverlos). Sin `query` se devuelven los candidatos más recientes
+        sin generar embeddings. En eventos, `tiers` elige los niveles
+        consultados como en search_events.
+        
+        Ejemplos:
+        - search_scoped('objects', 'herramientas', location_id='taller')
+        - search_scoped('events', 'movimientos', since=datetime(2024, 1, 1))
+        """
+        conditions = []
+        object_ids = None
+        if location_id and collection_type == 'objects':
+            object_ids = await asyncio.to_thread(self._object_ids_in_location, location_id)
+            if not object_ids:
+                return []
+            conditions.append({'object_id': {'$in': object_ids}})
+        elif location_id:
+            conditions.append({'location_id': location_id})
+        if object_type:
+            conditions.append({'object_type': object_type})
+        if since is not None:
+            conditions.append({'timestamp_epoch': {'$gte': self._to_epoch(since)}})
+        if until is not None:
+            conditions.append({'timestamp_epoch': {'$lte': self._to_epoch(until)}})
+        
+        where = self._build_where(filters, conditions=conditions)
+        try:
+            return await asyncio.to_thread(self._query_scoped, collection_type, query,
+                                           limit, where, tiers)
+        except VectorServiceNotReady:
+            # Sin modelo: el índice léxico cubre ubicación y tipo, no rangos de tiempo
+            if not query or since is not None or until is not None:
+                return []
+            lexical_filters = dict(filters or {})
+            if location_id and object_ids is None:
+                lexical_filters['location_id'] = location_id
+            if object_type:
+                lexical_filters['object_type'] = object_type
+            if object_ids is None:
+                return self._lexical_search(collection_type, query, limit, lexical_filters)
+            
+            in_location = set(object_ids)
+            results = self._lexical_search(collection_type, query, limit * 4, lexical_filters)
+            return [
+                result for result in results
+                if result.document.metadata.get('object_id') in in_location
+            ][:limit]
+    
+    def _object_ids_in_location(self, location_id: str) -> List[str]:
+        """Objetos que están ahora en una ubicación (fuente de verdad: game_objects)"""
+        rows = self._fetch_all(
+            "SELECT id FROM game_objects WHERE location_id = ?", (location_id,)
+        )
+        return [row['id'] for row in rows]
+    
+    def _query_scoped(self, collection_type: str, query: Optional[str], limit: int,
+                      where: Optional[Dict], tiers: str = TIER_AUTO) -> List[SearchResult]:
+        """Resuelve el ámbito con collection.get y puntúa los candidatos localmente"""
+        cache_key = self.search_cache.make_key('scoped', collection_type, query, where, limit, tiers)
+        cached = self.search_cache.get(cache_key)
+        if cached is not None:
+            return list(cached)
+        
+        self._ensure_initialized()
+        collection = self._collection(collection_type, tiers)
+        context = {'query': query, 'scoped': True}
+        cache_version = self.search_cache.version(collection_type)
+        
+        try:
+            search_results = self._score_scoped(collection, collection_type, query,
+                                                limit, where, context)
+            self.search_cache.put(cache_key, search_results, cache_version)
+            return list(search_results)
+        except Exception as e:
+            self.logger.error(f"Error en búsqueda acotada: {e}")
+            return []
+    
+    def _score_scoped(self, collection, collection_type: str, query: Optional[str],
+                      limit: int, where: Optional[Dict],
+                      context: Dict[str, Any]) -> List[SearchResult]:
+        """Candidatos del ámbito ordenados por distancia a la consulta (o por recencia)"""
+        if not query:
+            return self._most_recent_in_scope(collection, collection_type, limit, where, context)
+        
+        candidates = collection.get(
+            where=where,
+            limit=SCOPED_LOCAL_SCORING_LIMIT + 1,
+            include=['embeddings', 'documents', 'metadatas']
+        )
+        
+        if len(candidates['ids']) > SCOPED_LOCAL_SCORING_LIMIT:
+            # Ámbito grande: el índice ANN con el mismo filtro es más barato
+            query_embedding = self.embedding_model.encode([query]).tolist()[0]
+            results = collection.query(
+                query_embeddings=[query_embedding],
+                n_results=limit,
+                where=where,
+                include=['metadatas', 'documents', 'distances']
+            )
+            return self._to_search_results(results, 0, collection_type, context)
+        
+        if not candidates['ids']:
+            return []
+        
+        # Misma métrica que el índice (L2 al cuadrado) para que los
+        # scores sean comparables con las búsquedas no acotadas
+        query_embedding = np.asarray(self.embedding_model.encode([query])[0], dtype=np.float32)
+        embeddings = np.asarray(candidates['embeddings'], dtype=np.float32)
+        distances = np.sum((embeddings - query_embedding) ** 2, axis=1)
+        order = np.argsort(distances, kind='stable')[:limit]
+        
+        return self._to_search_results({
+            'ids': [[candidates['ids'][i] for i in order]],
+            'documents': [[candidates['documents'][i] for i in order]],
+            'metadatas': [[candidates['metadatas'][i] for i in order]],
+            'distances': [[float(distances[i]) for i in order]]
+        }, 0, collection_type, context)
+    
+    def _most_recent_in_scope(self, collection, collection_type: str, limit: int,
+                              where: Optional[Dict], context: Dict[str, Any]) -> List[SearchResult]:
+        """Los `limit` documentos más recientes del ámbito (sin embeddings)"""
+        scope = collection.get(where=where, include=['metadatas'])
+        recency = np.asarray([
+            float(metadata.get('timestamp_epoch') or 0.0) for metadata in scope['metadatas']
+        ])
+        top_ids = [scope['ids'][i] for i in np.argsort(-recency, kind='stable')[:limit]]
+        if not top_ids:
+            return []
+        
+        top = collection.get(ids=top_ids, include=['documents', 'metadatas'])
+        by_id = {doc_id: i for i, doc_id in enumerate(top['ids'])}
+        order = [by_id[doc_id] for doc_id in top_ids if doc_id in by_id]
+        return self._to_search_results({
+            'ids': [[top['ids'][i] for i in order]],
+            'documents': [[top['documents'][i] for i in order]],
+            'metadatas': [[top['metadatas'][i] for i in order]],
+            'distances': [[1.0] * len(order)]
+        }, 0, collection_type, context)
+    
+    def _lexical_search(self, collection_type: str, query: str,
+                        limit: int, filters: Optional[Dict] = None) -> List[SearchResult]:
+        """Búsqueda léxica BM25 en el índice FTS5"""
+        try:
+            matches = self.lexical_index.search(collection_type, query, limit, filters)
+        except Exception as e:
+            self.logger.error(f"Error en búsqueda léxica: {e}")
+            return []
+        
+        search_results = []
+        for doc_id, content, metadata, bm25_score in matches:
+            document = VectorDocument(
+                id=doc_id,
+                content=content,
+                metadata=metadata,
+                document_type=collection_type
+            )
+            search_results.append(SearchResult(
+                document=document,
+                similarity_score=0.0,
+                context={'collection': collection_type, 'query': query, 'bm25': bm25_score}
+            ))
+        
+        return search_results
+    
+    async def hybrid_search(self, collection_type: str, query: str, limit: int = 10,
+                            filters: Optional[Dict] = None, rrf_k: int = 60) -> List[SearchResult]:
+        """
+        Búsqueda híbrida: índice léxico (BM25) + índice vectorial
+        
+        Primero se consulta el índice léxico, que es barato; si ya cubre
+        el límite con coincidencias exactas de nombre ("martillo", "llave
+        de bronce") no se codifica la consulta ni se busca en el índice
+        vectorial. Si no, se lanza la consulta vectorial y ambas listas se
+        fusionan con Reciprocal Rank Fusion.
+        """
+        cache_key = self.search_cache.make_key('hybrid', collection_type, query, filters, limit, rrf_k)
+        cached = self.search_cache.get(cache_key)
+        if cached is not None:
+            return list(cached)
+        cache_version = self.search_cache.version(collection_type)
+        
+        lexical_results = await asyncio.to_thread(
+            self._lexical_search, collection_type, query, limit, filters
+        )
+        exact_matches = [
+            result for result in lexical_results
+            if self._is_exact_name_match(query, result.document.metadata.get('name', ''))
+        ]
+        
+        if len(exact_matches) >= limit:
+            for result in exact_matches[:limit]:
+                result.similarity_score = 1.0
+                result.context['fusion'] = 'lexical_exact'
+            self.search_cache.put(cache_key, exact_matches[:limit], cache_version)
+            return exact_matches[:limit]
+        
+        try:
+            vector_results = await asyncio.to_thread(
+                self._query_collection, collection_type, query, limit, filters
+            )
+        except Exception as e:
+            # Resultado degradado (solo léxico): no se guarda en caché
+            if not isinstance(e, VectorServiceNotReady):
+                self.logger.error(f"Error en rama vectorial de búsqueda híbrida: {e}")
+            return self._fuse_results(query, collection_type, lexical_results,
+                                      [], limit, rrf_k)
+        
+        fused_results = self._fuse_results(query, collection_type, lexical_results,
+                                           vector_results, limit, rrf_k)
+        self.search_cache.put(cache_key, fused_results, cache_version)
+        return list(fused_results)
+    
+    def _fuse_results(self, query: str, collection_type: str,
+                      lexical_results: List[SearchResult],
+                      vector_results: List[SearchResult],
+                      limit: int, rrf_k: int) -> List[SearchResult]:
+        """Combina resultados léxicos y vectoriales con RRF"""
+        lexical_ids = [result.document.id for result in lexical_results]
+        vector_ids = [result.document.id for result in vector_results]
+        
+        fused = reciprocal_rank_fusion([lexical_ids, vector_ids], k=rrf_k)
+        
+        by_id = {result.document.id: result for result in lexical_results}
+        by_id.update({result.document.id: result for result in vector_results})
+        
+        # Score normalizado: 1.0 = primero en ambas listas
+        max_score = 2.0 / (rrf_k + 1)
+        
+        fused_results = []
+        for doc_id, score in fused[:limit]:
+            base = by_id[doc_id]
+            fused_results.append(SearchResult(
+                document=base.document,
+                similarity_score=min(1.0, score / max_score),
+                context={
+                    'collection': collection_type,
+                    'query': query,
+                    'fusion': 'rrf',
+                    'lexical_rank': lexical_ids.index(doc_id) + 1 if doc_id in lexical_ids else None,
+                    'vector_rank': vector_ids.index(doc_id) + 1 if doc_id in vector_ids else None
+                }
+            ))
+        
+        return fused_results
+    
+    @staticmethod
+    def _normalize_text(text: str) -> str:
+        """Minúsculas sin acentos ni espacios redundantes"""
+        decomposed = unicodedata.normalize('NFKD', text or '')
+        stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+        return ' '.join(stripped.lower().split())
+    
+    @classmethod
+    def _is_exact_name_match(cls, query: str, name: str) -> bool:
+        """Indica si la consulta nombra exactamente al documento"""
+        normalized_query = cls._normalize_text(query)
+        normalized_name = cls._normalize_text(name)
+        return bool(normalized_query) and (
+            normalized_query == normalized_name or normalized_query in normalized_name
+        )
+    
+    async def similar_to(self, document_id: str, k: int = 5,
+                         filters: Optional[Dict] = None) -> List[SearchResult]:
+        """
+        Documentos similares a uno ya indexado
+        
+        Consulta con el embedding almacenado del documento (sin volver a
+        codificar texto) y excluye la propia entidad con un filtro de metadata.
+        """
+        results = await self.similar_to_many([document_id], k, filters)
+        return results.get(document_id, [])
+    
+    async def similar_to_many(self, document_ids: List[str], k: int = 5,
+                              filters: Optional[Dict] = None) -> Dict[str, List[SearchResult]]:
+        """
+        Versión por lotes de similar_to
+        
+        Una lectura de embeddings y una consulta multi-vector por colección.
+        Las entidades consultadas se excluyen de todos los resultados.
+        """
+        return await asyncio.to_thread(self._similar_to_many, document_ids, k, filters)
+    
+    def _similar_to_many(self, document_ids: List[str], k: int,
+                         filters: Optional[Dict]) -> Dict[str, List[SearchResult]]:
+        """similar_to_many síncrono (se ejecuta en un hilo aparte)"""
+        self._ensure_initialized()
+        
+        grouped: Dict[str, List[str]] = {}
+        for document_id in dict.fromkeys(document_ids):
+            grouped.setdefault(self._collection_for_document(document_id), []).append(document_id)
+        
+        similar: Dict[str, List[SearchResult]] = {}
+        
+        for collection_type, ids in grouped.items():
+            try:
+                collection = self._collection(collection_type)
+                identity_field = IDENTITY_FIELDS[collection_type]
+                
+                stored = collection.get(ids=ids, include=['embeddings', 'metadatas'])
+                if not stored['ids']:
+                    continue
+                
+                identities = [
+                    metadata.get(identity_field) for metadata in stored['metadatas']
+                    if metadata.get(identity_field)
+                ]
+                
+                results = collection.query(
+                    query_embeddings=[list(embedding) for embedding in stored['embeddings']],
+                    n_results=k,
+                    where=self._build_where(filters, (identity_field, identities)),
+                    include=['metadatas', 'documents', 'distances']
+                )
+                
+                for row, document_id in enumerate(stored['ids']):
+                    similar[document_id] = self._to_search_results(
+                        results, row, collection_type, {'similar_to': document_id}
+                    )
+                    
+            except Exception as e:
+                self.logger.error(f"Error buscando similares en {collection_type}: {e}")
+        
+        return similar
+    
+    def object_document_ids(self, object_ids: List[str]) -> Dict[str, str]:
+        """Id de documento vectorial (versión más reciente) de cada objeto indexado"""
+        self._ensure_initialized()
+        
+        if not object_ids:
+            return {}
+        
+        stored = self.collections['objects'].get(
+            where=self._build_where({'object_id': {'$in': list(object_ids)}}),
+            include=['metadatas']
+        )
+        
+        # Antes de compactar pueden convivir ids versionados antiguos:
+        # gana la versión más alta y, a igual versión, el documento vivo
+        latest: Dict[str, Tuple[int, bool, str]] = {}
+        for doc_id, metadata in zip(stored['ids'], stored['metadatas']):
+            object_id = metadata.get('object_id')
+            rank = (int(metadata.get('version') or 1), doc_id == self._object_doc_id(object_id))
+            if object_id not in latest or rank > latest[object_id][:2]:
+                latest[object_id] = (*rank, doc_id)
+        
+        return {object_id: entry[2] for object_id, entry in latest.items()}
+    
     async def find_similar_objects(self, object_id: str, limit: int = 5) -> List[SearchResult]:
         """
         Encuentra objetos similares a uno dado
         Útil para recomendaciones y análisis de patrones
         """
-        # Obtener el objeto de referencia
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        document_ids = await asyncio.to_thread(self.object_document_ids, [object_id])
+        if document_ids.get(object_id):
+            return await self.similar_to(document_ids[object_id], limit)
         
-        try:
-            cursor = conn.execute("""
-                SELECT name, description, properties
-                FROM game_objects 
-                WHERE id = ?
-            """, (object_id,))
-            
-            row = cursor.fetchone()
-            if not row:
-                return []
-            
-            # Crear consulta basada en el objeto
-            properties = json.loads(row['properties'] or '{}')
-            query_parts = [row['name']]
-            
-            if row['description']:
-                query_parts.append(row['description'])
-            
-            # Agregar propiedades importantes
-            important_props = ['material', 'tipo', 'color', 'estado', 'uso']
-            for prop in important_props:
-                if prop in properties and properties[prop]:
-                    query_parts.append(str(properties[prop]))
-            
-            query = " ".join(query_parts)
-            
-            # Buscar objetos similares (excluyendo el mismo objeto)
-            results = await self.search_objects(query, limit + 1)
-            
-            # Filtrar el objeto original
-            similar_results = [
-                r for r in results 
-                if r.document.metadata.get('object_id') != object_id
-            ]
-            
-            return similar_results[:limit]
-            
-        finally:
-            conn.close()
+        # Objeto aún no indexado: construir consulta a partir de sus campos
+        rows = await asyncio.to_thread(self._fetch_all, """
+            SELECT name, description, properties
+            FROM game_objects 
+            WHERE id = ?
+        """, (object_id,))
+        
+        if not rows:
+            return []
+        
+        row = rows[0]
+        properties = json.loads(row['properties'] or '{}')
+        query_parts = [row['name']]
+        
+        if row['description']:
+            query_parts.append(row['description'])
+        
+        # Agregar propiedades importantes
+        important_props = ['material', 'tipo', 'color', 'estado', 'uso']
+        for prop in important_props:
+            if prop in properties and properties[prop]:
+                query_parts.append(str(properties[prop]))
+        
+        return await self._search_in_collection(
+            'objects', " ".join(query_parts), limit,
+            self._build_where(exclude=('object_id', [object_id]))
+        )
     
-    async def analyze_location_patterns(self, location_id: str) -> Dict[str, Any]:
+    async def analyze_location_patterns(self, location_id: str,
+                                        similarity_threshold: float = 0.3,
+                                        top_k: int = 10) -> Dict[str, Any]:
         """
         Analiza patrones de objetos en una ubicación
         Identifica qué tipos de objetos aparecen frecuentemente juntos
-        """
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
         
+        Reutiliza los embeddings ya almacenados en el índice y calcula todas
+        las similitudes con un único producto matricial. El resultado se
+        cachea (LRU) por ubicación y parámetros mientras no cambie el
+        conjunto (objeto, versión).
+        """
+        return await asyncio.to_thread(self._analyze_location_patterns, location_id,
+                                       similarity_threshold, top_k)
+    
+    def _analyze_location_patterns(self, location_id: str, similarity_threshold: float,
+                                   top_k: int) -> Dict[str, Any]:
+        """analyze_location_patterns síncrono (se ejecuta en un hilo aparte)"""
         try:
             # Obtener objetos que han estado en esta ubicación
-            cursor = conn.execute("""
-                SELECT DISTINCT o.name, o.description, o.properties
+            rows = self._fetch_all("""
+                SELECT id, name, description, properties, version
+                FROM game_objects
+                WHERE location_id = ?
+                UNION
+                SELECT o.id, o.name, o.description, o.properties, o.version
                 FROM game_objects o
                 JOIN game_events e ON o.id = e.target
-                WHERE e.location_id = ? OR o.location_id = ?
+                WHERE e.location_id = ?
             """, (location_id, location_id))
             
-            objects_in_location = []
-            for row in cursor:
-                properties = json.loads(row['properties'] or '{}')
-                objects_in_location.append({
-                    'name': row['name'],
-                    'description': row['description'],
-                    'properties': properties
-                })
-            
-            if not objects_in_location:
+            if not rows:
                 return {'patterns': [], 'summary': 'No hay suficientes datos'}
             
-            # Analizar patrones usando embeddings
-            object_texts = []
-            for obj in objects_in_location:
-                text_parts = [obj['name']]
-                if obj['description']:
-                    text_parts.append(obj['description'])
-                
-                # Agregar propiedades importantes
-                for key, value in obj['properties'].items():
-                    if value and str(value).strip():
-                        text_parts.append(f"{key}:{value}")
-                
-                object_texts.append(" ".join(text_parts))
-            
-            if len(object_texts) < 2:
+            if len(rows) < 2:
                 return {'patterns': [], 'summary': 'Necesarios más objetos para análisis'}
             
-            # Generar embeddings para análisis de clusters
-            embeddings = self.embedding_model.encode(object_texts)
-            
-            # Análisis simple de similitud
-            from sklearn.metrics.pairwise import cosine_similarity
-            similarity_matrix = cosine_similarity(embeddings)
-            
-            # Encontrar pares de objetos más similares
-            patterns = []
-            n_objects = len(object_texts)
-            
-            for i in range(n_objects):
-                for j in range(i+1, n_objects):
-                    similarity = similarity_matrix[i][j]
-                    if similarity > 0.3:  # Umbral de similitud
-                        patterns.append({
-                            'object1': objects_in_location[i]['name'],
-                            'object2': objects_in_location[j]['name'],
-                            'similarity': float(similarity),
-                            'pattern_type': 'semantic_similarity'
-                        })
-            
-            # Ordenar por similitud
-            patterns.sort(key=lambda x: x['similarity'], reverse=True)
-            
-            return {
-                'patterns': patterns[:10],  # Top 10 patrones
-                'total_objects': n_objects,
-                'summary': f'Encontrados {len(patterns)} patrones de similitud en {n_objects} objetos'
-            }
-            
+            cache_key = (location_id, similarity_threshold, top_k)
+            members = tuple(sorted((row['id'], int(row['version'] or 1)) for row in rows))
+            with self._pattern_lock:
+                cached = self._pattern_cache.get(cache_key)
+                if cached and cached[0] == members:
+                    self._pattern_cache.move_to_end(cache_key)
+                    return cached[1]
+            
+            embeddings = self._get_object_embeddings(rows)
+            names = [row['name'] for row in rows]
+            
+            result = self._top_similar_pairs(names, embeddings, similarity_threshold, top_k)
+            with self._pattern_lock:
+                self._pattern_cache[cache_key] = (members, result)
+                self._pattern_cache.move_to_end(cache_key)
+                while len(self._pattern_cache) > PATTERN_CACHE_SIZE:
+                    self._pattern_cache.popitem(last=False)
+            
+            return result
+            
+        except VectorServiceNotReady as e:
+            # Modelo aún cargando (o no disponible): resultado vacío, sin caché
+            self.logger.debug(f"⏳ Análisis de patrones omitido: {e}")
+            return {'patterns': [], 'summary': f'Análisis no disponible: {e}'}
         except Exception as e:
             self.logger.error(f"Error analizando patrones: {e}")
             return {'patterns': [], 'summary': f'Error en análisis: {e}'}
-        finally:
-            conn.close()
+    
+    def _get_object_embeddings(self, rows: List[sqlite3.Row]) -> np.ndarray:
+        """
+        Obtiene los embeddings almacenados de los objetos indicados
+        Solo se codifican los objetos que aún no están en el índice
+        """
+        self._ensure_initialized()
+        
+        doc_ids = [self._object_doc_id(row['id']) for row in rows]
+        versions = {doc_id: int(row['version'] or 1) for doc_id, row in zip(doc_ids, rows)}
+        stored = self.collections['objects'].get(ids=doc_ids, include=['embeddings', 'metadatas'])
+        stored_embeddings = stored['embeddings'] if stored['embeddings'] is not None else []
+        
+        # Solo sirven los vectores de la versión actual del objeto
+        stored_by_id = {
+            doc_id: embedding
+            for doc_id, embedding, metadata in zip(stored['ids'], stored_embeddings, stored['metadatas'])
+            if int(metadata.get('version') or 1) == versions[doc_id]
+        }
+        
+        missing = [i for i, doc_id in enumerate(doc_ids) if doc_id not in stored_by_id]
+        encoded = {}
+        if missing:
+            texts = [
+                self._object_text(rows[i]['name'], rows[i]['description'],
+                                  json.loads(rows[i]['properties'] or '{}'))
+                for i in missing
+            ]
+            encoded = dict(zip(missing, self.embedding_model.encode(texts)))
+        
+        return np.asarray([
+            encoded[i] if i in encoded else stored_by_id[doc_id]
+            for i, doc_id in enumerate(doc_ids)
+        ], dtype=np.float32)
+    
+    @staticmethod
+    def _top_similar_pairs(names: List[str], embeddings: np.ndarray,
+                           threshold: float, top_k: int) -> Dict[str, Any]:
+        """Pares más similares a partir de la matriz de similitud coseno"""
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        normalized = embeddings / np.clip(norms, 1e-12, None)
+        similarity_matrix = normalized @ normalized.T
+        
+        n_objects = len(names)
+        rows_idx, cols_idx = np.triu_indices(n_objects, k=1)
+        similarities = similarity_matrix[rows_idx, cols_idx]
+        
+        above = np.flatnonzero(similarities > threshold)
+        if len(above) > top_k:
+            best = np.argpartition(-similarities[above], top_k - 1)[:top_k]
+            above = above[best]
+        above = above[np.argsort(-similarities[above])]
+        
+        patterns = [
+            {
+                'object1': names[rows_idx[i]],
+                'object2': names[cols_idx[i]],
+                'similarity': float(similarities[i]),
+                'pattern_type': 'semantic_similarity'
+            }
+            for i in above
+        ]
+        
+        total_patterns = int(np.count_nonzero(similarities > threshold))
+        
+        return {
+            'patterns': patterns,  # Top patrones
+            'total_objects': n_objects,
+            'summary': f'Encontrados {total_patterns} patrones de similitud en {n_objects} objetos'
+        }
     
     async def add_object_to_index(self, object_id: str, name: str, 
                                  description: str, properties: Dict[str, Any],
                                  location_id: str, version: int):
-        """Agregar nuevo objeto al índice vectorial"""
+        """
+        Agregar nuevo objeto al índice vectorial
+        
+        El índice léxico se actualiza en el acto; el embedding se genera
+        en la cola de ingestión junto con otros documentos pendientes.
+        """
         try:
-            content_parts = [f"Nombre: {name}"]
-            
-            if description:
-                content_parts.append(f"Descripción: {description}")
-            
-            for key, value in properties.items():
-                if value and str(value).strip():
-                    content_parts.append(f"{key}: {value}")
-            
-            content = " | ".join(content_parts)
+            content = self._object_text(name, description, properties)
             
+            created_at = datetime.now()
             metadata = {
                 'object_id': object_id,
                 'name': name,
                 'location_id': location_id,
                 'version': version,
                 'type': 'object',
+                'object_type': self._object_type(properties),
                 'properties': json.dumps(properties),  # Convertir dict a JSON string
-                'created_at': datetime.now().isoformat()
+                'created_at': created_at.isoformat(),
+                'timestamp_epoch': created_at.timestamp()
             }
             
-            embedding = self.embedding_model.encode([content]).tolist()[0]
-            doc_id = f"obj_{object_id}_{version}"
-            
-            self.collections['objects'].add(
-                embeddings=[embedding],
-                documents=[content],
-                metadatas=[metadata],
-                ids=[doc_id]
-            )
-            
-            self.logger.info(f"✅ Objeto {name} agregado al índice vectorial")
+            doc_id = self._object_doc_id(object_id)
+            self._enqueue_document('objects', 'game_objects', doc_id, content, metadata)
+            self.logger.info(f"✅ Objeto {name} encolado para el índice vectorial")
             
         except Exception as e:
             self.logger.error(f"Error agregando objeto al índice: {e}")
     
+    def _enqueue_document(self, collection_type: str, queue_collection: str,
+                          doc_id: str, content: str, metadata: Dict[str, Any]):
+        """Indexa léxicamente ya y encola la vectorización"""
+        self.lexical_index.upsert(collection_type, [doc_id], [content], [metadata])
+        self.search_cache.bump(collection_type)
+        self.ingestion.submit(queue_collection, doc_id, content, metadata)
+    
+    def _write_object_batch(self, ids: List[str], embeddings: List[List[float]],
+                            documents: List[str], metadatas: List[Dict[str, Any]]):
+        """Writer de la cola de ingestión para objetos"""
+        self._ensure_initialized()
+        # El índice léxico ya se actualizó al encolar (y puede tener una versión más nueva)
+        self._upsert_object_vectors(ids, embeddings, documents, metadatas, index_lexical=False)
+    
+    def _write_event_batch(self, ids: List[str], embeddings: List[List[float]],
+                           documents: List[str], metadatas: List[Dict[str, Any]]):
+        """Writer de la cola de ingestión para eventos"""
+        self._ensure_initialized()
+        self._write_event_tiers(ids, embeddings, documents, metadatas)
+        
+        if time.monotonic() - self._last_event_compaction >= EVENT_COMPACTION_INTERVAL:
+            self._compact_event_tiers()
+    
+    def _write_event_tiers(self, ids: List[str], embeddings: List[List[float]],
+                           documents: List[str], metadatas: List[Dict[str, Any]],
+                           evict_cold: bool = False) -> int:
+        """
+        Escribe eventos en su nivel según su última actividad
+        
+        Los recientes van al índice en memoria y los antiguos directos al
+        disco. Con `evict_cold` los recientes se retiran además del disco
+        (reindexación de un índice que aún no tenía niveles).
+        Retorna cuántos quedaron en el nivel caliente.
+        """
+        cutoff = self._hot_event_cutoff()
+        hot = [i for i, metadata in enumerate(metadatas) if activity_epoch(metadata) >= cutoff]
+        hot_set = set(hot)
+        cold = [i for i in range(len(ids)) if i not in hot_set]
+        
+        if hot:
+            hot_ids = [ids[i] for i in hot]
+            self.hot_events.upsert(hot_ids, [embeddings[i] for i in hot],
+                                   [documents[i] for i in hot], [metadatas[i] for i in hot])
+            for start in range(0, len(hot_ids) if evict_cold else 0, 500):
+                self.collections['events'].delete(ids=hot_ids[start:start + 500])
+        
+        if cold:
+            cold_ids = [ids[i] for i in cold]
+            self.hot_events.delete(cold_ids)
+            self.collections['events'].upsert(
+                embeddings=[list(embeddings[i]) for i in cold],
+                documents=[documents[i] for i in cold],
+                metadatas=[metadatas[i] for i in cold],
+                ids=cold_ids
+            )
+        
+        if self.hot_events.count() > self.hot_event_max_documents:
+            self._compact_event_tiers()
+        
+        self.search_cache.bump('events')
+        return len(hot)
+    
+    def _compact_event_tiers(self) -> int:
+        """Mueve al nivel frío los eventos caducados o que exceden el máximo en memoria"""
+        self._last_event_compaction = time.monotonic()
+        expired = self.hot_events.compaction_candidates(
+            self._hot_event_cutoff(), self.hot_event_max_documents
+        )
+        
+        for start in range(0, len(expired), 500):
+            batch = self.hot_events.get(ids=expired[start:start + 500])
+            # Se escribe en disco antes de borrar de memoria: nunca desaparecen de ambos
+            self.collections['events'].upsert(
+                ids=batch['ids'],
+                embeddings=[embedding.tolist() for embedding in batch['embeddings']],
+                documents=batch['documents'],
+                metadatas=batch['metadatas']
+            )
+            self.hot_events.delete(batch['ids'])
+        
+        self._event_compaction_stats['compactions'] += 1
+        self._event_compaction_stats['moved_to_cold'] += len(expired)
+        if expired:
+            self.search_cache.bump('events')
+            self.logger.info(f"🧊 {len(expired)} eventos movidos al nivel frío")
+        return len(expired)
+    
+    async def compact_event_tiers(self) -> Dict[str, int]:
+        """
+        Compacta el nivel caliente de eventos en el frío
+        
+        Se ejecuta sola cada EVENT_COMPACTION_INTERVAL segundos desde el
+        hilo de ingestión; este método permite forzarla.
+        """
+        self._ensure_initialized()
+        moved = await asyncio.to_thread(self._compact_event_tiers)
+        return {'moved_to_cold': moved, 'hot_documents': self.hot_events.count()}
+    
+    def _update_canonical_event(self, canonical: DuplicateGroup):
+        """Refleja occurrence_count / first_seen / last_seen del canónico en los índices"""
+        self.lexical_index.upsert('events', [canonical.doc_id], [canonical.content], [canonical.metadata])
+        self.search_cache.bump('events')
+        
+        # Si el canónico aún está en la cola se escribirá con la metadata ya actualizada
+        if self.initialized:
+            self._collection('events').update(ids=[canonical.doc_id], metadatas=[canonical.metadata])
+    
+    async def flush_ingestion(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que la cola de ingestión escriba todo lo pendiente"""
+        return await asyncio.to_thread(self.ingestion.flush, timeout)
+    
+    def _upsert_object_vectors(self, ids: List[str], embeddings: List[List[float]],
+                               documents: List[str], metadatas: List[Dict[str, Any]],
+                               index_lexical: bool = True):
+        """
+        Escribe el vector vivo de cada objeto reemplazando el anterior
+        
+        Si se conservan versiones históricas, la versión reemplazada se
+        archiva en la colección de historial antes de sobrescribirla.
+        """
+        if self.object_history_versions > 0:
+            previous = self.collections['objects'].get(
+                ids=ids, include=['embeddings', 'documents', 'metadatas']
+            )
+            new_versions = {doc_id: metadata.get('version') for doc_id, metadata in zip(ids, metadatas)}
+            
+            archived = [
+                i for i, (doc_id, metadata) in enumerate(zip(previous['ids'], previous['metadatas']))
+                if metadata.get('version') != new_versions.get(doc_id)
+            ]
+            if archived:
+                self._archive_object_versions(
+                    [previous['metadatas'][i] for i in archived],
+                    [previous['embeddings'][i] for i in archived],
+                    [previous['documents'][i] for i in archived]
+                )
+        
+        self.collections['objects'].upsert(
+            embeddings=embeddings,
+            documents=documents,
+            metadatas=metadatas,
+            ids=ids
+        )
+        if index_lexical:
+            self.lexical_index.upsert('objects', ids, documents, metadatas)
+        self.search_cache.bump('objects')
+    
+    def _archive_object_versions(self, metadatas: List[Dict[str, Any]],
+                                 embeddings: List[Any], documents: List[str]):
+        """Guarda versiones reemplazadas en el historial y recorta a N por objeto"""
+        history = self.collections['objects_history']
+        history.upsert(
+            ids=[
+                self._object_history_doc_id(metadata['object_id'], metadata.get('version') or 1)
+                for metadata in metadatas
+            ],
+            embeddings=[list(embedding) for embedding in embeddings],
+            documents=documents,
+            metadatas=metadatas
+        )
+        self._trim_object_history({metadata['object_id'] for metadata in metadatas})
+    
+    def _trim_object_history(self, object_ids: Optional[set] = None) -> int:
+        """Elimina versiones históricas por encima del máximo configurado"""
+        history = self.collections['objects_history']
+        where = self._build_where({'object_id': {'$in': list(object_ids)}}) if object_ids else None
+        stored = history.get(where=where, include=['metadatas'])
+        
+        versions_by_object: Dict[str, List[Tuple[int, str]]] = {}
+        for doc_id, metadata in zip(stored['ids'], stored['metadatas']):
+            versions_by_object.setdefault(metadata.get('object_id'), []).append(
+                (int(metadata.get('version') or 1), doc_id)
+            )
+        
+        to_delete = []
+        for versions in versions_by_object.values():
+            versions.sort(reverse=True)
+            to_delete.extend(doc_id for _, doc_id in versions[self.object_history_versions:])
+        
+        if to_delete:
+            history.delete(ids=to_delete)
+        return len(to_delete)
+    
+    async def compact_object_vectors(self) -> Dict[str, int]:
+        """
+        Compacta la colección de objetos
+        
+        Deja un único vector vivo (`obj_{id}`) por objeto y elimina los
+        vectores versionados que quedaron de índices anteriores. Con
+        historial activo las versiones eliminadas se archivan (hasta N).
+        """
+        self._ensure_initialized()
+        collection = self.collections['objects']
+        
+        stored = collection.get(include=['metadatas'])
+        by_object: Dict[str, List[Tuple[int, str]]] = {}
+        for doc_id, metadata in zip(stored['ids'], stored['metadatas']):
+            by_object.setdefault(metadata.get('object_id'), []).append(
+                (int(metadata.get('version') or 1), doc_id)
+            )
+        
+        superseded = []
+        promote = []
+        for object_id, versions in by_object.items():
+            live_id = self._object_doc_id(object_id)
+            legacy = sorted((v for v in versions if v[1] != live_id), reverse=True)
+            if not legacy:
+                continue
+            if all(doc_id != live_id for _, doc_id in versions):
+                # Sin documento vivo: el más reciente pasa a ser el vivo
+                promote.append(legacy[0][1])
+            superseded.extend(doc_id for _, doc_id in legacy)
+        
+        if promote:
+            latest = collection.get(ids=promote, include=['embeddings', 'documents', 'metadatas'])
+            collection.upsert(
+                ids=[self._object_doc_id(metadata['object_id']) for metadata in latest['metadatas']],
+                embeddings=[list(embedding) for embedding in latest['embeddings']],
+                documents=latest['documents'],
+                metadatas=latest['metadatas']
+            )
+            self.lexical_index.upsert(
+                'objects',
+                [self._object_doc_id(metadata['object_id']) for metadata in latest['metadatas']],
+                latest['documents'], latest['metadatas']
+            )
+        
+        # El vector promovido sigue vivo como obj_{id}: no se archiva
+        promoted = set(promote)
+        to_archive = [doc_id for doc_id in superseded if doc_id not in promoted]
+        
+        archived = 0
+        if to_archive and self.object_history_versions > 0:
+            old_versions = collection.get(ids=to_archive, include=['embeddings', 'documents', 'metadatas'])
+            self._archive_object_versions(
+                old_versions['metadatas'], old_versions['embeddings'], old_versions['documents']
+            )
+            archived = len(old_versions['ids'])
+        
+        for start in range(0, len(superseded), 500):
+            batch = superseded[start:start + 500]
+            collection.delete(ids=batch)
+            self.lexical_index.delete(batch)
+        
+        trimmed = self._trim_object_history()
+        
+        if promote or superseded:
+            self.search_cache.bump('objects')
+        
+        self.logger.info(
+            f"🧹 Compactación de objetos: {len(superseded)} vectores obsoletos eliminados, "
+            f"{archived} archivados, {trimmed} versiones históricas recortadas"
+        )
+        
+        return {
+            'superseded_removed': len(superseded),
+            'promoted': len(promote),
+            'archived': archived,
+            'history_trimmed': trimmed
+        }
+    
     async def add_event_to_index(self, event_id: str, event_type: str,
                                object_id: str, location_id: str,
                                event_data: Dict[str, Any], timestamp: str):
         """Agregar nuevo evento al índice vectorial"""
         try:
-            content_parts = [
-                f"Evento: {event_type}",
-                f"Timestamp: {timestamp}"
-            ]
-            
-            if object_id:
-                content_parts.append(f"Objeto: {object_id}")
-            
-            if location_id:
-                content_parts.append(f"Ubicación: {location_id}")
-            
-            for key, value in event_data.items():
-                if value and str(value).strip():
-                    content_parts.append(f"{key}: {value}")
-            
-            content = " | ".join(content_parts)
+            content = event_document_text(event_type, timestamp, object_id,
+                                          location_id, event_data)
             
             metadata = {
                 'event_id': event_id,
@@ -619,30 +1629,58 @@ class VectorSearchEngine:
                 'object_id': object_id,
                 'location_id': location_id,
                 'timestamp': timestamp,
+                'timestamp_epoch': self._to_epoch(timestamp),
                 'type': 'event',
                 'event_data': json.dumps(event_data)  # Convertir dict a JSON string
             }
             
-            embedding = self.embedding_model.encode([content]).tolist()[0]
             doc_id = f"evt_{event_id}"
+            canonical = self.event_dedup.check(doc_id, content, metadata, timestamp)
+            if canonical:
+                # Casi-duplicado: solo se actualizan conteo y rango temporal del canónico
+                await asyncio.to_thread(self._update_canonical_event, canonical)
+                return
             
-            self.collections['events'].add(
-                embeddings=[embedding],
-                documents=[content],
-                metadatas=[metadata],
-                ids=[doc_id]
-            )
+            self._enqueue_document('events', 'game_events', doc_id, content, metadata)
             
         except Exception as e:
             self.logger.error(f"Error agregando evento al índice: {e}")
     
     def get_stats(self) -> Dict[str, Any]:
-        """Obtener estadísticas del índice vectorial"""
-        stats = {}
+        """
+        Obtener estadísticas del índice vectorial
+        
+        Una entrada {'document_count', 'status'} por colección (y el índice
+        léxico); las métricas de ejecución van aparte, bajo 'runtime'.
+        """
+        stats = {
+            'runtime': {
+                'readiness': self.get_readiness(),
+                'search_cache': self.search_cache.get_stats(),
+                'ingestion': self.ingestion.get_stats(),
+                'event_dedup': self.event_dedup.get_stats(),
+                'event_tiers': {
+                    'hot_documents': self.hot_events.count(),
+                    'hot_days': self.hot_event_days,
+                    'queries': self.hot_events.queries,
+                    'cold_fallbacks': self.hot_events.cold_fallbacks,
+                    **self._event_compaction_stats
+                }
+            }
+        }
+        
+        try:
+            stats['lexical'] = {
+                'document_count': self.lexical_index.count(),
+                'status': 'active'
+            }
+        except Exception as e:
+            stats['lexical'] = {'document_count': 0, 'status': f'error: {e}'}
         
-        for name, collection in self.collections.items():
+        for name in self.collections:
             try:
-                count = collection.count()
+                # En eventos cuenta ambos niveles (memoria + disco)
+                count = self._collection(name).count()
                 stats[name] = {
                     'document_count': count,
                     'status': 'active' if count > 0 else 'empty'
@@ -666,6 +1704,7 @@ async def test_vector_search():
     
     print("\n📊 Estadísticas del índice:")
     stats = engine.get_stats()
+    stats.pop('runtime')
     for collection, data in stats.items():
         print(f"  {collection}: {data['document_count']} documentos ({data['status']})")
     
@@ -0,0 +1,571 @@
+"""
+Servicio Vectorial Compartido para Adventure Game
+Un solo modelo de embeddings y un solo cliente ChromaDB por proceso
+Las colecciones de cada subsistema se separan por namespace
+"""
+
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from embedding_registry import (
+    CollectionEmbedding, EmbeddingDimensionMismatch, EmbeddingRegistry,
+    GuardedCollection, physical_collection_name
+)
+from ingestion_queue import IngestionQueue
+
+# Lazy imports for heavy dependencies
+chromadb = None
+SentenceTransformer = None
+Settings = None
+
+
+DEFAULT_VECTOR_DB_PATH = "./vector_db"
+DEFAULT_EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+# Variable de entorno para probar otro modelo (p. ej. uno destilado más pequeño)
+EMBEDDING_MODEL_ENV = "VECTOR_EMBEDDING_MODEL"
+
+# Almacén independiente que usaba EnhancedRAGSystem antes del servicio compartido
+LEGACY_RAG_PATH = "./ai_enhanced_memory"
+MIGRATION_MARKER = ".migrated_to_vector_service"
+
+# Estados de carga del servicio
+STATE_COLD = "cold"
+STATE_LOADING = "loading"
+STATE_READY = "ready"
+STATE_FAILED = "failed"
+
+# Estados de una migración de modelo
+MIGRATION_LOADING = "loading"
+MIGRATION_BACKFILLING = "backfilling"
+MIGRATION_COMPLETED = "completed"
+MIGRATION_FAILED = "failed"
+
+# Preparación del corte de modelo: recibe el encode nuevo y retorna la
+# función que aplica el cambio (se llama con la ingestión detenida)
+CutoverListener = Callable[[Callable[[List[str]], Any]], Callable[[], None]]
+
+# Lote de calentamiento: fuerza la carga de pesos y kernels antes del primer jugador
+WARMUP_TEXTS = [
+    "Nombre: martillo | Descripción: Un martillo de acero",
+    "Ubicación: taller | Descripción: Un taller lleno de herramientas",
+    "Evento: object_moved | Objeto: llave de bronce",
+    "mirar alrededor",
+    "coger la espada y abrir la puerta del norte",
+    "herramientas útiles",
+    "lugares para descansar",
+    "look around the ancient library",
+]
+
+
+class VectorServiceNotReady(RuntimeError):
+    """El modelo de embeddings aún se está cargando (o falló la carga)"""
+
+
+def configured_embedding_model() -> str:
+    """Modelo configurado: VECTOR_EMBEDDING_MODEL o el modelo por defecto"""
+    return os.getenv(EMBEDDING_MODEL_ENV) or DEFAULT_EMBEDDING_MODEL
+
+
+class SharedEmbeddingFunction:
+    """
+    Función de embeddings de ChromaDB respaldada por el modelo compartido
+
+    Permite que las colecciones que trabajan con textos (query_texts,
+    add(documents=...)) usen el mismo modelo que el resto del proceso.
+    """
+
+    def __init__(self, service: "VectorService"):
+        self._service = service
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return self._service.encode(list(input)).tolist()
+
+    @staticmethod
+    def name() -> str:
+        return "adventure_shared_embeddings"
+
+
+class VectorService:
+    """
+    Servicio vectorial del proceso
+
+    Carga de forma perezosa el cliente ChromaDB y el modelo de embeddings
+    una única vez y los comparte entre VectorSearchEngine y el sistema RAG.
+    Cada consumidor pide sus colecciones con un namespace ("game", "rag")
+    y el nombre lógico queda como "{namespace}_{nombre}".
+    
+    El registro de embeddings anota modelo y dimensión de cada colección.
+    Si se configura otro modelo, se sigue sirviendo con el registrado y
+    tras el calentamiento se migra en línea: escritura dual, relleno de
+    colecciones sombra y corte atómico al terminar.
+    """
+
+    def __init__(self, path: str = DEFAULT_VECTOR_DB_PATH,
+                 model_name: Optional[str] = None):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        
+        # Se sirve con el modelo de las colecciones existentes; el configurado
+        # queda pendiente de migración si es distinto
+        self.registry = EmbeddingRegistry(self.path)
+        configured = model_name or configured_embedding_model()
+        self.model_name = self.registry.active_model or configured
+        self.pending_model = configured if configured != self.model_name else None
+        
+        self.migration: Optional[Dict[str, Any]] = None
+        self._migration_encode: Optional[Callable[[List[str]], Any]] = None
+        self._migration_thread: Optional[threading.Thread] = None
+        self._cutover_listeners: List[CutoverListener] = []
+
+        self.client = None
+        self.model = None
+        self.loaded = False
+        
+        # Estado de carga observable desde otros hilos
+        self.state = STATE_COLD
+        self.load_error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self._ready_event = threading.Event()
+        self._loader_thread: Optional[threading.Thread] = None
+        
+        # Escrituras de índices por lotes, fuera del camino crítico
+        self.ingestion = IngestionQueue(self.encode_in_background)
+
+        self._lock = threading.RLock()
+        self._collections: Dict[str, Any] = {}
+        self._embedding_function = SharedEmbeddingFunction(self)
+
+        self.logger = logging.getLogger(__name__)
+
+    def ensure_loaded(self):
+        """Inicializa ChromaDB y SentenceTransformer solo cuando se necesitan"""
+        if self.loaded:
+            return
+
+        with self._lock:
+            if self.loaded:
+                return
+
+            self.state = STATE_LOADING
+            started = time.monotonic()
+            try:
+                # Lazy imports de dependencias pesadas
+                global chromadb, SentenceTransformer, Settings
+                if chromadb is None:
+                    import chromadb
+                    from chromadb.config import Settings
+                    from sentence_transformers import SentenceTransformer
+
+                self.client = chromadb.PersistentClient(
+                    path=str(self.path),
+                    settings=Settings(
+                        anonymized_telemetry=False,
+                        allow_reset=True
+                    )
+                )
+                self.model = SentenceTransformer(self.model_name)
+
+                self.loaded = True
+                self.load_seconds = time.monotonic() - started
+                self.logger.info(
+                    f"✅ Servicio vectorial compartido listo ({self.model_name}, "
+                    f"{self.load_seconds:.1f}s)"
+                )
+
+            except Exception as e:
+                self.state = STATE_FAILED
+                self.load_error = str(e)
+                self._ready_event.set()  # Despertar a quien espere: no habrá modelo
+                self.logger.error(f"❌ Error inicializando servicio vectorial: {e}")
+                raise
+
+            if self._loader_thread is None:
+                # Carga síncrona (scripts, tests): lista sin calentamiento
+                self._mark_ready()
+
+    def _mark_ready(self):
+        self.state = STATE_READY
+        self.load_error = None
+        self._ready_event.set()
+
+    def warm_up(self, texts: Optional[List[str]] = None):
+        """Carga el modelo y codifica un lote de prueba para dejarlo caliente"""
+        self.ensure_loaded()
+        self.model.encode(texts or WARMUP_TEXTS)
+        self._mark_ready()
+
+    def start_background_load(self) -> Optional[threading.Thread]:
+        """
+        Arranca la carga y el calentamiento en un hilo en segundo plano
+
+        Mientras tanto `is_ready` es False y los consumidores sirven
+        resultados léxicos o de caché en lugar de bloquear al jugador.
+        """
+        with self._lock:
+            if self.is_ready or (self._loader_thread is not None and self._loader_thread.is_alive()):
+                return self._loader_thread
+
+            self.state = STATE_LOADING
+            self._ready_event.clear()
+            self._loader_thread = threading.Thread(
+                target=self._background_load, name="vector-warmup", daemon=True
+            )
+            self._loader_thread.start()
+            self.logger.info("🔥 Cargando modelo de embeddings en segundo plano...")
+            return self._loader_thread
+
+    def _background_load(self):
+        try:
+            self.warm_up()
+        except Exception:
+            return  # El estado "failed" y el error ya quedaron registrados
+        
+        if self.pending_model:
+            self.start_model_migration(self.pending_model)
+
+    @property
+    def is_ready(self) -> bool:
+        """Modelo cargado y calentado"""
+        return self.state == STATE_READY
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """Bloquea hasta que el servicio esté listo (o falle); True si está listo"""
+        self._ready_event.wait(timeout)
+        return self.is_ready
+
+    def check_ready(self):
+        """
+        Garantiza un modelo utilizable
+
+        Sin carga en segundo plano se carga en el acto (comportamiento
+        clásico). Si el hilo de calentamiento sigue trabajando o la carga
+        falló, se lanza VectorServiceNotReady en lugar de bloquear.
+        """
+        if self.is_ready:
+            return
+        if self.state == STATE_COLD:
+            self.ensure_loaded()
+            return
+        if self.state == STATE_FAILED:
+            raise VectorServiceNotReady(f"Servicio vectorial no disponible: {self.load_error}")
+        raise VectorServiceNotReady("Modelo de embeddings cargándose")
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Embeddings con el modelo compartido"""
+        self.ensure_loaded()
+        return self.model.encode(texts)
+
+    def encode_in_background(self, texts: List[str]) -> np.ndarray:
+        """Codificación para hilos en segundo plano: espera al calentamiento si está en curso"""
+        if self.state == STATE_LOADING:
+            self.wait_until_ready()
+        self.check_ready()
+        return self.model.encode(texts)
+
+    def embedding_function(self) -> SharedEmbeddingFunction:
+        """Función de embeddings para colecciones consultadas por texto"""
+        return self._embedding_function
+
+    @staticmethod
+    def collection_name(namespace: str, name: str) -> str:
+        """Nombre físico de una colección con namespace"""
+        return f"{namespace}_{name}"
+
+    def get_collection(self, namespace: str, name: str,
+                       metadata: Optional[Dict[str, Any]] = None) -> GuardedCollection:
+        """Obtiene o crea una colección del namespace indicado"""
+        self.ensure_loaded()
+        return self._open_collection(self.collection_name(namespace, name), metadata)
+
+    def _open_collection(self, full_name: str,
+                         metadata: Optional[Dict[str, Any]] = None) -> GuardedCollection:
+        """Abre una colección lógica sobre la colección física que indica el registro"""
+        with self._lock:
+            if full_name in self._collections:
+                return self._collections[full_name]
+
+            dimension = self.model.get_sentence_embedding_dimension()
+            entry = self.registry.get(full_name)
+            if entry is None:
+                entry = CollectionEmbedding(full_name, full_name, self.model_name, dimension)
+                self.registry.register(entry)
+            elif entry.model != self.model_name or entry.dimension != dimension:
+                raise EmbeddingDimensionMismatch(
+                    f"{full_name} está indexada con {entry.model} ({entry.dimension} dims), "
+                    f"el modelo activo es {self.model_name} ({dimension} dims)"
+                )
+
+            collection = GuardedCollection(
+                self._open_physical(entry.physical_name, metadata), entry, metadata
+            )
+            if self._migration_encode is not None:
+                self._start_dual_write(collection)
+
+            self._collections[full_name] = collection
+            return collection
+
+    def _open_physical(self, physical_name: str, metadata: Optional[Dict[str, Any]] = None):
+        try:
+            return self.client.get_collection(
+                physical_name, embedding_function=self._embedding_function
+            )
+        except Exception:
+            return self.client.create_collection(
+                name=physical_name,
+                metadata=metadata or {"description": f"Vector embeddings for {physical_name}"},
+                embedding_function=self._embedding_function
+            )
+
+    def add_cutover_listener(self, listener: CutoverListener):
+        """
+        Registra a un consumidor con vectores propios fuera de ChromaDB
+        
+        `listener(encode_nuevo)` se llama tras el relleno (puede tardar) y
+        retorna la función que aplica el cambio dentro del corte.
+        """
+        self._cutover_listeners.append(listener)
+
+    def start_model_migration(self, model_name: str,
+                              batch_size: int = 256) -> Optional[threading.Thread]:
+        """
+        Migra todas las colecciones a otro modelo sin dejar de servir
+        
+        1. Carga el modelo nuevo en un hilo aparte
+        2. Escritura dual: cada escritura se replica en una colección
+           sombra ("{colección}__{modelo}") con vectores del modelo nuevo
+        3. Relleno de las sombras con los documentos existentes
+        4. Corte atómico: con la ingestión detenida se cambian modelo,
+           colecciones servidas y registro de una vez
+        
+        Las colecciones antiguas se conservan (registradas como retiradas).
+        """
+        with self._lock:
+            if model_name == self.model_name:
+                return None
+            if self._migration_thread is not None and self._migration_thread.is_alive():
+                return self._migration_thread
+
+            self.migration = {
+                'target_model': model_name,
+                'state': MIGRATION_LOADING,
+                'backfilled': 0,
+                'started_at': time.time(),
+                'error': None
+            }
+            self._migration_thread = threading.Thread(
+                target=self._run_model_migration, args=(model_name, batch_size),
+                name="embedding-migration", daemon=True
+            )
+            self._migration_thread.start()
+            self.logger.info(f"🔀 Migrando embeddings de {self.model_name} a {model_name}...")
+            return self._migration_thread
+
+    def _run_model_migration(self, model_name: str, batch_size: int):
+        try:
+            self.ensure_loaded()
+            new_model = SentenceTransformer(model_name)
+            dimension = new_model.get_sentence_embedding_dimension()
+
+            with self._lock:
+                self._migration_encode = new_model.encode
+                # También las colecciones registradas que nadie ha abierto aún
+                for entry in self.registry.collections():
+                    self._open_collection(entry.collection)
+                for collection in self._collections.values():
+                    self._start_dual_write(collection)
+                self.migration['state'] = MIGRATION_BACKFILLING
+
+            backfilled = set()
+            while True:
+                with self._lock:
+                    pending = [name for name in self._collections if name not in backfilled]
+                if not pending:
+                    break
+                for full_name in pending:
+                    self._backfill(self._collections[full_name], batch_size)
+                    backfilled.add(full_name)
+
+            prepared = [listener(new_model.encode) for listener in self._cutover_listeners]
+            self._cutover(model_name, new_model, dimension, prepared)
+
+        except Exception as e:
+            with self._lock:
+                self._migration_encode = None
+                for collection in self._collections.values():
+                    collection.abort_dual_write()
+                self.migration['state'] = MIGRATION_FAILED
+                self.migration['error'] = str(e)
+            self.logger.error(f"❌ Migración de embeddings a {model_name} fallida: {e}")
+
+    def _start_dual_write(self, collection: GuardedCollection):
+        # Misma configuración (p. ej. hnsw:space) que la colección original
+        shadow = self._open_physical(
+            physical_collection_name(collection.entry.collection, self.migration['target_model']),
+            collection.creation_metadata or getattr(collection.target, 'metadata', None)
+        )
+        collection.start_dual_write(shadow, self._migration_encode)
+
+    def _backfill(self, collection: GuardedCollection, batch_size: int):
+        """Copia a la sombra los documentos que la escritura dual aún no cubrió"""
+        source, shadow = collection.target, collection.shadow
+        present = set(shadow.get(include=[])['ids'])
+        source_ids = source.get(include=[])['ids']
+        missing = [doc_id for doc_id in source_ids if doc_id not in present]
+        
+        # Restos de un intento anterior interrumpido que ya no existen en origen
+        orphaned = list(present - set(source_ids))
+        if orphaned:
+            shadow.delete(ids=orphaned)
+
+        for start in range(0, len(missing), batch_size):
+            batch = source.get(ids=missing[start:start + batch_size],
+                               include=['documents', 'metadatas'])
+            # Lo escrito en dual mientras tanto es más reciente: no se pisa
+            written = set(shadow.get(ids=batch['ids'], include=[])['ids'])
+            keep = [i for i, doc_id in enumerate(batch['ids'])
+                    if doc_id not in written and batch['documents'][i] is not None]
+            if not keep:
+                continue
+
+            documents = [batch['documents'][i] for i in keep]
+            shadow.upsert(
+                ids=[batch['ids'][i] for i in keep],
+                embeddings=np.asarray(self._migration_encode(documents)).tolist(),
+                documents=documents,
+                metadatas=[batch['metadatas'][i] for i in keep]
+            )
+            with self._lock:
+                self.migration['backfilled'] += len(keep)
+
+    def _cutover(self, model_name: str, new_model, dimension: int,
+                 prepared: List[Callable[[], None]]):
+        """Cambia modelo y colecciones servidas de una vez"""
+        with self.ingestion.batch_lock, self._lock:
+            entries = []
+            retired = []
+            for full_name, collection in self._collections.items():
+                entry = CollectionEmbedding(
+                    full_name, physical_collection_name(full_name, model_name), model_name, dimension
+                )
+                retired.append(collection.entry.physical_name)
+                collection.cutover(entry)
+                entries.append(entry)
+
+            self.registry.cutover(model_name, entries, retired)
+            previous_model = self.model_name
+            self.model = new_model
+            self.model_name = model_name
+            self.pending_model = None
+            self._migration_encode = None
+
+            for apply_change in prepared:
+                apply_change()
+
+            self.migration['state'] = MIGRATION_COMPLETED
+            self.migration['completed_at'] = time.time()
+
+        self.logger.info(
+            f"✅ Embeddings migrados de {previous_model} a {model_name} "
+            f"({len(entries)} colecciones, {self.migration['backfilled']} documentos re-codificados)"
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estado del servicio compartido"""
+        return {
+            'path': str(self.path),
+            'model': self.model_name,
+            'pending_model': self.pending_model,
+            'state': self.state,
+            'loaded': self.loaded,
+            'load_seconds': self.load_seconds,
+            'load_error': self.load_error,
+            'collections': sorted(self._collections),
+            'embedding_registry': self.registry.to_dict(),
+            'migration': self.migration,
+            'ingestion': self.ingestion.get_stats()
+        }
+
+
+_services: Dict[str, VectorService] = {}
+_services_lock = threading.Lock()
+
+
+def get_vector_service(path: str = DEFAULT_VECTOR_DB_PATH,
+                       model_name: Optional[str] = None) -> VectorService:
+    """
+    Instancia compartida del servicio vectorial para una ruta de almacenamiento
+    Sin `model_name` se usa VECTOR_EMBEDDING_MODEL o el modelo por defecto
+    """
+    key = str(Path(path).resolve())
+
+    with _services_lock:
+        service = _services.get(key)
+        if service is None:
+            service = VectorService(path, model_name)
+            _services[key] = service
+        return service
+
+
+def migrate_rag_store(service: VectorService, legacy_path: str = LEGACY_RAG_PATH,
+                      namespace: str = "rag", batch_size: int = 256) -> Dict[str, int]:
+    """
+    Fusiona el almacén antiguo de EnhancedRAGSystem en el servicio compartido
+
+    Copia documentos y metadata de cada colección a "{namespace}_{nombre}"
+    recalculando los embeddings con el modelo compartido. El almacén
+    antiguo no se borra; se marca como migrado para no repetir la copia.
+    """
+    legacy_dir = Path(legacy_path)
+    marker = legacy_dir / MIGRATION_MARKER
+
+    if not legacy_dir.exists() or marker.exists():
+        return {}
+
+    service.ensure_loaded()
+    legacy_client = chromadb.PersistentClient(
+        path=str(legacy_dir),
+        settings=Settings(anonymized_telemetry=False)
+    )
+
+    migrated: Dict[str, int] = {}
+    for legacy_collection in legacy_client.list_collections():
+        # Según la versión de chromadb se reciben objetos o nombres
+        name = getattr(legacy_collection, 'name', legacy_collection)
+        source = legacy_client.get_collection(name)
+        target = service.get_collection(
+            namespace, name, metadata={"hnsw:space": "cosine", "hnsw:M": 16}
+        )
+
+        copied = 0
+        offset = 0
+        while True:
+            batch = source.get(
+                include=['documents', 'metadatas'],
+                limit=batch_size,
+                offset=offset
+            )
+            if not batch['ids']:
+                break
+
+            target.upsert(
+                ids=batch['ids'],
+                documents=batch['documents'],
+                metadatas=batch['metadatas'],
+                embeddings=service.encode(batch['documents']).tolist()
+            )
+            copied += len(batch['ids'])
+            offset += batch_size
+
+        migrated[name] = copied
+
+    marker.write_text("migrated\n", encoding="utf-8")
+    service.logger.info(
+        f"📦 Almacén RAG migrado al servicio compartido: {sum(migrated.values())} documentos"
+    )
+    return migrated